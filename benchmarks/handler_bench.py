@@ -0,0 +1,319 @@
+# benchmarks/handler_bench.py
+"""
+Load test for the real update handlers against a fake Telegram and a seeded Mongo.
+
+Run from the repository root: python -m benchmarks.handler_bench
+Updates are built as Telegram would send them and pushed through an
+Application wired by bot.register_handlers, so handler matching, timing
+decorators, the user context and the Database facade are all exercised.
+The bot is an ExtBot whose _do_post answers locally and records every
+call. Mongo is mongomock unless --mongo-uri points at a real (disposable)
+server; mongomock gets the $bit operator from benchmarks.mongomock_bits so
+seen-bit flushes run there too, and it is not thread-safe, so DB calls
+are serialised on one worker. Only a real server gives representative
+DB timings. Deferred writes are flushed at the end, and any error they
+log fails the run like a handler error does.
+
+Results can be saved with --save-baseline and are compared against
+benchmarks/baseline.json otherwise; a scenario regresses when throughput
+drops or p99 latency or DB operations per update grow beyond --tolerance.
+The baseline stores the run parameters (backend, -n, -u, -c, -v,
+--concurrency) and is only compared against a run with the same ones.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:bench")
+os.environ.setdefault("ADMIN_IDS", "1")
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder, ExtBot
+
+from bot import register_handlers
+from config import Config
+from db.database import MONGO_LATENCY, Database
+from db.indexes import ensure_indexes
+from services.category_registry import category_registry
+
+BASELINE = Path(__file__).with_name("baseline.json")
+ADMIN_ID = Config.ADMIN_IDS[0]
+FIRST_USER_ID = 1_000_000
+
+
+# --- Telegram stand-in ---
+class FakeBot(ExtBot):
+    """ExtBot that never leaves the process; every API call is recorded."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        with self._unfrozen():
+            self._message_ids = itertools.count(1)
+            self.calls = []
+
+    async def _do_post(self, endpoint, data, **kwargs):
+        self.calls.append(endpoint)
+        if endpoint == "getMe":
+            return {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if endpoint.startswith(("send", "edit", "copy", "forward")):
+            return {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": int(data.get("chat_id") or 1), "type": "private"},
+                "text": "ok",
+            }
+        return True
+
+
+# --- Synthetic updates ---
+_update_ids = itertools.count(1)
+
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+
+def command_update(bot, user_id, text):
+    command = text.split()[0]
+    return Update.de_json({
+        "update_id": next(_update_ids),
+        "message": {
+            "message_id": next(_update_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": _user(user_id),
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+        },
+    }, bot)
+
+
+def callback_update(bot, user_id, data):
+    # Callbacks come from the keyboard under a video message
+    return Update.de_json({
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "video": {"file_id": "v", "file_unique_id": "v", "width": 1,
+                          "height": 1, "duration": 1},
+            },
+        },
+    }, bot)
+
+
+SCENARIOS = {
+    "start": lambda bot, user_id, i: command_update(bot, user_id, "/start"),
+    "navigation": lambda bot, user_id, i: callback_update(bot, user_id, "next_"),
+    "show_categories": lambda bot, user_id, i: callback_update(bot, user_id, "show_categories"),
+    "add_category": lambda bot, user_id, i: command_update(
+        bot, ADMIN_ID, f"/addcategory bench_{i}_{random.getrandbits(32):x} -100{i}"
+    ),
+}
+
+
+# --- Mongo stand-in ---
+def connect(uri):
+    if uri:
+        from pymongo import MongoClient
+        db = MongoClient(uri)["handler_bench"]
+        db.client.drop_database(db.name)
+        return db
+    import mongomock
+    from benchmarks import mongomock_bits
+    mongomock_bits.install()
+    return mongomock.MongoClient()["handler_bench"]
+
+
+def seed(db, users, categories, videos):
+    names = [Config.DEFAULT_CATEGORY] + [f"category_{i}" for i in range(1, categories)]
+    db.categories.insert_many([
+        {"name": name, "channel_id": f"-100{i}", "video_count": videos}
+        for i, name in enumerate(names)
+    ])
+    db.meta.insert_one({"_id": "categories", "version": 1})
+    for name in names:
+        db.videos.insert_many([
+            {"category": name, "idx": idx, "file_id": f"{name}-{idx}",
+             "file_unique_id": f"{name}-{idx}", "rand": random.random()}
+            for idx in range(videos)
+        ])
+    expiry = int(time.time()) + 30 * 86400
+    db.users.insert_many([
+        {"user_id": FIRST_USER_ID + i, "tokens": 10 ** 9, "token_expiry": expiry,
+         "subscription": False, "cursor": 0, "current_category": random.choice(names),
+         "viewed_videos": []}
+        for i in range(users)
+    ])
+
+
+# --- Measurement ---
+class ErrorLog(logging.Handler):
+    """Collects ERROR records: failed write-behind and view flushes are logged, not raised."""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def db_operations():
+    return sum(child.count for child in MONGO_LATENCY._children.values())
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def run_scenario(application, name, updates, users, concurrency):
+    bot = application.bot
+    make_update = SCENARIOS[name]
+    latencies = []
+    user_ids = [FIRST_USER_ID + i for i in range(users)]
+    counter = itertools.count()
+
+    async def worker(worker_id):
+        # Each worker owns a slice of users, so one user's updates stay in order
+        own = user_ids[worker_id::concurrency] or user_ids
+        while (i := next(counter)) < updates:
+            update = make_update(bot, own[i % len(own)], i)
+            started = time.perf_counter()
+            await application.process_update(update)
+            latencies.append(time.perf_counter() - started)
+
+    ops_before, calls_before = db_operations(), len(bot.calls)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "updates_per_second": round(updates / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "db_ops_per_update": round((db_operations() - ops_before) / updates, 3),
+        "api_calls_per_update": round((len(bot.calls) - calls_before) / updates, 3),
+    }
+
+
+def run_params(args):
+    """What a baseline depends on; results from other parameters are not comparable."""
+    return {
+        "backend": "mongo" if args.mongo_uri else "mongomock",
+        "updates": args.updates, "users": args.users, "categories": args.categories,
+        "videos": args.videos, "concurrency": args.concurrency,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Regressions against the baseline, as printable strings."""
+    problems = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result["updates_per_second"] < base["updates_per_second"] * (1 - tolerance):
+            problems.append(f"{name}: throughput {result['updates_per_second']}/s "
+                            f"< baseline {base['updates_per_second']}/s")
+        if result["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            problems.append(f"{name}: p99 {result['p99_ms']}ms > baseline {base['p99_ms']}ms")
+        if result["db_ops_per_update"] > base["db_ops_per_update"] + 0.01:
+            problems.append(f"{name}: {result['db_ops_per_update']} DB ops/update "
+                            f"> baseline {base['db_ops_per_update']}")
+    return problems
+
+
+async def run(args):
+    # Keep view and navigation flushes out of the timed loop; flushed at close
+    Config.VIEW_FLUSH_DELAY = Config.WRITE_BEHIND_DELAY = 3600
+    db = connect(args.mongo_uri)
+    ensure_indexes(db)
+    seed(db, args.users, args.categories, args.videos)
+    # mongomock is not thread-safe (it edits projections in place), so one worker
+    Database.bind(db, max_workers=None if args.mongo_uri else 1)
+    await category_registry.reload()
+
+    application = ApplicationBuilder().bot(FakeBot(Config.BOT_TOKEN)).updater(None).build()
+    register_handlers(application)
+    errors = []
+    logged = ErrorLog()
+    logging.getLogger().addHandler(logged)
+
+    async def on_error(update, context):
+        errors.append(context.error)
+    application.add_error_handler(on_error)
+    await application.initialize()
+
+    results = {}
+    for name in args.scenarios:
+        results[name] = await run_scenario(
+            application, name, args.updates, args.users, args.concurrency
+        )
+    await application.shutdown()
+    try:
+        await Database.close()
+    except Exception as e:
+        errors.append(e)
+    logging.getLogger().removeHandler(logged)
+
+    print(f"backend: {'mongo' if args.mongo_uri else 'mongomock'}, users {args.users}, "
+          f"categories {args.categories}, videos/category {args.videos}, "
+          f"concurrency {args.concurrency}, updates/scenario {args.updates}")
+    print(f"{'scenario':<16} {'upd/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'db ops':>7} {'api':>5}")
+    for name, r in results.items():
+        print(f"{name:<16} {r['updates_per_second']:>9} {r['p50_ms']:>9} {r['p99_ms']:>9} "
+              f"{r['db_ops_per_update']:>7} {r['api_calls_per_update']:>5}")
+    if errors:
+        print(f"{len(errors)} handler errors, first: {errors[0]!r}")
+    if logged.records:
+        print(f"{len(logged.records)} errors logged, first: {logged.records[0].getMessage()}")
+    if errors or logged.records:
+        return 1
+
+    params = run_params(args)
+    if args.save_baseline:
+        BASELINE.write_text(json.dumps({"params": params, "scenarios": results}, indent=2) + "\n")
+        print(f"baseline saved to {BASELINE}")
+        return 0
+    if not BASELINE.exists():
+        return 0
+    baseline = json.loads(BASELINE.read_text())
+    if baseline.get("params") != params:
+        print(f"not compared: baseline was recorded with {baseline.get('params')}, this run used {params}")
+        return 0
+    problems = compare(results, baseline["scenarios"], args.tolerance)
+    for problem in problems:
+        print(f"REGRESSION {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--updates", type=int, default=500, help="updates per scenario")
+    parser.add_argument("-u", "--users", type=int, default=200)
+    parser.add_argument("-c", "--categories", type=int, default=5)
+    parser.add_argument("-v", "--videos", type=int, default=200, help="videos per category")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--mongo-uri")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--save-baseline", action="store_true")
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(asyncio.run(run(parser.parse_args())))
@@ -0,0 +1,74 @@
+# benchmarks/ingest_bench.py
+"""
+Throughput benchmark for channel video ingestion (buffer, dedupe, bulk upsert).
+
+Run from the repository root: python -m benchmarks.ingest_bench
+Pass --mongo-uri to measure against a real server; otherwise mongomock is
+used, which shows the Python-side cost but not Mongo's.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from db.database import Database
+from db.indexes import ensure_indexes
+from services.ingest import VideoIngester
+
+
+def connect(uri):
+    if uri:
+        from pymongo import MongoClient
+        db = MongoClient(uri)["ingest_bench"]
+        db.client.drop_database(db.name)
+        return db
+    import mongomock
+    return mongomock.MongoClient()["ingest_bench"]
+
+
+def fake_videos(count, duplicates, channel_id=-100123):
+    unique = max(1, int(count * (1 - duplicates)))
+    for message_id in range(count):
+        key = random.randrange(unique) if message_id >= unique else message_id
+        yield {
+            "file_unique_id": f"AgAD{key:08d}",
+            "file_id": f"BAACAgQAAxkBAAI{key:012d}",
+            "channel_id": channel_id,
+            "message_id": message_id,
+        }
+
+
+async def run(count, batch_size, duplicates, uri):
+    db = connect(uri)
+    ensure_indexes(db)
+    Database.bind(db)
+    # Ingestion only reserves idx slots in a category that already exists
+    await Database.add_category("bench", -100123)
+    ingester = VideoIngester(batch_size=batch_size, flush_delay=60)
+
+    started = time.perf_counter()
+    for video in fake_videos(count, duplicates):
+        ingester.add("bench", video)
+        if len(ingester) >= batch_size:
+            await ingester.flush()
+    await ingester.flush()
+    elapsed = time.perf_counter() - started
+
+    stored = db.videos.count_documents({"category": "bench"})
+    size = db.categories.find_one({"name": "bench"})["video_count"]
+    print(f"backend:        {'mongo' if uri else 'mongomock'}")
+    print(f"messages:       {count} ({duplicates:.0%} duplicates), batch {batch_size}")
+    print(f"stored videos:  {stored} (idx slots reserved: {size})")
+    print(f"elapsed:        {elapsed:.3f}s ({count / elapsed:,.0f} messages/s)")
+    await Database.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--count", type=int, default=2_000)
+    parser.add_argument("-b", "--batch-size", type=int, default=100)
+    parser.add_argument("-d", "--duplicates", type=float, default=0.1)
+    parser.add_argument("--mongo-uri")
+    args = parser.parse_args()
+    asyncio.run(run(args.count, args.batch_size, args.duplicates, args.mongo_uri))
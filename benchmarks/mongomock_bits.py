@@ -0,0 +1,29 @@
+# benchmarks/mongomock_bits.py
+"""
+The $bit update operator for mongomock, which lacks it.
+
+Seen-sets are written with {"$bit": {"w.<word>": {"or": mask}}} upserts.
+Benchmarks that run on mongomock call install() so those writes go
+through the same db.models code as on a real server, instead of failing
+or being skipped; a missing word starts from 0, as it does in Mongo.
+"""
+
+import mongomock.collection
+
+_OPERATIONS = {
+    "and": lambda current, mask: current & mask,
+    "or": lambda current, mask: current | mask,
+    "xor": lambda current, mask: current ^ mask,
+}
+
+
+def _bit_updater(doc, field_name, value):
+    if isinstance(doc, dict):
+        current = doc.get(field_name, 0)
+        for operation, mask in value.items():
+            current = _OPERATIONS[operation](current, mask)
+        doc[field_name] = current
+
+
+def install():
+    mongomock.collection._updaters.setdefault("$bit", _bit_updater)
@@ -0,0 +1,274 @@
+# benchmarks/storage_bench.py
+"""
+Conformance and latency check for the storage backends.
+
+Run from the repository root: python -m benchmarks.storage_bench
+The same scripted sequence of operations (categories, ingestion, keyset
+pages, users, seen-sets, view accounting, compaction, broadcasts) runs
+against every backend, and the normalised results must be identical.
+Then each hot operation is timed in a loop and p50/p99 are compared.
+
+Mongo is mongomock unless --mongo-uri points at a real (disposable)
+server. mongomock gets the $bit operator from benchmarks.mongomock_bits,
+so seen-set writes are compared there too, but its timings show only
+Python overhead; use a real server for a fair latency comparison.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("ADMIN_IDS", "1")
+
+from db.backend import MongoBackend
+from db.indexes import ensure_indexes
+from db.sqlite_backend import SQLiteBackend
+from utils import quota
+
+
+def connect_mongo(uri):
+    if uri:
+        from pymongo import MongoClient
+        db = MongoClient(uri)["storage_bench"]
+        db.client.drop_database(db.name)
+    else:
+        import mongomock
+        from benchmarks import mongomock_bits
+        mongomock_bits.install()
+        db = mongomock.MongoClient()["storage_bench"]
+    ensure_indexes(db)
+    return MongoBackend(db)
+
+
+def connect_sqlite(directory):
+    return SQLiteBackend(os.path.join(directory, f"bench-{random.getrandbits(32):x}.sqlite3"))
+
+
+# --- Conformance ---
+def _user(doc):
+    # Only the fields the bot reads; Mongo adds an _id the other store lacks
+    if doc is None:
+        return None
+    return {key: value for key, value in doc.items() if key != "_id"}
+
+
+def _categories(categories):
+    return sorted(
+        (c["name"], str(c.get("channel_id")), c.get("video_count", 0)) for c in categories
+    )
+
+
+def _broadcast(doc):
+    if doc is None:
+        return None
+    return {key: doc.get(key) for key in
+            ("text", "created_by", "status", "last_user_id", "sent", "failed", "blocked")}
+
+
+def _idx(videos):
+    return [video["idx"] for video in videos]
+
+
+def scenario(backend):
+    """Yield (step, normalised result) for one fresh backend."""
+    version = backend.get_categories_version()
+    backend.add_category("alpha", "-1001")
+    backend.add_category("beta", "@beta_channel")
+    yield "version_bumped", backend.get_categories_version() - version
+    try:
+        backend.add_category("alpha", "-1002")
+        yield "add_existing", "added"
+    except ValueError:
+        yield "add_existing", "ValueError"
+
+    videos = [
+        {"file_unique_id": f"u{i % 17}", "file_id": f"f{i % 17}", "channel_id": -1001, "message_id": i}
+        for i in range(20)
+    ]
+    yield "ingest", backend.ingest_videos("alpha", videos)
+    yield "ingest_again", backend.ingest_videos("alpha", videos[:5])
+    backend.add_video("single", "beta", "beta-file")
+    try:
+        backend.ingest_videos("missing", videos[:1])
+        yield "ingest_unknown", "inserted"
+    except LookupError:
+        yield "ingest_unknown", "LookupError"
+    yield "categories", _categories(backend.load_categories()[1])
+    yield "category_size", (backend.get_category_size("alpha"), backend.get_category_size("missing"))
+    yield "page_forward", _idx(backend.get_videos("alpha", 5, 3, 1))
+    yield "page_backward", _idx(backend.get_videos("alpha", 5, 3, -1))
+    yield "page_past_end", _idx(backend.get_videos("alpha", 16, 5, 1))
+    yield "by_idx", sorted(_idx(backend.get_videos_by_idx("alpha", [1, 3, 99])))
+    yield "video_fields", sorted(backend.get_videos("alpha", 0, 1, 1)[0])
+
+    expiry = quota.now() + 3600
+    yield "create_user", _user(backend.find_and_update_user(1, {
+        "$set": {"user_id": 1, "token_expiry": expiry, "current_category": "alpha"},
+        "$inc": {"tokens": 5},
+    }))
+    yield "push_user", _user(backend.find_and_update_user(1, {
+        "$push": {"viewed_videos": {"$each": ["a", "b", "c"], "$slice": -2}},
+        "$max": {"tokens": 7},
+    }))
+    backend.set_user_fields({1: {"cursor": 3}, 2: {"cursor": 1, "tokens": 0}})
+    yield "deferred_fields", (_user(backend.get_user(1)), _user(backend.get_user(2)))
+    yield "missing_user", backend.get_user(404)
+
+    backend.mark_seen(1, "alpha", range(16))
+    yield "mark_seen", len(backend.get_seen_set(1, "alpha"))
+    yield "unseen_after_seen", backend.get_unseen_video(1, "alpha")["idx"]
+    backend.write_views({1: {"tokens": 2, "views": 2, "viewed": ["f16", "f15"],
+                             "seen": {"alpha": {16}}}}, 3)
+    yield "write_views", _user(backend.get_user(1))
+    yield "seen_after_views", sorted(backend.get_seen_set(1, "alpha").unseen(18))
+    yield "unseen_after_views", backend.get_unseen_video(1, "alpha")
+
+    yield "ids_first", backend.get_user_ids_after(None, 1)
+    yield "ids_after", backend.get_user_ids_after(1, 10)
+    backend.set_user_fields({3: {
+        "user_id": 3, "tokens": 4, "token_expiry": "2020-01-01T00:00:00",
+        "limits": {"day": 1, "views": 3},
+    }})
+    yield "compact", backend.compact_users(None, 10)
+    yield "compacted_user", _user(backend.get_user(3))
+
+    broadcast = backend.create_broadcast(1, text="hello")
+    yield "broadcast_created", _broadcast(broadcast)
+    backend.checkpoint_broadcast(broadcast["_id"], 2, sent=2, blocked=1)
+    yield "broadcast_running", [_broadcast(b) for b in backend.get_running_broadcasts()]
+    yield "broadcast_finished", _broadcast(backend.finish_broadcast(broadcast["_id"]))
+    yield "broadcast_none_running", backend.get_running_broadcasts()
+
+    backend.remove_users([2])
+    yield "removed_user", (backend.get_user(2), backend.get_user_ids_after(None, 10))
+    backend.remove_category("beta")
+    yield "after_remove", _categories(backend.get_categories())
+
+
+def run_scenario(backend):
+    results = {}
+    steps = scenario(backend)
+    while True:
+        try:
+            step, value = next(steps)
+        except StopIteration:
+            return results
+        except Exception as e:
+            # A failing step ends the generator; record it and stop there
+            results["error"] = repr(e)
+            return results
+        results[step] = value
+
+
+# Seen-set steps also have a known answer, so backends agreeing on a
+# wrong bitmap still fail: alpha holds idx 0..16, 0..15 marked seen, then
+# 16 seen through write_views
+EXPECTED = {"mark_seen": 16, "unseen_after_seen": 16, "seen_after_views": [17], "unseen_after_views": None}
+
+
+def check_conformance(backends):
+    results = {name: run_scenario(backend) for name, backend in backends.items()}
+    reference_name, reference = next(iter(results.items()))
+    problems = []
+    for name, result in results.items():
+        for step, expected in EXPECTED.items():
+            if result.get(step, "missing") != expected:
+                problems.append(f"{step}: expected {expected!r} {name}={result.get(step, 'missing')!r}")
+        for step in reference.keys() | result.keys():
+            expected, actual = reference.get(step), result.get(step)
+            if expected == actual:
+                continue
+            problems.append(f"{step}: {reference_name}={expected!r} {name}={actual!r}")
+    return results, problems
+
+
+# --- Latency ---
+def seed(backend, users, videos):
+    backend.add_category("bench", "-100")
+    backend.ingest_videos("bench", [
+        {"file_unique_id": f"b{i}", "file_id": f"file{i}", "channel_id": -100, "message_id": i}
+        for i in range(videos)
+    ])
+    backend.set_user_fields({
+        user_id: {"user_id": user_id, "tokens": 10 ** 6, "token_expiry": quota.now() + 86400,
+                  "current_category": "bench", "cursor": 0, "viewed_videos": []}
+        for user_id in range(1, users + 1)
+    })
+
+
+def operations(backend, users, videos):
+    user = lambda: random.randint(1, users)
+    idx = lambda: random.randrange(videos)
+    ops = {
+        "get_user": lambda: backend.get_user(user()),
+        "find_and_update_user": lambda: backend.find_and_update_user(user(), {"$set": {"shuffle": False}}),
+        "set_user_fields": lambda: backend.set_user_fields({user(): {"cursor": idx()} for _ in range(20)}),
+        "get_videos": lambda: backend.get_videos("bench", idx(), 10, 1),
+        "get_videos_by_idx": lambda: backend.get_videos_by_idx("bench", [idx() for _ in range(10)]),
+        "get_unseen_video": lambda: backend.get_unseen_video(user(), "bench"),
+        "get_category_size": lambda: backend.get_category_size("bench"),
+        "mark_seen": lambda: backend.mark_seen(user(), "bench", [idx()]),
+        "write_views": lambda: backend.write_views({
+            user(): {"tokens": 1, "views": 1, "viewed": [f"file{idx()}"],
+                     "seen": {"bench": {idx()}}}
+            for _ in range(20)
+        }),
+    }
+    return ops
+
+
+def measure(op, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        op()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2], timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--iterations", type=int, default=500, help="timed calls per operation")
+    parser.add_argument("-u", "--users", type=int, default=1000)
+    parser.add_argument("-v", "--videos", type=int, default=2000)
+    parser.add_argument("--mongo-uri")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        mongo_name = "mongo" if args.mongo_uri else "mongomock"
+
+        backends = {mongo_name: connect_mongo(args.mongo_uri), "sqlite": connect_sqlite(directory)}
+        results, problems = check_conformance(backends)
+        for backend in backends.values():
+            backend.close()
+        steps = len(next(iter(results.values())))
+        print(f"conformance: {'OK' if not problems else f'{len(problems)} differences'} over {steps} steps")
+        for problem in problems:
+            print(f"  MISMATCH {problem}")
+
+        backends = {mongo_name: connect_mongo(args.mongo_uri), "sqlite": connect_sqlite(directory)}
+        latency = {}
+        for name, backend in backends.items():
+            seed(backend, args.users, args.videos)
+            for op_name, op in operations(backend, args.users, args.videos).items():
+                latency.setdefault(op_name, {})[name] = measure(op, args.iterations)
+            backend.close()
+
+    names = list(backends)
+    print(f"\nlatency over {args.iterations} calls, {args.users} users, {args.videos} videos (µs)")
+    print(f"{'operation':<22}" + "".join(f"{name + ' p50':>16}{name + ' p99':>16}" for name in names))
+    for op_name, by_backend in latency.items():
+        cells = []
+        for name in names:
+            p50, p99 = by_backend.get(name, (None, None))
+            cells += ["-" if p50 is None else f"{p50 * 1e6:.1f}", "-" if p99 is None else f"{p99 * 1e6:.1f}"]
+        print(f"{op_name:<22}" + "".join(f"{cell:>16}" for cell in cells))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
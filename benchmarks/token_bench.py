@@ -0,0 +1,39 @@
+# benchmarks/token_bench.py
+"""
+Micro-benchmark for signed access token verification.
+
+Run from the repository root: python -m benchmarks.token_bench
+"""
+
+import argparse
+import os
+import time
+
+from helper import parse_token_keys, sign_access_token, verify_access_token
+
+
+def run(count):
+    keys = parse_token_keys(f"2:{os.urandom(32).hex()},1:{os.urandom(32).hex()}")
+    expiry = int(time.time()) + 86400
+    tokens = [sign_access_token(1_000_000 + i, expiry, 2 if i % 2 else 1, keys) for i in range(count)]
+    forged = [token[:-2] + ("AA" if not token.endswith("AA") else "BB") for token in tokens]
+
+    started = time.perf_counter()
+    valid = sum(verify_access_token(token, keys) is not None for token in tokens)
+    elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    rejected = sum(verify_access_token(token, keys) is None for token in forged)
+    forged_elapsed = time.perf_counter() - started
+
+    print(f"token length:   {len(tokens[0])} chars")
+    print(f"valid tokens:   {valid}/{count} in {elapsed:.3f}s "
+          f"({count / elapsed:,.0f} verifications/s)")
+    print(f"forged tokens:  {rejected}/{count} rejected in {forged_elapsed:.3f}s "
+          f"({count / forged_elapsed:,.0f} verifications/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--count", type=int, default=200_000)
+    run(parser.parse_args().count)
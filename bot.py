@@ -1,12 +1,34 @@
 import logging
 import asyncio
+import signal
+from telegram import Update
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
     CallbackQueryHandler,
+    MessageHandler,
+    filters,
 )
-from config import TELEGRAM_BOT_TOKEN, MONGODB_URI
-from pymongo import MongoClient
+from config import Config
+from db.connection import MongoConnection
+from db.database import Database
+from db.backend import MongoBackend
+from db.sqlite_backend import SQLiteBackend
+from services.url_shortener import shortener
+from services.webhook import build_http_server
+from services.telegram_api import InstrumentedBot
+from services.update_processor import PerUserUpdateProcessor, UpdateQueue
+from services.admission import AdmissionControl
+from services.send_scheduler import SendScheduler
+from services.broadcast import broadcasts
+from services.ingest import ingester
+from services.category_registry import category_registry
+from services.quota_compactor import quota_compactor
+from services.prefetch import next_videos
+from utils.metrics import timed
+from db.models import ensure_random_keys, backfill_video_indexes, migrate_history
+from db.indexes import ensure_indexes, verify_indexes, explain_hot_queries
 
 # --- Import your handlers ---
 from handlers.user import (
@@ -15,77 +37,165 @@ from handlers.user import (
     navigation_callback,
     category_callback,
     show_categories_callback,
+    noop_callback,
+    shuffle_command,
 )
 from handlers.admin import (
     add_category_command,
     remove_category_command,
+    backfill_command,
+    broadcast_command,
     admin_callback,
 )
-
-# --- Health Check Server ---
-async def health_server():
-    async def handle(_reader, _writer):
-        _writer.close()
-        await _writer.wait_closed()
-    server = await asyncio.start_server(handle, '0.0.0.0', 8000)
-    async with server:
-        await server.serve_forever()
+from handlers.channel import channel_post_handler
 
 # --- DB Initialization ---
 async def init_db(application):
+    if Config.STORAGE_BACKEND == "sqlite":
+        # Schema and indexes are created by the backend itself
+        backend = SQLiteBackend(Config.SQLITE_PATH)
+        Database.bind(backend)
+        await category_registry.start(backend)
+        logging.info(f"✅ SQLite store opened at {Config.SQLITE_PATH}")
+        return
     try:
-        client = MongoClient(MONGODB_URI)
-        db_name = client.get_database().name
-        if not db_name or db_name == 'test':
-            db = client['telegram_video_bot']
-        else:
-            db = client.get_database()
+        db = MongoConnection.connect()
         application.bot_data['db_client'] = db
+        ensure_random_keys(db)
+        backfill_video_indexes(db)
+        migrate_history(db)
+        ensure_indexes(db)
+        for problem in verify_indexes(db):
+            logging.warning(f"⚠️ {problem}")
+        if Config.DB_EXPLAIN:
+            explain_hot_queries(db)
+        backend = MongoBackend(db)
+        Database.bind(backend)
+        await category_registry.start(backend)
         logging.info(f"✅ MongoDB connected to database: {db.name}")
     except Exception as e:
         logging.error(f"❌ MongoDB connection error: {e}")
         raise
 
-# --- Main Bot Runner ---
-async def run_bot():
-    # Start health check server
-    health_task = asyncio.create_task(health_server())
+# --- Handler Registration Helpers (latency is recorded per handler) ---
+def command(name, callback):
+    return CommandHandler(name, timed(callback.__name__, f"/{name}")(callback))
 
-    # Initialize bot
-    application = (
-        ApplicationBuilder()
-        .token(TELEGRAM_BOT_TOKEN)
-        .build()
-    )
+def callback_query(callback, pattern):
+    return CallbackQueryHandler(timed(callback.__name__, pattern)(callback), pattern=pattern)
 
-    # --- Initialize DB before adding handlers ---
-    await init_db(application)
+def message(callback, message_filter, label):
+    return MessageHandler(message_filter, timed(callback.__name__, label)(callback))
 
+# --- Handler Registration (shared with benchmarks/handler_bench.py) ---
+def register_handlers(application):
     # --- Register User Commands ---
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("getvideo", get_video_command))
+    application.add_handler(command("start", start_command))
+    application.add_handler(command("getvideo", get_video_command))
+    application.add_handler(command("shuffle", shuffle_command))
 
     # --- Register Admin Commands ---
-    application.add_handler(CommandHandler("addcategory", add_category_command))
-    application.add_handler(CommandHandler("removecategory", remove_category_command))
+    application.add_handler(command("addcategory", add_category_command))
+    application.add_handler(command("removecategory", remove_category_command))
+    application.add_handler(command("broadcast", broadcast_command))
+    application.add_handler(command("backfill", backfill_command))
 
     # --- Register Callback Handlers ---
-    application.add_handler(CallbackQueryHandler(navigation_callback, pattern="^(prev_|next_).*"))
-    application.add_handler(CallbackQueryHandler(category_callback, pattern="^category_"))
-    application.add_handler(CallbackQueryHandler(show_categories_callback, pattern="^show_categories$"))
-    application.add_handler(CallbackQueryHandler(admin_callback, pattern="^admin_"))
+    application.add_handler(callback_query(navigation_callback, "^(prev_|next_|cur_).*"))
+    application.add_handler(callback_query(category_callback, "^category_"))
+    application.add_handler(callback_query(show_categories_callback, r"^show_categories(_\d+)?$"))
+    application.add_handler(callback_query(noop_callback, "^none$"))
+    application.add_handler(callback_query(admin_callback, "^admin_"))
+
+    # --- Register Channel Ingestion ---
+    application.add_handler(message(
+        channel_post_handler,
+        filters.UpdateType.CHANNEL_POST & (filters.VIDEO | filters.Document.VIDEO),
+        "channel_video",
+    ))
+
+# --- Main Bot Runner ---
+async def run_bot():
+    # Initialize bot; a bounded queue gives the webhook backpressure and
+    # makes polling wait instead of buffering without limit. Updates run
+    # concurrently across users but in order per user, after admission
+    # control has shed floods and duplicate taps.
+    builder = (
+        ApplicationBuilder()
+        .bot(InstrumentedBot(
+            Config.BOT_TOKEN,
+            request=HTTPXRequest(connection_pool_size=Config.TELEGRAM_POOL_SIZE),
+            get_updates_request=HTTPXRequest(),
+            rate_limiter=SendScheduler(
+                global_rate=Config.SEND_GLOBAL_RATE,
+                global_burst=Config.SEND_GLOBAL_BURST,
+                chat_rate=Config.SEND_CHAT_RATE,
+                chat_burst=Config.SEND_CHAT_BURST,
+                group_rate=Config.SEND_GROUP_RATE,
+                group_burst=Config.SEND_GROUP_BURST,
+                max_retries=Config.SEND_MAX_RETRIES,
+            ),
+        ))
+        .update_queue(UpdateQueue(Config.UPDATE_QUEUE_SIZE, max_taken=Config.UPDATE_MAX_PENDING))
+        .concurrent_updates(PerUserUpdateProcessor(
+            Config.CONCURRENT_UPDATES, max_pending=Config.UPDATE_MAX_PENDING,
+            max_per_user=Config.UPDATE_USER_PENDING, lock_shards=Config.UPDATE_LOCK_SHARDS,
+            admission=AdmissionControl(
+                user_rate=Config.ADMISSION_USER_RATE,
+                user_burst=Config.ADMISSION_USER_BURST,
+                max_in_flight=Config.ADMISSION_MAX_IN_FLIGHT,
+                exempt=Config.ADMIN_IDS,
+            ),
+        ))
+    )
+    if Config.WEBHOOK_URL:
+        builder = builder.updater(None)
+    application = builder.build()
+
+    # Webhook, health checks and metrics share one port
+    http_server, endpoints = build_http_server(application)
+    await http_server.start(port=Config.PORT)
+
+    # --- Initialize DB before adding handlers ---
+    await init_db(application)
+
+    register_handlers(application)
 
     try:
         await application.initialize()
         await application.start()
-        await application.updater.start_polling()
+        if Config.WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=Config.WEBHOOK_URL.rstrip("/") + Config.WEBHOOK_PATH,
+                secret_token=Config.WEBHOOK_SECRET,
+                max_connections=Config.WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        else:
+            await application.updater.start_polling()
+        await broadcasts.resume(application.bot)
+        quota_compactor.start()
+        endpoints.ready = True
         while True:
             await asyncio.sleep(3600)
     finally:
-        health_task.cancel()
-        await application.updater.stop()
-        await application.stop()
+        endpoints.ready = False
+        await http_server.stop()
+        await broadcasts.stop()
+        await ingester.close()
+        await category_registry.stop()
+        await quota_compactor.stop()
+        if application.updater and application.updater.running:
+            await application.updater.stop()
+        if application.running:
+            await application.stop()
         await application.shutdown()
+        await next_videos.close()
+        await shortener.close()
+        # Flushes buffered navigation state and view accounting before exit
+        await Database.close()
+        logging.info(f"MongoDB pool stats: {MongoConnection.pool_stats()}")
+        MongoConnection.close()
 
 def main():
     logging.basicConfig(
@@ -94,10 +204,19 @@ def main():
     )
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
+    bot_task = loop.create_task(run_bot())
+    # The platform stops instances with SIGTERM; treat it like Ctrl+C
+    loop.add_signal_handler(signal.SIGTERM, bot_task.cancel)
     try:
-        loop.run_until_complete(run_bot())
-    except KeyboardInterrupt:
+        loop.run_until_complete(bot_task)
+    except (KeyboardInterrupt, asyncio.CancelledError):
         logging.info("👋 Graceful shutdown")
+        # Run run_bot's finally block so buffered writes reach Mongo
+        bot_task.cancel()
+        try:
+            loop.run_until_complete(bot_task)
+        except asyncio.CancelledError:
+            pass
     finally:
         if loop.is_running():
             loop.stop()
@@ -1,8 +1,19 @@
+import hashlib
 import os
 from dotenv import load_dotenv
+from helper import parse_token_keys
 
 load_dotenv()
 
+def _token_keys():
+    # TOKEN_KEYS is "kid:secret,kid:secret"; list the new key first to rotate
+    spec = os.getenv("TOKEN_KEYS")
+    if not spec:
+        # Derive a stable key from the bot token so replicas agree by default
+        secret = hashlib.sha256(f"access-token:{os.getenv('TELEGRAM_BOT_TOKEN', '')}".encode())
+        spec = f"0:{secret.hexdigest()}"
+    return parse_token_keys(spec)
+
 class Config:
     BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
     MONGO_URI = os.getenv("MONGODB_URI")
@@ -10,5 +21,75 @@ class Config:
     DEFAULT_CATEGORY = os.getenv("DEFAULT_CATEGORY", "general")
     INITIAL_TOKENS = int(os.getenv("INITIAL_TOKENS", 5))
     TOKEN_EXPIRY_HOURS = int(os.getenv("TOKEN_EXPIRY_HOURS", 24))
+    DAILY_VIEW_LIMIT = int(os.getenv("DAILY_VIEW_LIMIT", 0))  # per UTC day; 0 means no limit
+    # The first key signs new tokens, every listed key verifies
+    TOKEN_KEYS = _token_keys()
+    TOKEN_KEY_ID = next(iter(TOKEN_KEYS))
+    PORT = int(os.getenv("PORT", 8000))
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # public base URL; unset means polling
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or hashlib.sha256(
+        f"webhook:{os.getenv('TELEGRAM_BOT_TOKEN', '')}".encode()).hexdigest()
+    WEBHOOK_MAX_BODY = int(os.getenv("WEBHOOK_MAX_BODY", 1 << 20))
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 40))
+    UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 1000))
+    # Updates from different users run concurrently; one user's run in order
+    CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", 32))
+    UPDATE_LOCK_SHARDS = int(os.getenv("UPDATE_LOCK_SHARDS", 64))
+    # Updates taken off the queue and not finished, overall and per user;
+    # past the first the queue fills, past the second a user's taps are dropped
+    UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", CONCURRENT_UPDATES * 4))
+    UPDATE_USER_PENDING = int(os.getenv("UPDATE_USER_PENDING", 4))
+    # Admission control: per-user update rate, and admitted updates (running
+    # or waiting) beyond which new ones are shed; below UPDATE_MAX_PENDING
+    ADMISSION_USER_RATE = float(os.getenv("ADMISSION_USER_RATE", 3))
+    ADMISSION_USER_BURST = int(os.getenv("ADMISSION_USER_BURST", 6))
+    ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", 96))
+    TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", 64))
+    # Outgoing Bot API limits (Telegram: ~30 msg/s overall, ~1/s per chat, 20/min per group)
+    SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", 30))
+    SEND_GLOBAL_BURST = int(os.getenv("SEND_GLOBAL_BURST", 10))
+    SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", 1))
+    SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", 3))
+    SEND_GROUP_RATE = float(os.getenv("SEND_GROUP_RATE", 20 / 60))
+    SEND_GROUP_BURST = int(os.getenv("SEND_GROUP_BURST", 3))
+    SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", 3))
+    BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", 500))
+    BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", 20))
+    CATEGORY_POLL_SECONDS = float(os.getenv("CATEGORY_POLL_SECONDS", 5))
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 100))
+    INGEST_FLUSH_DELAY = float(os.getenv("INGEST_FLUSH_DELAY", 1.0))
     URL_SHORTENER = os.getenv("URL_SHORTENER_API")
-    DB_NAME = "spicybot"
\ No newline at end of file
+    SHORTENER_TIMEOUT = float(os.getenv("SHORTENER_TIMEOUT", 2.0))
+    SHORTENER_CACHE_SIZE = int(os.getenv("SHORTENER_CACHE_SIZE", 10000))
+    SHORTENER_CACHE_TTL = int(os.getenv("SHORTENER_CACHE_TTL", 3600))
+    SHORTENER_FAILURE_THRESHOLD = int(os.getenv("SHORTENER_FAILURE_THRESHOLD", 5))
+    SHORTENER_RESET_SECONDS = float(os.getenv("SHORTENER_RESET_SECONDS", 30))
+    DB_NAME = os.getenv("DB_NAME", "spicybot")
+    # "mongo", or "sqlite" for an embedded single-node store at SQLITE_PATH
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo").lower()
+    SQLITE_PATH = os.getenv("SQLITE_PATH", "bot.sqlite3")
+    MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+    MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 2))
+    MONGO_MAX_IDLE_MS = int(os.getenv("MONGO_MAX_IDLE_MS", 300000))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000))
+    MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 10000))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+    MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zlib")
+    MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+    DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", 8))
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+    USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 300))
+    WRITE_BEHIND_DELAY = float(os.getenv("WRITE_BEHIND_DELAY", 2.0))
+    VIEW_FLUSH_DELAY = float(os.getenv("VIEW_FLUSH_DELAY", 1.0))
+    HISTORY_SIZE = int(os.getenv("HISTORY_SIZE", 50))
+    # Background rewrite of stale quota fields for dormant users; 0 disables it
+    QUOTA_COMPACT_INTERVAL = float(os.getenv("QUOTA_COMPACT_INTERVAL", 0))
+    QUOTA_COMPACT_BATCH = int(os.getenv("QUOTA_COMPACT_BATCH", 500))
+    PREFETCH_WINDOW = int(os.getenv("PREFETCH_WINDOW", 10))
+    # Seconds a speculatively selected next video is kept; 0 disables it
+    NEXT_PREFETCH_TTL = float(os.getenv("NEXT_PREFETCH_TTL", 30))
+    NEXT_PREFETCH_PREVIOUS = os.getenv("NEXT_PREFETCH_PREVIOUS", "").lower() in ("1", "true", "yes")
+    SEEN_TTL_DAYS = int(os.getenv("SEEN_TTL_DAYS", 0))
+    DB_EXPLAIN = os.getenv("DB_EXPLAIN", "").lower() in ("1", "true", "yes")
\ No newline at end of file
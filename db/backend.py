@@ -0,0 +1,226 @@
+# db/backend.py
+
+from db import models
+
+
+class StorageBackend:
+    """
+    Everything the Database facade needs from a store: users, seen-sets,
+    categories, videos and broadcasts.
+
+    Methods are blocking and are called from the facade's worker threads,
+    so an implementation must be safe to use from several threads at once.
+    Documents are plain dicts shaped like the Mongo ones: users carry
+    arbitrary fields, videos are {_id, file_id, category, idx}, categories
+    are {name, channel_id, video_count} and broadcasts have an `_id`.
+    User updates use the operators db.user_cache.apply_update understands
+    ($set, $inc, $max, $push with $each/$slice).
+    """
+
+    name = "abstract"
+
+    def close(self):
+        pass
+
+    # --- Users ---
+    def get_user(self, user_id):
+        raise NotImplementedError
+
+    def find_and_update_user(self, user_id, update):
+        """Apply an update (upserting) and return the document after it."""
+        raise NotImplementedError
+
+    def set_user_fields(self, fields_by_user):
+        """$set many users' fields at once: {user_id: {field: value}}."""
+        raise NotImplementedError
+
+    def write_views(self, views, history_size=None):
+        """Coalesced view accounting, as documented on models.write_views."""
+        raise NotImplementedError
+
+    def get_user_ids_after(self, after=None, limit=500):
+        raise NotImplementedError
+
+    def compact_users(self, after=None, limit=500):
+        """Rewrite stale quota fields; returns (next `after` or None, users rewritten)."""
+        raise NotImplementedError
+
+    def remove_users(self, user_ids):
+        raise NotImplementedError
+
+    # --- Seen-sets ---
+    def get_seen_set(self, user_id, category):
+        raise NotImplementedError
+
+    def mark_seen(self, user_id, category, indexes):
+        raise NotImplementedError
+
+    # --- Categories ---
+    def get_categories(self):
+        raise NotImplementedError
+
+    def get_category(self, name):
+        raise NotImplementedError
+
+    def add_category(self, name, channel_id):
+        """
+        Create a category, or give a channel to one stored without it.
+
+        Raises:
+            ValueError: A category with this name and a channel exists.
+        """
+        raise NotImplementedError
+
+    def remove_category(self, name):
+        raise NotImplementedError
+
+    def get_categories_version(self):
+        raise NotImplementedError
+
+    def load_categories(self):
+        """(version, categories) read so that a concurrent change bumps the version."""
+        raise NotImplementedError
+
+    def watch_categories_version(self, on_change, stop):
+        """
+        Block, calling on_change() whenever the categories version moves,
+        until the `stop` threading.Event is set.
+
+        Raises:
+            NotImplementedError: The store cannot push changes; poll instead.
+        """
+        raise NotImplementedError
+
+    def get_category_size(self, category):
+        raise NotImplementedError
+
+    # --- Videos ---
+    def get_videos(self, category, cursor=0, limit=1, direction=1):
+        raise NotImplementedError
+
+    def get_videos_by_idx(self, category, indexes):
+        raise NotImplementedError
+
+    def get_unseen_video(self, user_id, category):
+        raise NotImplementedError
+
+    def add_video(self, video_id, category, file_id):
+        """
+        Raises:
+            LookupError: The category does not exist.
+        """
+        raise NotImplementedError
+
+    def ingest_videos(self, category, videos):
+        """
+        Insert videos not stored yet (by file_unique_id); returns how many were new.
+
+        Raises:
+            LookupError: The category does not exist.
+        """
+        raise NotImplementedError
+
+    # --- Broadcasts ---
+    def create_broadcast(self, created_by, text=None, from_chat_id=None, message_id=None):
+        raise NotImplementedError
+
+    def checkpoint_broadcast(self, broadcast_id, last_user_id, sent=0, failed=0, blocked=0):
+        raise NotImplementedError
+
+    def finish_broadcast(self, broadcast_id, status="done"):
+        raise NotImplementedError
+
+    def get_running_broadcasts(self):
+        raise NotImplementedError
+
+
+class MongoBackend(StorageBackend):
+    """The pymongo helpers in db.models, bound to one Database."""
+
+    name = "mongo"
+
+    def __init__(self, db):
+        self.db = db
+
+    # --- Users ---
+    def get_user(self, user_id):
+        return models.get_user(self.db, user_id)
+
+    def find_and_update_user(self, user_id, update):
+        return models.find_and_update_user(self.db, user_id, update)
+
+    def set_user_fields(self, fields_by_user):
+        models.set_user_fields(self.db, fields_by_user)
+
+    def write_views(self, views, history_size=None):
+        models.write_views(self.db, views, history_size)
+
+    def get_user_ids_after(self, after=None, limit=500):
+        return models.get_user_ids_after(self.db, after, limit)
+
+    def compact_users(self, after=None, limit=500):
+        return models.compact_users(self.db, after, limit)
+
+    def remove_users(self, user_ids):
+        models.remove_users(self.db, user_ids)
+
+    # --- Seen-sets ---
+    def get_seen_set(self, user_id, category):
+        return models.get_seen_set(self.db, user_id, category)
+
+    def mark_seen(self, user_id, category, indexes):
+        models.mark_seen(self.db, user_id, category, indexes)
+
+    # --- Categories ---
+    def get_categories(self):
+        return models.get_categories(self.db)
+
+    def get_category(self, name):
+        return models.get_category(self.db, name)
+
+    def add_category(self, name, channel_id):
+        models.add_category(self.db, name, channel_id)
+
+    def remove_category(self, name):
+        models.remove_category(self.db, name)
+
+    def get_categories_version(self):
+        return models.get_categories_version(self.db)
+
+    def load_categories(self):
+        return models.load_categories(self.db)
+
+    def watch_categories_version(self, on_change, stop):
+        models.watch_categories_version(self.db, on_change, stop)
+
+    def get_category_size(self, category):
+        return models.get_category_size(self.db, category)
+
+    # --- Videos ---
+    def get_videos(self, category, cursor=0, limit=1, direction=1):
+        return models.get_videos(self.db, category, cursor, limit, direction)
+
+    def get_videos_by_idx(self, category, indexes):
+        return models.get_videos_by_idx(self.db, category, indexes)
+
+    def get_unseen_video(self, user_id, category):
+        return models.get_unseen_video(self.db, user_id, category)
+
+    def add_video(self, video_id, category, file_id):
+        models.add_video(self.db, video_id, category, file_id)
+
+    def ingest_videos(self, category, videos):
+        return models.ingest_videos(self.db, category, videos)
+
+    # --- Broadcasts ---
+    def create_broadcast(self, created_by, text=None, from_chat_id=None, message_id=None):
+        return models.create_broadcast(self.db, created_by, text, from_chat_id, message_id)
+
+    def checkpoint_broadcast(self, broadcast_id, last_user_id, sent=0, failed=0, blocked=0):
+        models.checkpoint_broadcast(self.db, broadcast_id, last_user_id, sent, failed, blocked)
+
+    def finish_broadcast(self, broadcast_id, status="done"):
+        return models.finish_broadcast(self.db, broadcast_id, status)
+
+    def get_running_broadcasts(self):
+        return models.get_running_broadcasts(self.db)
@@ -0,0 +1,152 @@
+# db/connection.py
+
+import threading
+import time
+from pymongo import MongoClient, monitoring
+from config import Config
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """
+    Connection pool listener that tracks checkouts and checkout wait time.
+
+    Events arrive on whichever thread runs the query (the Database worker
+    pool), so counters are guarded by a lock; this is off the hot path of
+    the event loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.open_connections = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "open_connections": self.open_connections,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "wait_time_total": self.wait_time_total,
+                "wait_time_max": self.wait_time_max,
+                "wait_time_avg": self.wait_time_total / self.checkouts if self.checkouts else 0.0,
+            }
+
+    def _waited(self):
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        return time.perf_counter() - started if started is not None else 0.0
+
+    # --- Checkout lifecycle ---
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        waited = self._waited()
+        with self._lock:
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.checkouts += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+    def connection_check_out_failed(self, event):
+        self._waited()
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    # --- Connection lifecycle ---
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+class MongoConnection:
+    """
+    The one MongoClient the application owns.
+
+    Every module gets its database handle from here, so there is a single
+    connection pool sized and tuned from Config.
+    """
+
+    _client = None
+    _db = None
+    _stats = None
+
+    @classmethod
+    def connect(cls, uri=None, db_name=None):
+        """
+        Create the shared client on first call and return the database.
+
+        The database is db_name if given, else the one named in the URI,
+        else Config.DB_NAME.
+        """
+        if cls._client is None:
+            cls._stats = PoolStats()
+            options = {
+                "maxPoolSize": Config.MONGO_MAX_POOL_SIZE,
+                "minPoolSize": Config.MONGO_MIN_POOL_SIZE,
+                "maxIdleTimeMS": Config.MONGO_MAX_IDLE_MS,
+                "waitQueueTimeoutMS": Config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                "connectTimeoutMS": Config.MONGO_CONNECT_TIMEOUT_MS,
+                "socketTimeoutMS": Config.MONGO_SOCKET_TIMEOUT_MS,
+                "serverSelectionTimeoutMS": Config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                "readPreference": Config.MONGO_READ_PREFERENCE,
+                "event_listeners": [cls._stats],
+            }
+            if Config.MONGO_COMPRESSORS:
+                options["compressors"] = Config.MONGO_COMPRESSORS
+            cls._client = MongoClient(uri or Config.MONGO_URI, **options)
+            default = cls._client.get_default_database(default=Config.DB_NAME)
+            cls._db = default if default.name != "test" else cls._client[Config.DB_NAME]
+        if db_name:
+            return cls._client[db_name]
+        return cls._db
+
+    @classmethod
+    def get_db(cls):
+        if cls._db is None:
+            raise RuntimeError("MongoConnection.connect() must be called before use")
+        return cls._db
+
+    @classmethod
+    def pool_stats(cls):
+        """Checked-out connections, checkout counts and wait times."""
+        return cls._stats.snapshot() if cls._stats else {}
+
+    @classmethod
+    def close(cls):
+        if cls._client is not None:
+            cls._client.close()
+            cls._client = None
+            cls._db = None
@@ -0,0 +1,281 @@
+# db/database.py
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from config import Config
+from db.backend import MongoBackend, StorageBackend
+from db.user_cache import UserCache, ViewBuffer, WriteBehind
+from utils.metrics import Counter, Histogram
+
+# Navigation state that can lag behind in Mongo for a few seconds
+WRITE_BEHIND_FIELDS = ("cursor", "current_category", "playlists")
+CATEGORY_SIZE_TTL = 30
+
+MONGO_LATENCY = Histogram(
+    "mongo_operation_latency_seconds",
+    "Mongo call latency including executor queueing", ("operation",),
+)
+MONGO_ERRORS = Counter("mongo_operation_errors_total", "Mongo calls that raised", ("operation",))
+
+
+class Database:
+    """
+    Async facade over a StorageBackend (Mongo via db.models, or SQLite).
+
+    Backends are blocking, so every call is pushed onto a bounded thread
+    pool and awaited. A slow round-trip then only holds one worker thread
+    instead of freezing the event loop for every other update.
+
+    User documents are served from an LRU/TTL cache. Navigation fields are
+    written back lazily by a WriteBehind buffer, and view accounting (token
+    spend, viewed_videos, seen bits) is coalesced by a ViewBuffer; other
+    changes are written immediately with an atomic update whose result
+    refreshes the cache.
+    """
+
+    _backend = None
+    _executor = None
+    _cache = UserCache()
+    _write_behind = None
+    _views = None
+    _category_sizes = {}  # name -> (expires_at, video_count)
+
+    @classmethod
+    def bind(cls, db, max_workers=None):
+        """
+        Attach a store and start the worker pool.
+
+        Args:
+            db (StorageBackend | Database): A backend, or a pymongo Database
+                to wrap in a MongoBackend.
+            max_workers (int): Upper bound on concurrent store calls.
+        """
+        cls._backend = db if isinstance(db, StorageBackend) else MongoBackend(db)
+        cls._executor = ThreadPoolExecutor(
+            max_workers=max_workers or Config.DB_MAX_WORKERS,
+            thread_name_prefix="db",
+        )
+        cls._cache = UserCache(Config.USER_CACHE_SIZE, Config.USER_CACHE_TTL)
+        cls._write_behind = WriteBehind(cls._write_deferred, Config.WRITE_BEHIND_DELAY)
+        cls._views = ViewBuffer(cls._write_views, Config.VIEW_FLUSH_DELAY, Config.HISTORY_SIZE)
+
+    @classmethod
+    async def close(cls):
+        """Flush deferred writes and views, then stop the worker pool."""
+        if cls._write_behind is not None:
+            await cls._write_behind.flush()
+        if cls._views is not None:
+            await cls._views.flush()
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=True)
+            cls._executor = None
+        if cls._backend is not None:
+            cls._backend.close()
+
+    @classmethod
+    async def _run(cls, func, *args, **kwargs):
+        if cls._backend is None:
+            raise RuntimeError("Database.bind() must be called before use")
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        # Timed here, on the loop thread, so metrics need no locking
+        try:
+            return await loop.run_in_executor(cls._executor, partial(func, *args, **kwargs))
+        except Exception:
+            MONGO_ERRORS.labels(func.__name__).inc()
+            raise
+        finally:
+            MONGO_LATENCY.labels(func.__name__).observe(time.perf_counter() - started)
+
+    # --- Users ---
+    @classmethod
+    async def get_user(cls, user_id):
+        doc = cls._cache.get(user_id)
+        if doc is not None:
+            return doc
+        for _ in range(3):
+            # A view write overlapping the read may or may not be in the
+            # document, so wait one out and read again if one started
+            await cls._views.settle(user_id)
+            generation = cls._views.generation
+            doc = await cls._run(cls._backend.get_user, user_id)
+            if generation == cls._views.generation:
+                break
+        if doc is not None:
+            doc.update(cls._write_behind.pending(user_id) or {})
+            cls._views.overlay(user_id, doc)
+            cls._cache.put(user_id, doc)
+        return doc
+
+    @classmethod
+    async def update_user(cls, user_id, update):
+        # Plain field dicts are treated as a $set, like models.update_user
+        if not any(key.startswith("$") for key in update):
+            update = {"$set": {k: v for k, v in update.items() if k != "_id"}}
+        update = dict(update)
+
+        fields = dict(update.get("$set", {}))
+        deferred = {k: fields.pop(k) for k in WRITE_BEHIND_FIELDS if k in fields}
+        if fields:
+            update["$set"] = fields
+        else:
+            update.pop("$set", None)
+
+        if update:
+            if "tokens" in fields:
+                # A fresh grant replaces the balance the pending spend was taken from
+                cls._views.forget_tokens(user_id)
+            await cls._views.settle(user_id)
+            doc = await cls._run(cls._backend.find_and_update_user, user_id, update)
+            doc.update(cls._write_behind.pending(user_id) or {})
+            cls._views.overlay(user_id, doc)
+            doc.update(deferred)
+            cls._cache.put(user_id, doc)
+        elif deferred:
+            cls._cache.apply(user_id, {"$set": deferred})
+        if deferred:
+            cls._write_behind.defer(user_id, deferred)
+
+    @classmethod
+    async def _write_deferred(cls, fields_by_user):
+        await cls._run(cls._backend.set_user_fields, fields_by_user)
+
+    @classmethod
+    def record_view(cls, user_id, category, video, limits=None):
+        """
+        Account for one video shown: one token spent, one view counted
+        against the daily limit, its file_id added to viewed_videos and its
+        idx marked seen. Applied to the cache now and written to Mongo with
+        the next ViewBuffer flush. `limits` is the caller's already counted
+        daily counter, copied into the cache as is.
+        """
+        cls._views.record(user_id, category, video.get("idx"), video["file_id"])
+        update = {"$inc": {"tokens": -1}, "$push": {"viewed_videos": {
+            "$each": [video["file_id"]], "$slice": -Config.HISTORY_SIZE
+        }}}
+        if limits is not None:
+            update["$set"] = {"limits": dict(limits)}
+        cls._cache.apply(user_id, update)
+        cls._cache.apply(user_id, {"$max": {"tokens": 0}})
+
+    @classmethod
+    async def _write_views(cls, views):
+        await cls._run(cls._backend.write_views, views, Config.HISTORY_SIZE)
+
+    @classmethod
+    def cache_stats(cls):
+        """Hit/miss/eviction counters plus the number of deferred writes."""
+        stats = cls._cache.stats()
+        stats["pending_writes"] = len(cls._write_behind) if cls._write_behind else 0
+        stats["pending_views"] = len(cls._views) if cls._views else 0
+        return stats
+
+    # --- Quota compaction ---
+    @classmethod
+    async def compact_users(cls, after=None, limit=500):
+        # Only stale values are rewritten, which cached copies already read as zero
+        return await cls._run(cls._backend.compact_users, after, limit)
+
+    # --- Broadcasts ---
+    @classmethod
+    async def get_user_ids_after(cls, after=None, limit=500):
+        return await cls._run(cls._backend.get_user_ids_after, after, limit)
+
+    @classmethod
+    async def remove_users(cls, user_ids):
+        # Buffered writes upsert, so they would bring removed users back as
+        # partial documents: drop them, and let any already being written land first
+        for user_id in user_ids:
+            cls._write_behind.discard(user_id)
+            cls._views.discard(user_id)
+            await cls._write_behind.settle(user_id)
+            await cls._views.settle(user_id)
+            cls._cache.invalidate(user_id)
+        await cls._run(cls._backend.remove_users, user_ids)
+
+    @classmethod
+    async def create_broadcast(cls, created_by, text=None, from_chat_id=None, message_id=None):
+        return await cls._run(cls._backend.create_broadcast, created_by, text, from_chat_id, message_id)
+
+    @classmethod
+    async def checkpoint_broadcast(cls, broadcast_id, last_user_id, sent=0, failed=0, blocked=0):
+        await cls._run(cls._backend.checkpoint_broadcast, broadcast_id, last_user_id, sent, failed, blocked)
+
+    @classmethod
+    async def finish_broadcast(cls, broadcast_id, status="done"):
+        return await cls._run(cls._backend.finish_broadcast, broadcast_id, status)
+
+    @classmethod
+    async def get_running_broadcasts(cls):
+        return await cls._run(cls._backend.get_running_broadcasts)
+
+    # --- Seen-sets ---
+    @classmethod
+    async def get_seen_set(cls, user_id, category):
+        return await cls._run(cls._backend.get_seen_set, user_id, category)
+
+    @classmethod
+    async def mark_seen(cls, user_id, category, indexes):
+        await cls._run(cls._backend.mark_seen, user_id, category, indexes)
+
+    # --- Categories ---
+    @classmethod
+    async def get_categories(cls):
+        return await cls._run(cls._backend.get_categories)
+
+    @classmethod
+    async def get_category(cls, name):
+        return await cls._run(cls._backend.get_category, name)
+
+    @classmethod
+    async def add_category(cls, name, channel_id):
+        await cls._run(cls._backend.add_category, name, channel_id)
+
+    @classmethod
+    async def remove_category(cls, name):
+        await cls._run(cls._backend.remove_category, name)
+
+    @classmethod
+    async def get_categories_version(cls):
+        return await cls._run(cls._backend.get_categories_version)
+
+    @classmethod
+    async def load_categories(cls):
+        return await cls._run(cls._backend.load_categories)
+
+    # --- Videos ---
+    @classmethod
+    async def get_videos(cls, category, cursor=0, limit=1, direction=1):
+        return await cls._run(cls._backend.get_videos, category, cursor, limit, direction)
+
+    @classmethod
+    async def get_videos_by_idx(cls, category, indexes):
+        return await cls._run(cls._backend.get_videos_by_idx, category, indexes)
+
+    @classmethod
+    async def get_category_size(cls, category):
+        """Number of idx slots allocated in a category, memoised briefly."""
+        entry = cls._category_sizes.get(category)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        size = await cls._run(cls._backend.get_category_size, category)
+        cls._category_sizes[category] = (time.monotonic() + CATEGORY_SIZE_TTL, size)
+        return size
+
+    @classmethod
+    async def get_unseen_video(cls, user_id, category):
+        return await cls._run(cls._backend.get_unseen_video, user_id, category)
+
+    @classmethod
+    async def add_video(cls, video_id, category, file_id):
+        await cls._run(cls._backend.add_video, video_id, category, file_id)
+
+    @classmethod
+    async def ingest_videos(cls, category, videos):
+        inserted = await cls._run(cls._backend.ingest_videos, category, videos)
+        if inserted:
+            cls._category_sizes.pop(category, None)
+        return inserted
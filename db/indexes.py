@@ -0,0 +1,123 @@
+# db/indexes.py
+
+import logging
+from pymongo import ASCENDING, IndexModel
+from config import Config
+
+# --- Index Definitions ---
+
+def index_models():
+    """
+    Every index the bot's hot queries rely on, keyed by collection.
+    """
+    seen = [IndexModel(
+        [("user_id", ASCENDING), ("category", ASCENDING)],
+        name="user_category_unique", unique=True
+    )]
+    if Config.SEEN_TTL_DAYS:
+        # Dormant users' seen-sets expire; they just start seeing repeats again
+        seen.append(IndexModel(
+            [("updated_at", ASCENDING)],
+            name="updated_at_ttl", expireAfterSeconds=Config.SEEN_TTL_DAYS * 86400
+        ))
+    return {
+        "users": [
+            IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+        ],
+        "videos": [
+            IndexModel(
+                [("category", ASCENDING), ("idx", ASCENDING)],
+                name="category_idx_unique", unique=True,
+                partialFilterExpression={"idx": {"$exists": True}}
+            ),
+            IndexModel([("category", ASCENDING), ("rand", ASCENDING)], name="category_rand"),
+            IndexModel(
+                [("file_unique_id", ASCENDING)], name="file_unique_id_unique", unique=True,
+                partialFilterExpression={"file_unique_id": {"$exists": True}}
+            ),
+        ],
+        "categories": [
+            IndexModel([("name", ASCENDING)], name="name_unique", unique=True),
+        ],
+        "seen": seen,
+    }
+
+# --- Bootstrap and Verification ---
+
+def ensure_indexes(db):
+    """
+    Create any missing indexes. create_indexes is a no-op for indexes that
+    already exist with the same definition, so this is safe on every start.
+    """
+    for collection, models in index_models().items():
+        db[collection].create_indexes(models)
+
+def verify_indexes(db):
+    """
+    Check every expected index exists with the expected keys.
+
+    Returns:
+        list: Human readable problems; empty when everything is in place.
+    """
+    problems = []
+    for collection, models in index_models().items():
+        existing = db[collection].index_information()
+        for model in models:
+            spec = model.document
+            info = existing.get(spec["name"])
+            if info is None:
+                problems.append(f"{collection}: missing index {spec['name']}")
+            elif list(info["key"]) != list(spec["key"].items()):
+                problems.append(f"{collection}: index {spec['name']} has keys {info['key']}")
+    return problems
+
+# --- Query Plan Diagnostics ---
+
+def hot_queries(db):
+    """
+    The queries run on every update, plus the broadcast batch scan, as
+    (label, cursor) pairs.
+    """
+    return [
+        ("users by user_id", db.users.find({"user_id": 0})),
+        ("videos keyset page", db.videos.find(
+            {"category": "", "idx": {"$gte": 0}}).sort("idx", ASCENDING).limit(10)),
+        ("videos by idx", db.videos.find({"category": "", "idx": {"$in": [0, 1]}})),
+        ("videos random probe", db.videos.find(
+            {"category": "", "rand": {"$gte": 0.5}}).sort("rand", ASCENDING).limit(16)),
+        ("categories by name", db.categories.find({"name": ""})),
+        ("seen by user", db.seen.find({"user_id": 0, "category": ""})),
+        ("broadcast user batch", db.users.find(
+            {"user_id": {"$gt": 0}}, {"user_id": 1, "_id": 0}).sort("user_id", ASCENDING).limit(500)),
+    ]
+
+def _plan_stages(plan):
+    # Walk the (possibly nested) winning plan and collect every stage name
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+def explain_hot_queries(db):
+    """
+    Run explain() on each hot query and flag collection scans and
+    in-memory sorts.
+
+    Returns:
+        list: (label, stages, ok) tuples.
+    """
+    report = []
+    for label, cursor in hot_queries(db):
+        plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        stages = list(_plan_stages(plan))
+        ok = "COLLSCAN" not in stages and "SORT" not in stages
+        report.append((label, stages, ok))
+        if ok:
+            logging.info(f"✅ {label}: {' <- '.join(stages)}")
+        else:
+            logging.warning(f"⚠️ {label} is not index-backed: {' <- '.join(stages)}")
+    return report
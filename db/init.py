@@ -1,8 +1,5 @@
-from pymongo import MongoClient
+from db.connection import MongoConnection
 
-def init_db(mongo_uri: str, db_name: str = None):
-    client = MongoClient(mongo_uri)
-    if db_name:
-        return client[db_name]
-    else:
-        return client.get_default_database()
+def init_db(mongo_uri: str = None, db_name: str = None):
+    # Kept for callers of the old helper; the client is shared
+    return MongoConnection.connect(mongo_uri, db_name)
@@ -1,7 +1,17 @@
 
-from pymongo import MongoClient
+import random
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from datetime import datetime
 from bson.objectid import ObjectId
+from config import Config
+from db.seen import SeenSet, word_masks
+from utils import quota
+
+# Fields handlers need from a video; never ship whole documents around
+VIDEO_FIELDS = {"_id": 1, "file_id": 1, "category": 1, "idx": 1}
+SAMPLE_BATCH = 16
+SAMPLE_ATTEMPTS = 4
 
 # --- Database Initialization (used by init_db in utils.py) ---
 def get_db(client: MongoClient, db_name="telegram_video_bot"):
@@ -15,25 +25,43 @@ def create_user(db, user_id, is_premium=False):
     user = {
         "user_id": user_id,
         "is_premium": is_premium,
-        "history": [],  # List of video_ids seen
+        "viewed_videos": [],  # Capped ring of recent file_ids
         "selected_category": None,
         "tokens": 0,
-        "limits": {"daily": 0, "last_reset": datetime.utcnow()}
+        "token_expiry": 0,  # Unix timestamp; tokens count as zero after it
     }
     db.users.insert_one(user)
     return user
 
+def update_user(db, user_id, update):
+    # Plain field dicts are treated as a $set, operator dicts are passed through
+    if not any(key.startswith("$") for key in update):
+        update = {"$set": {k: v for k, v in update.items() if k != "_id"}}
+    db.users.update_one({"user_id": user_id}, update, upsert=True)
+
+def find_and_update_user(db, user_id, update):
+    # Returns the document after the update so callers can refresh caches
+    return db.users.find_one_and_update(
+        {"user_id": user_id}, update,
+        upsert=True, return_document=ReturnDocument.AFTER
+    )
+
+def set_user_fields(db, fields_by_user):
+    requests = [
+        UpdateOne({"user_id": user_id}, {"$set": fields}, upsert=True)
+        for user_id, fields in fields_by_user.items()
+    ]
+    if requests:
+        db.users.bulk_write(requests, ordered=False)
+
 def update_user_category(db, user_id, category):
     db.users.update_one({"user_id": user_id}, {"$set": {"selected_category": category}})
 
-def add_video_to_history(db, user_id, video_id):
-    db.users.update_one({"user_id": user_id}, {"$addToSet": {"history": video_id}})
-
-def reset_daily_limits(db, user_id):
-    db.users.update_one(
-        {"user_id": user_id},
-        {"$set": {"limits.daily": 0, "limits.last_reset": datetime.utcnow()}}
-    )
+def add_video_to_history(db, user_id, video):
+    mark_seen(db, user_id, video["category"], [video["idx"]])
+    db.users.update_one({"user_id": user_id}, {"$push": {"viewed_videos": {
+        "$each": [video["file_id"]], "$slice": -Config.HISTORY_SIZE
+    }}})
 
 # --- Category Management ---
 def get_categories(db):
@@ -43,29 +71,393 @@ def get_category(db, category_name):
     return db.categories.find_one({"name": category_name})
 
 def add_category(db, name, channel_id):
-    db.categories.insert_one({"name": name, "channel_id": channel_id})
+    # A document without a channel (left by index reservations that used to
+    # upsert) is adopted, keeping its video_count; any other one is a duplicate
+    try:
+        db.categories.update_one(
+            {"name": name, "channel_id": None}, {"$set": {"channel_id": channel_id}}, upsert=True
+        )
+    except DuplicateKeyError:
+        raise ValueError(f"Category {name!r} already exists")
+    bump_categories_version(db)
 
 def remove_category(db, name):
     db.categories.delete_one({"name": name})
+    bump_categories_version(db)
+
+# --- Category Registry Version ---
+# Adding or removing a category (not ingesting videos into one) bumps one
+# counter in `meta`, so replicas can tell their copy is stale from a
+# single _id lookup or a change stream event on that document.
+CATEGORIES_VERSION_ID = "categories"
+
+def bump_categories_version(db):
+    db.meta.update_one({"_id": CATEGORIES_VERSION_ID}, {"$inc": {"version": 1}}, upsert=True)
+
+def get_categories_version(db):
+    doc = db.meta.find_one({"_id": CATEGORIES_VERSION_ID}, {"version": 1})
+    return doc["version"] if doc else 0
+
+def load_categories(db):
+    """
+    Snapshot of every category with its version.
+
+    The version is read first: a change that lands while the categories
+    are read bumps it past the returned one, so the caller reloads again.
+
+    Returns:
+        tuple: (version, [{"name", "channel_id", "video_count"}])
+    """
+    version = get_categories_version(db)
+    categories = list(db.categories.find({}, {"_id": 0, "name": 1, "channel_id": 1, "video_count": 1}))
+    return version, categories
+
+def watch_categories_version(db, on_change, stop):
+    """
+    Call on_change() whenever the categories version changes, until the
+    `stop` threading.Event is set. Blocking; run it in its own thread.
+
+    Raises:
+        OperationFailure: Change streams need a replica set or sharded cluster.
+    """
+    pipeline = [{"$match": {"documentKey._id": CATEGORIES_VERSION_ID}}]
+    with db.meta.watch(pipeline, max_await_time_ms=1000) as stream:
+        while not stop.is_set():
+            if stream.try_next() is not None:
+                on_change()
 
 # --- Video History (per user, per category) ---
+def get_seen_set(db, user_id, category):
+    return SeenSet.from_doc(db.seen.find_one({"user_id": user_id, "category": category}))
+
+def seen_update(indexes):
+    # $bit on a missing word starts from 0, so one upsert sets every bit
+    masks = word_masks(idx for idx in indexes if idx is not None)
+    if not masks:
+        return None
+    return {
+        "$bit": {f"w.{word}": {"or": mask} for word, mask in masks.items()},
+        "$currentDate": {"updated_at": True},
+    }
+
+def mark_seen(db, user_id, category, indexes):
+    update = seen_update(indexes)
+    if update:
+        db.seen.update_one({"user_id": user_id, "category": category}, update, upsert=True)
+
+def write_views(db, views, history_size=None):
+    """
+    Apply coalesced view accounting for many users at once.
+
+    Each user gets one pipeline update: tokens drop by the number of views
+    but are clamped at zero on the server, so concurrent writers can never
+    drive them negative, the daily counter is added to (or restarted if it
+    belongs to an earlier day) and the viewed_videos ring is extended and
+    capped.
+    Seen bits go to the seen collection as one $bit upsert per category.
+    Each collection is written with a single unordered bulk_write.
+
+    Args:
+        views (dict): user_id -> {"tokens": int, "views": int, "viewed": [file_id],
+            "seen": {category: indexes}}
+    """
+    history_size = history_size or Config.HISTORY_SIZE
+    day = quota.today()
+    users, seen = [], []
+    for user_id, view in views.items():
+        fields = {}
+        if view["tokens"]:
+            fields["tokens"] = {"$max": [0, {"$subtract": [{"$ifNull": ["$tokens", 0]}, view["tokens"]]}]}
+        if view["views"]:
+            fields["limits"] = {"$cond": [
+                {"$eq": ["$limits.day", day]},
+                {"day": day, "views": {"$add": [{"$ifNull": ["$limits.views", 0]}, view["views"]]}},
+                {"day": day, "views": view["views"]},
+            ]}
+        if view["viewed"]:
+            fields["viewed_videos"] = {"$slice": [
+                {"$concatArrays": [{"$ifNull": ["$viewed_videos", []]}, view["viewed"]]},
+                -history_size,
+            ]}
+        if fields:
+            users.append(UpdateOne({"user_id": user_id}, [{"$set": fields}]))
+        for category, indexes in view["seen"].items():
+            update = seen_update(indexes)
+            if update:
+                seen.append(UpdateOne({"user_id": user_id, "category": category}, update, upsert=True))
+    # Seen bits are idempotent, so they go first: if the users write then
+    # fails, setting them again on the retried flush changes nothing
+    if seen:
+        db.seen.bulk_write(seen, ordered=False)
+    if users:
+        db.users.bulk_write(users, ordered=False)
+
+def sample_unseen_video(db, category, seen=None, projection=VIDEO_FIELDS):
+    """
+    Pick a random video in category whose idx is not in the seen-set.
+
+    Every video carries a precomputed uniform `rand` key. A probe jumps to a
+    random pivot and reads a small batch in key order, wrapping around, so
+    the cost depends on neither the category size nor the history length.
+    """
+    if seen is None:
+        seen = SeenSet()
+    for _ in range(SAMPLE_ATTEMPTS):
+        pivot = random.random()
+        batch = list(
+            db.videos.find({"category": category, "rand": {"$gte": pivot}}, projection)
+            .sort("rand", 1).limit(SAMPLE_BATCH)
+        )
+        if len(batch) < SAMPLE_BATCH:
+            batch += list(
+                db.videos.find({"category": category, "rand": {"$lt": pivot}}, projection)
+                .sort("rand", 1).limit(SAMPLE_BATCH - len(batch))
+            )
+        unseen = [video for video in batch if video.get("idx") not in seen]
+        if unseen:
+            return random.choice(unseen)
+        if len(batch) < SAMPLE_BATCH:
+            # The whole category fit in one batch and all of it was seen
+            return None
+
+    # Almost everything is seen: pick from the bitmap complement directly
+    category_doc = db.categories.find_one({"name": category}, {"video_count": 1}) or {}
+    candidates = list(seen.unseen(category_doc.get("video_count", 0)))
+    random.shuffle(candidates)
+    for idx in candidates[:SAMPLE_ATTEMPTS]:
+        video = db.videos.find_one({"category": category, "idx": idx}, projection)
+        if video:
+            return video
+
+    # Holes or untracked videos: stream the category rather than listing it
+    for video in db.videos.find({"category": category}, projection):
+        if video.get("idx") not in seen:
+            return video
+    return None
+
 def get_unseen_video(db, user_id, category):
-    user = get_user(db, user_id)
-    seen_videos = user.get("history", [])
-    # Find a random unseen video in the category's channel
-    video = db.videos.find_one({
-        "category": category,
-        "_id": {"$nin": [ObjectId(vid) for vid in seen_videos]}
-    })
-    return video
+    return sample_unseen_video(db, category, get_seen_set(db, user_id, category))
+
+def ensure_random_keys(db):
+    # Backfill the sampler key on videos inserted before it existed
+    db.videos.update_many(
+        {"rand": {"$exists": False}},
+        [{"$set": {"rand": {"$rand": {}}}}]
+    )
+
+def reserve_video_indexes(db, category, count=1):
+    # Dense per-category positions come from a counter on the category doc;
+    # no upsert, so a removed or mistyped category is not recreated half-empty
+    doc = db.categories.find_one_and_update(
+        {"name": category}, {"$inc": {"video_count": count}},
+        projection={"video_count": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if doc is None:
+        raise LookupError(f"Unknown category {category!r}")
+    # No version bump: a count change must not make every replica reload
+    return doc["video_count"] - count
+
+def backfill_video_indexes(db):
+    # Give videos inserted before the dense index existed a position
+    for category in db.videos.distinct("category", {"idx": {"$exists": False}}):
+        ids = [v["_id"] for v in db.videos.find(
+            {"category": category, "idx": {"$exists": False}}, {"_id": 1}
+        ).sort("_id", 1)]
+        try:
+            start = reserve_video_indexes(db, category, len(ids))
+        except LookupError:
+            continue  # Videos of a category that no longer exists
+        db.videos.bulk_write([
+            UpdateOne({"_id": video_id}, {"$set": {"idx": start + i}})
+            for i, video_id in enumerate(ids)
+        ], ordered=False)
+
+def migrate_history(db, batch_size=500):
+    # Fold legacy `history` id arrays into seen bitmaps, then drop them
+    for user in db.users.find({"history": {"$exists": True}}, {"user_id": 1, "history": 1}):
+        history = user.get("history") or []
+        for i in range(0, len(history), batch_size):
+            chunk = history[i:i + batch_size]
+            ids = chunk + [ObjectId(vid) for vid in chunk if ObjectId.is_valid(vid)]
+            by_category = {}
+            for video in db.videos.find({"_id": {"$in": ids}}, {"category": 1, "idx": 1}):
+                by_category.setdefault(video["category"], []).append(video.get("idx"))
+            for category, indexes in by_category.items():
+                mark_seen(db, user["user_id"], category, indexes)
+        db.users.update_one({"_id": user["_id"]}, {"$unset": {"history": ""}})
+
+def get_videos(db, category, cursor=0, limit=1, direction=1):
+    """
+    Keyset page of videos ordered by idx, starting at cursor.
+
+    direction=1 returns idx >= cursor ascending; direction=-1 returns
+    idx <= cursor, still in ascending order. Unlike skip(), the cost does
+    not grow with the cursor.
+    """
+    op = "$gte" if direction > 0 else "$lte"
+    videos = list(
+        db.videos.find({"category": category, "idx": {op: cursor}}, VIDEO_FIELDS)
+        .sort("idx", direction).limit(limit)
+    )
+    if direction < 0:
+        videos.reverse()
+    return videos
+
+def get_videos_by_idx(db, category, indexes):
+    return list(db.videos.find({"category": category, "idx": {"$in": list(indexes)}}, VIDEO_FIELDS))
+
+def get_category_size(db, category):
+    doc = db.categories.find_one({"name": category}, {"video_count": 1}) or {}
+    return doc.get("video_count", 0)
 
 def add_video(db, video_id, category, file_id):
     db.videos.insert_one({
         "_id": video_id,
         "category": category,
-        "file_id": file_id
+        "idx": reserve_video_indexes(db, category),
+        "file_id": file_id,
+        "rand": random.random()
+    })
+
+def ingest_videos(db, category, videos):
+    """
+    Insert channel videos that are not in the collection yet.
+
+    Videos are deduplicated by file_unique_id (the same file reposted or
+    forwarded keeps it, unlike file_id). Only new ones reserve idx slots,
+    as one contiguous range, and all of them go out as a single unordered
+    bulk_write of $setOnInsert upserts, so a concurrent insert of the same
+    file just leaves an unused idx slot, which readers already skip.
+
+    Args:
+        videos (list): dicts with file_unique_id, file_id, channel_id, message_id.
+
+    Returns:
+        int: Number of videos inserted.
+    """
+    by_key = {video["file_unique_id"]: video for video in videos}
+    known = {doc["file_unique_id"] for doc in db.videos.find(
+        {"file_unique_id": {"$in": list(by_key)}}, {"file_unique_id": 1, "_id": 0}
+    )}
+    new = [video for key, video in by_key.items() if key not in known]
+    if not new:
+        return 0
+    start = reserve_video_indexes(db, category, len(new))
+    requests = [
+        UpdateOne({"file_unique_id": video["file_unique_id"]}, {"$setOnInsert": {
+            "category": category,
+            "idx": start + i,
+            "file_id": video["file_id"],
+            "channel_id": video.get("channel_id"),
+            "message_id": video.get("message_id"),
+            "rand": random.random(),
+            "added_at": datetime.utcnow(),
+        }}, upsert=True)
+        for i, video in enumerate(new)
+    ]
+    try:
+        result = db.videos.bulk_write(requests, ordered=False)
+        return result.upserted_count
+    except BulkWriteError as e:
+        # Duplicate keys from a racing writer are fine; anything else is not
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+        return e.details["nUpserted"]
+
+# --- Broadcasts ---
+def get_user_ids_after(db, after=None, limit=500):
+    """
+    Next batch of user ids above `after`, in ascending order.
+
+    Keyset pagination on the unique user_id index: each batch is one short
+    index scan no matter how far into the collection it starts.
+    """
+    query = {} if after is None else {"user_id": {"$gt": after}}
+    cursor = db.users.find(query, {"user_id": 1, "_id": 0}).sort("user_id", 1).limit(limit)
+    return [doc["user_id"] for doc in cursor]
+
+def compact_users(db, after=None, limit=500, now=None):
+    """
+    Rewrite stale quota fields for the next batch of users above `after`.
+
+    Expired tokens become 0, daily counters from earlier days are removed
+    and legacy ISO token_expiry strings become timestamps. Readers already
+    treat stale values as zero, so this only keeps dormant documents small
+    and canonical. Each write is guarded on the values it replaces, so a
+    user who was granted tokens or watched a video meanwhile is skipped.
+
+    Returns:
+        tuple: (last user_id scanned or None when done, users rewritten)
+    """
+    now = quota.now() if now is None else now
+    day = quota.today(now)
+    query = {} if after is None else {"user_id": {"$gt": after}}
+    docs = list(
+        db.users.find(query, {"user_id": 1, "tokens": 1, "token_expiry": 1, "limits": 1, "_id": 0})
+        .sort("user_id", 1).limit(limit)
+    )
+    requests = []
+    for doc in docs:
+        guard, update = {"user_id": doc["user_id"]}, {}
+        expiry = doc.get("token_expiry")
+        if isinstance(expiry, str):
+            guard["token_expiry"] = expiry
+            update.setdefault("$set", {})["token_expiry"] = quota.expiry_timestamp(expiry)
+        if doc.get("tokens") and quota.expiry_timestamp(expiry) <= now:
+            guard["token_expiry"] = expiry
+            update.setdefault("$set", {})["tokens"] = 0
+        limits = doc.get("limits")
+        if limits is not None and (limits.get("day") is None or limits["day"] < day):
+            guard["limits"] = limits
+            update["$unset"] = {"limits": ""}
+        if update:
+            requests.append(UpdateOne(guard, update))
+    if requests:
+        result = db.users.bulk_write(requests, ordered=False)
+        compacted = result.modified_count
+    else:
+        compacted = 0
+    return (docs[-1]["user_id"] if len(docs) == limit else None), compacted
+
+def remove_users(db, user_ids):
+    # Users who blocked the bot: their seen-sets go with them
+    db.users.delete_many({"user_id": {"$in": list(user_ids)}})
+    db.seen.delete_many({"user_id": {"$in": list(user_ids)}})
+
+def create_broadcast(db, created_by, text=None, from_chat_id=None, message_id=None):
+    doc = {
+        "created_by": created_by,
+        "text": text,
+        "from_chat_id": from_chat_id,
+        "message_id": message_id,
+        "status": "running",
+        "last_user_id": None,  # checkpoint: every user up to here was handled
+        "sent": 0,
+        "failed": 0,
+        "blocked": 0,
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow(),
+    }
+    doc["_id"] = db.broadcasts.insert_one(doc).inserted_id
+    return doc
+
+def checkpoint_broadcast(db, broadcast_id, last_user_id, sent=0, failed=0, blocked=0):
+    db.broadcasts.update_one({"_id": broadcast_id}, {
+        "$set": {"last_user_id": last_user_id, "updated_at": datetime.utcnow()},
+        "$inc": {"sent": sent, "failed": failed, "blocked": blocked},
     })
 
+def finish_broadcast(db, broadcast_id, status="done"):
+    return db.broadcasts.find_one_and_update(
+        {"_id": broadcast_id},
+        {"$set": {"status": status, "updated_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+
+def get_running_broadcasts(db):
+    return list(db.broadcasts.find({"status": "running"}))
+
 # --- Admin Management (if needed) ---
 def is_admin(user_id, admin_ids):
     return user_id in admin_ids
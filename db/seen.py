@@ -0,0 +1,56 @@
+# db/seen.py
+
+# Bits per stored word. 63 keeps every word a positive signed int64 in BSON.
+WORD_BITS = 63
+
+
+def word_masks(indexes):
+    """
+    Group video indexes into {word_number: bitmask} for a $bit update.
+    """
+    masks = {}
+    for idx in indexes:
+        word, bit = divmod(idx, WORD_BITS)
+        masks[word] = masks.get(word, 0) | (1 << bit)
+    return masks
+
+
+class SeenSet:
+    """
+    Bitmap of the dense per-category video indexes a user has seen.
+
+    Stored in the `seen` collection as {user_id, category, w: {word: bits}},
+    so 10k seen videos cost about 2 KB instead of 10k ids in the user
+    document.
+    """
+
+    def __init__(self, words=None):
+        self.words = words or {}
+
+    @classmethod
+    def from_doc(cls, doc):
+        if not doc:
+            return cls()
+        return cls({int(word): bits for word, bits in doc.get("w", {}).items()})
+
+    def __contains__(self, idx):
+        if idx is None:
+            return False
+        word, bit = divmod(idx, WORD_BITS)
+        return bool(self.words.get(word, 0) >> bit & 1)
+
+    def __len__(self):
+        return sum(bin(bits).count("1") for bits in self.words.values())
+
+    def add(self, idx):
+        word, bit = divmod(idx, WORD_BITS)
+        self.words[word] = self.words.get(word, 0) | (1 << bit)
+
+    def unseen(self, size):
+        """Yield every index below size that is not in the set."""
+        for word in range(0, (size + WORD_BITS - 1) // WORD_BITS):
+            bits = self.words.get(word, 0)
+            base = word * WORD_BITS
+            for bit in range(min(WORD_BITS, size - base)):
+                if not bits >> bit & 1:
+                    yield base + bit
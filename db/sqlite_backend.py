@@ -0,0 +1,473 @@
+# db/sqlite_backend.py
+
+import json
+import random
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import Config
+from db.backend import StorageBackend
+from db.models import SAMPLE_ATTEMPTS, SAMPLE_BATCH
+from db.seen import SeenSet, word_masks
+from db.user_cache import apply_update
+from utils import quota
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    doc TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS categories (
+    name TEXT PRIMARY KEY,
+    channel_id TEXT,
+    video_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS videos (
+    id TEXT PRIMARY KEY,
+    category TEXT NOT NULL,
+    idx INTEGER,
+    file_id TEXT NOT NULL,
+    file_unique_id TEXT,
+    channel_id INTEGER,
+    message_id INTEGER,
+    rand REAL NOT NULL,
+    added_at TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS videos_category_idx ON videos (category, idx) WHERE idx IS NOT NULL;
+CREATE INDEX IF NOT EXISTS videos_category_rand ON videos (category, rand);
+CREATE UNIQUE INDEX IF NOT EXISTS videos_file_unique_id ON videos (file_unique_id)
+    WHERE file_unique_id IS NOT NULL;
+CREATE TABLE IF NOT EXISTS seen (
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    word INTEGER NOT NULL,
+    bits INTEGER NOT NULL,
+    PRIMARY KEY (user_id, category, word)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_by INTEGER,
+    text TEXT,
+    from_chat_id INTEGER,
+    message_id INTEGER,
+    status TEXT NOT NULL,
+    last_user_id INTEGER,
+    sent INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    blocked INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS broadcasts_status ON broadcasts (status);
+"""
+
+# Every statement is a constant string with ? parameters, so sqlite3's
+# per-connection statement cache prepares each one once. Lists are passed
+# as one JSON parameter and expanded with json_each, which keeps IN
+# queries to a single cached statement whatever the list length.
+CATEGORIES_VERSION_KEY = "categories"
+VIDEO_COLUMNS = "id, file_id, category, idx"
+
+SQL_GET_USER = "SELECT doc FROM users WHERE user_id = ?"
+SQL_PUT_USER = "INSERT INTO users (user_id, doc) VALUES (?, ?) ON CONFLICT (user_id) DO UPDATE SET doc = excluded.doc"
+SQL_USERS_AFTER = "SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?"
+SQL_USERS_FIRST = "SELECT user_id FROM users ORDER BY user_id LIMIT ?"
+SQL_USER_DOCS_AFTER = "SELECT user_id, doc FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?"
+SQL_USER_DOCS_FIRST = "SELECT user_id, doc FROM users ORDER BY user_id LIMIT ?"
+SQL_REMOVE_USERS = "DELETE FROM users WHERE user_id IN (SELECT value FROM json_each(?))"
+SQL_REMOVE_SEEN = "DELETE FROM seen WHERE user_id IN (SELECT value FROM json_each(?))"
+
+SQL_GET_SEEN = "SELECT word, bits FROM seen WHERE user_id = ? AND category = ?"
+SQL_MARK_SEEN = (
+    "INSERT INTO seen (user_id, category, word, bits) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (user_id, category, word) DO UPDATE SET bits = bits | excluded.bits"
+)
+
+SQL_CATEGORIES = "SELECT name, channel_id, video_count FROM categories ORDER BY name"
+SQL_GET_CATEGORY = "SELECT name, channel_id, video_count FROM categories WHERE name = ?"
+SQL_ADD_CATEGORY = (
+    "INSERT INTO categories (name, channel_id) VALUES (?, ?) "
+    "ON CONFLICT (name) DO UPDATE SET channel_id = excluded.channel_id WHERE channel_id IS NULL"
+)
+SQL_REMOVE_CATEGORY = "DELETE FROM categories WHERE name = ?"
+SQL_CATEGORY_SIZE = "SELECT video_count FROM categories WHERE name = ?"
+SQL_RESERVE = "UPDATE categories SET video_count = video_count + ? WHERE name = ? RETURNING video_count"
+SQL_GET_VERSION = "SELECT version FROM meta WHERE key = ?"
+SQL_BUMP_VERSION = (
+    "INSERT INTO meta (key, version) VALUES (?, 1) "
+    "ON CONFLICT (key) DO UPDATE SET version = version + 1"
+)
+
+SQL_VIDEOS_FROM = (f"SELECT {VIDEO_COLUMNS} FROM videos WHERE category = ? AND idx >= ? "
+                   "ORDER BY idx LIMIT ?")
+SQL_VIDEOS_UNTIL = (f"SELECT {VIDEO_COLUMNS} FROM videos WHERE category = ? AND idx <= ? "
+                    "ORDER BY idx DESC LIMIT ?")
+SQL_VIDEOS_BY_IDX = (f"SELECT {VIDEO_COLUMNS} FROM videos WHERE category = ? "
+                     "AND idx IN (SELECT value FROM json_each(?))")
+SQL_VIDEO_AT = f"SELECT {VIDEO_COLUMNS} FROM videos WHERE category = ? AND idx = ?"
+SQL_SAMPLE_FROM = (f"SELECT {VIDEO_COLUMNS} FROM videos WHERE category = ? AND rand >= ? "
+                   "ORDER BY rand LIMIT ?")
+SQL_SAMPLE_BEFORE = (f"SELECT {VIDEO_COLUMNS} FROM videos WHERE category = ? AND rand < ? "
+                     "ORDER BY rand LIMIT ?")
+SQL_CATEGORY_VIDEOS = f"SELECT {VIDEO_COLUMNS} FROM videos WHERE category = ?"
+SQL_KNOWN_FILES = ("SELECT file_unique_id FROM videos "
+                   "WHERE file_unique_id IN (SELECT value FROM json_each(?))")
+SQL_INSERT_VIDEO = (
+    "INSERT INTO videos (id, category, idx, file_id, file_unique_id, channel_id, message_id, rand, added_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT DO NOTHING"
+)
+
+SQL_BROADCAST_COLUMNS = ("id, created_by, text, from_chat_id, message_id, status, last_user_id, "
+                         "sent, failed, blocked, created_at, updated_at")
+SQL_CREATE_BROADCAST = (
+    "INSERT INTO broadcasts (created_by, text, from_chat_id, message_id, status, created_at, updated_at) "
+    f"VALUES (?, ?, ?, ?, 'running', ?, ?) RETURNING {SQL_BROADCAST_COLUMNS}"
+)
+SQL_CHECKPOINT_BROADCAST = (
+    "UPDATE broadcasts SET last_user_id = ?, updated_at = ?, "
+    "sent = sent + ?, failed = failed + ?, blocked = blocked + ? WHERE id = ?"
+)
+SQL_FINISH_BROADCAST = (f"UPDATE broadcasts SET status = ?, updated_at = ? WHERE id = ? "
+                        f"RETURNING {SQL_BROADCAST_COLUMNS}")
+SQL_RUNNING_BROADCASTS = f"SELECT {SQL_BROADCAST_COLUMNS} FROM broadcasts WHERE status = 'running'"
+
+
+def _dumps(doc):
+    return json.dumps(doc, separators=(",", ":"), default=str)
+
+
+def _video(row):
+    return {"_id": row[0], "file_id": row[1], "category": row[2], "idx": row[3]}
+
+
+def _category(row):
+    return {"name": row[0], "channel_id": row[1], "video_count": row[2]}
+
+
+def _broadcast(row):
+    if row is None:
+        return None
+    doc = dict(zip(SQL_BROADCAST_COLUMNS.split(", "), row))
+    doc["_id"] = doc.pop("id")
+    doc["created_at"] = datetime.fromisoformat(doc["created_at"])
+    doc["updated_at"] = datetime.fromisoformat(doc["updated_at"])
+    return doc
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Embedded store for single-node deployments: no network hop per query.
+
+    The database runs in WAL mode, so readers never wait for the writer,
+    with synchronous=NORMAL (durable at checkpoints, never corrupt). Each
+    worker thread gets its own connection; writes take the lock up front
+    with BEGIN IMMEDIATE and so queue on busy_timeout instead of failing
+    halfway. User documents are JSON and updated with the same
+    apply_update the user cache uses; seen-sets are one row per 63-bit
+    word, OR-ed in place by an upsert.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path, busy_timeout_ms=5000, cache_size=256):
+        if path == ":memory:":
+            raise ValueError("SQLiteBackend needs a file; each thread opens its own connection")
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size = cache_size
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.executescript(SCHEMA)
+
+    # --- Connections ---
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path, isolation_level=None, check_same_thread=False,
+                cached_statements=self.cache_size,
+            )
+            conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _write(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @contextmanager
+    def _snapshot(self):
+        # A read transaction, so several reads see one consistent state
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    # --- Users ---
+    @staticmethod
+    def _load_user(conn, user_id):
+        row = conn.execute(SQL_GET_USER, (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_user(self, user_id):
+        return self._load_user(self._conn(), user_id)
+
+    def find_and_update_user(self, user_id, update):
+        with self._write() as conn:
+            doc = self._load_user(conn, user_id) or {"user_id": user_id}
+            apply_update(doc, update)
+            conn.execute(SQL_PUT_USER, (user_id, _dumps(doc)))
+        return doc
+
+    def set_user_fields(self, fields_by_user):
+        if not fields_by_user:
+            return
+        with self._write() as conn:
+            for user_id, fields in fields_by_user.items():
+                doc = self._load_user(conn, user_id) or {"user_id": user_id}
+                doc.update(fields)
+                conn.execute(SQL_PUT_USER, (user_id, _dumps(doc)))
+
+    def write_views(self, views, history_size=None):
+        # One transaction: tokens, counters, history and seen bits all land
+        # together, so a failed flush can be retried without double counting
+        history_size = history_size or Config.HISTORY_SIZE
+        day = quota.today()
+        with self._write() as conn:
+            for user_id, view in views.items():
+                doc = self._load_user(conn, user_id)
+                if doc is not None and (view["tokens"] or view["views"] or view["viewed"]):
+                    if view["tokens"]:
+                        doc["tokens"] = max(0, doc.get("tokens", 0) - view["tokens"])
+                    if view["views"]:
+                        quota.add_views(doc, view["views"], day)
+                    if view["viewed"]:
+                        history = doc.get("viewed_videos", []) + view["viewed"]
+                        doc["viewed_videos"] = history[-history_size:]
+                    conn.execute(SQL_PUT_USER, (user_id, _dumps(doc)))
+                for category, indexes in view["seen"].items():
+                    self._mark_seen(conn, user_id, category, indexes)
+
+    def get_user_ids_after(self, after=None, limit=500):
+        conn = self._conn()
+        if after is None:
+            rows = conn.execute(SQL_USERS_FIRST, (limit,))
+        else:
+            rows = conn.execute(SQL_USERS_AFTER, (after, limit))
+        return [row[0] for row in rows]
+
+    def compact_users(self, after=None, limit=500):
+        now = quota.now()
+        day = quota.today(now)
+        compacted = 0
+        with self._write() as conn:
+            if after is None:
+                rows = conn.execute(SQL_USER_DOCS_FIRST, (limit,)).fetchall()
+            else:
+                rows = conn.execute(SQL_USER_DOCS_AFTER, (after, limit)).fetchall()
+            for user_id, raw in rows:
+                doc = json.loads(raw)
+                changed = False
+                expiry = doc.get("token_expiry")
+                if isinstance(expiry, str):
+                    doc["token_expiry"] = quota.expiry_timestamp(expiry)
+                    changed = True
+                if doc.get("tokens") and quota.expiry_timestamp(expiry) <= now:
+                    doc["tokens"] = 0
+                    changed = True
+                limits = doc.get("limits")
+                if limits is not None and (limits.get("day") is None or limits["day"] < day):
+                    del doc["limits"]
+                    changed = True
+                if changed:
+                    conn.execute(SQL_PUT_USER, (user_id, _dumps(doc)))
+                    compacted += 1
+        return (rows[-1][0] if len(rows) == limit else None), compacted
+
+    def remove_users(self, user_ids):
+        ids = json.dumps(list(user_ids))
+        with self._write() as conn:
+            conn.execute(SQL_REMOVE_USERS, (ids,))
+            conn.execute(SQL_REMOVE_SEEN, (ids,))
+
+    # --- Seen-sets ---
+    def get_seen_set(self, user_id, category):
+        return self._seen_set(self._conn(), user_id, category)
+
+    @staticmethod
+    def _seen_set(conn, user_id, category):
+        return SeenSet(dict(conn.execute(SQL_GET_SEEN, (user_id, category)).fetchall()))
+
+    @staticmethod
+    def _mark_seen(conn, user_id, category, indexes):
+        masks = word_masks(idx for idx in indexes if idx is not None)
+        conn.executemany(SQL_MARK_SEEN, [
+            (user_id, category, word, mask) for word, mask in masks.items()
+        ])
+
+    def mark_seen(self, user_id, category, indexes):
+        with self._write() as conn:
+            self._mark_seen(conn, user_id, category, indexes)
+
+    # --- Categories ---
+    def _bump_version(self, conn):
+        conn.execute(SQL_BUMP_VERSION, (CATEGORIES_VERSION_KEY,))
+
+    def get_categories(self):
+        return [_category(row) for row in self._conn().execute(SQL_CATEGORIES)]
+
+    def get_category(self, name):
+        row = self._conn().execute(SQL_GET_CATEGORY, (name,)).fetchone()
+        return _category(row) if row else None
+
+    def add_category(self, name, channel_id):
+        with self._write() as conn:
+            cursor = conn.execute(SQL_ADD_CATEGORY, (name, None if channel_id is None else str(channel_id)))
+            if not cursor.rowcount:
+                raise ValueError(f"Category {name!r} already exists")
+            self._bump_version(conn)
+
+    def remove_category(self, name):
+        with self._write() as conn:
+            conn.execute(SQL_REMOVE_CATEGORY, (name,))
+            self._bump_version(conn)
+
+    @staticmethod
+    def _version(conn):
+        row = conn.execute(SQL_GET_VERSION, (CATEGORIES_VERSION_KEY,)).fetchone()
+        return row[0] if row else 0
+
+    def get_categories_version(self):
+        return self._version(self._conn())
+
+    def load_categories(self):
+        with self._snapshot() as conn:
+            return self._version(conn), [_category(row) for row in conn.execute(SQL_CATEGORIES)]
+
+    def get_category_size(self, category):
+        row = self._conn().execute(SQL_CATEGORY_SIZE, (category,)).fetchone()
+        return row[0] if row else 0
+
+    def _reserve(self, conn, category, count):
+        row = conn.execute(SQL_RESERVE, (count, category)).fetchone()
+        if row is None:
+            raise LookupError(f"Unknown category {category!r}")
+        return row[0] - count
+
+    # --- Videos ---
+    def get_videos(self, category, cursor=0, limit=1, direction=1):
+        if direction > 0:
+            return [_video(row) for row in self._conn().execute(SQL_VIDEOS_FROM, (category, cursor, limit))]
+        rows = self._conn().execute(SQL_VIDEOS_UNTIL, (category, cursor, limit)).fetchall()
+        return [_video(row) for row in reversed(rows)]
+
+    def get_videos_by_idx(self, category, indexes):
+        rows = self._conn().execute(SQL_VIDEOS_BY_IDX, (category, json.dumps(list(indexes))))
+        return [_video(row) for row in rows]
+
+    def get_unseen_video(self, user_id, category):
+        # Same sampler as models.sample_unseen_video, on the (category, rand) index
+        with self._snapshot() as conn:
+            seen = self._seen_set(conn, user_id, category)
+            for _ in range(SAMPLE_ATTEMPTS):
+                pivot = random.random()
+                batch = conn.execute(SQL_SAMPLE_FROM, (category, pivot, SAMPLE_BATCH)).fetchall()
+                if len(batch) < SAMPLE_BATCH:
+                    batch += conn.execute(
+                        SQL_SAMPLE_BEFORE, (category, pivot, SAMPLE_BATCH - len(batch))
+                    ).fetchall()
+                unseen = [row for row in batch if row[3] not in seen]
+                if unseen:
+                    return _video(random.choice(unseen))
+                if len(batch) < SAMPLE_BATCH:
+                    return None
+
+            row = conn.execute(SQL_CATEGORY_SIZE, (category,)).fetchone()
+            candidates = list(seen.unseen(row[0] if row else 0))
+            random.shuffle(candidates)
+            for idx in candidates[:SAMPLE_ATTEMPTS]:
+                row = conn.execute(SQL_VIDEO_AT, (category, idx)).fetchone()
+                if row:
+                    return _video(row)
+
+            for row in conn.execute(SQL_CATEGORY_VIDEOS, (category,)):
+                if row[3] not in seen:
+                    return _video(row)
+            return None
+
+    def add_video(self, video_id, category, file_id):
+        with self._write() as conn:
+            idx = self._reserve(conn, category, 1)
+            conn.execute(SQL_INSERT_VIDEO, (
+                str(video_id), category, idx, file_id, None, None, None,
+                random.random(), datetime.utcnow().isoformat(),
+            ))
+
+    def ingest_videos(self, category, videos):
+        by_key = {video["file_unique_id"]: video for video in videos}
+        with self._write() as conn:
+            known = {row[0] for row in conn.execute(SQL_KNOWN_FILES, (json.dumps(list(by_key)),))}
+            new = [video for key, video in by_key.items() if key not in known]
+            if not new:
+                return 0
+            start = self._reserve(conn, category, len(new))
+            added_at = datetime.utcnow().isoformat()
+            before = conn.total_changes
+            conn.executemany(SQL_INSERT_VIDEO, [
+                (video["file_unique_id"], category, start + i, video["file_id"],
+                 video["file_unique_id"], video.get("channel_id"), video.get("message_id"),
+                 random.random(), added_at)
+                for i, video in enumerate(new)
+            ])
+            return conn.total_changes - before
+
+    # --- Broadcasts ---
+    def create_broadcast(self, created_by, text=None, from_chat_id=None, message_id=None):
+        now = datetime.utcnow().isoformat()
+        with self._write() as conn:
+            return _broadcast(conn.execute(
+                SQL_CREATE_BROADCAST, (created_by, text, from_chat_id, message_id, now, now)
+            ).fetchone())
+
+    def checkpoint_broadcast(self, broadcast_id, last_user_id, sent=0, failed=0, blocked=0):
+        with self._write() as conn:
+            conn.execute(SQL_CHECKPOINT_BROADCAST, (
+                last_user_id, datetime.utcnow().isoformat(), sent, failed, blocked, broadcast_id,
+            ))
+
+    def finish_broadcast(self, broadcast_id, status="done"):
+        with self._write() as conn:
+            return _broadcast(conn.execute(
+                SQL_FINISH_BROADCAST, (status, datetime.utcnow().isoformat(), broadcast_id)
+            ).fetchone())
+
+    def get_running_broadcasts(self):
+        return [_broadcast(row) for row in self._conn().execute(SQL_RUNNING_BROADCASTS)]
@@ -0,0 +1,248 @@
+# db/user_cache.py
+
+import asyncio
+import copy
+import logging
+import time
+from collections import OrderedDict
+
+from utils.quota import add_views
+
+
+def apply_update(doc, update):
+    """
+    Apply a Mongo-style update ($set, $inc, $max, $push) to a local document.
+
+    Only the operators the bot issues are supported; anything else makes
+    the caller drop its cached copy.
+    """
+    for op, fields in update.items():
+        if op == "$set":
+            doc.update(fields)
+        elif op == "$inc":
+            for field, amount in fields.items():
+                doc[field] = doc.get(field, 0) + amount
+        elif op == "$max":
+            for field, value in fields.items():
+                if field not in doc or doc[field] < value:
+                    doc[field] = value
+        elif op == "$push":
+            for field, value in fields.items():
+                items = doc.setdefault(field, [])
+                if isinstance(value, dict) and "$each" in value:
+                    items.extend(value["$each"])
+                    if "$slice" in value:
+                        doc[field] = items[value["$slice"]:]
+                else:
+                    items.append(value)
+        else:
+            raise ValueError(f"Unsupported update operator: {op}")
+    return doc
+
+
+class UserCache:
+    """
+    In-process LRU cache of user documents with a per-entry TTL.
+
+    Callers always get a copy, so staging changes on a document never
+    mutates the cached one behind the database's back.
+    """
+
+    def __init__(self, max_size=10000, ttl=300, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # user_id -> (expires_at, doc)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, doc = entry
+        if expires_at <= self._clock():
+            del self._entries[user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return copy.deepcopy(doc)
+
+    def put(self, user_id, doc):
+        if doc is None:
+            self._entries.pop(user_id, None)
+            return
+        self._entries[user_id] = (self._clock() + self.ttl, copy.deepcopy(doc))
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def apply(self, user_id, update):
+        """Apply an update to the cached copy, if there is one."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return
+        try:
+            apply_update(entry[1], update)
+        except ValueError:
+            del self._entries[user_id]
+
+    def invalidate(self, user_id):
+        self._entries.pop(user_id, None)
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class WriteBehind:
+    """
+    Buffers $set fields per user and flushes them after a short delay.
+
+    A burst of updates to the same user within the delay collapses into a
+    single write. Pending fields are kept independently of the cache so an
+    eviction never loses them, and a batch being written stays visible to
+    pending() until the write has completed.
+    """
+
+    def __init__(self, write, delay=2.0):
+        self._write = write  # async callable(dict[user_id, fields])
+        self.delay = delay
+        self._pending = {}
+        self._inflight = {}  # the batch being written now
+        self._flushing = asyncio.Lock()
+        self._timer = None
+        self._task = None
+        self.flushes = 0
+        self.generation = 0  # moves whenever a write starts or ends
+
+    def __len__(self):
+        return len(self._pending)
+
+    def pending(self, user_id):
+        """Fields not yet written for this user, including those being written now."""
+        writing = self._inflight.get(user_id)
+        newer = self._pending.get(user_id)
+        if writing is None:
+            return newer
+        return writing if newer is None else self._merge(writing, newer)
+
+    async def settle(self, user_id):
+        """Wait until no write in flight holds fields for this user."""
+        while user_id in self._inflight:
+            async with self._flushing:
+                pass
+
+    def discard(self, user_id):
+        """Drop this user's unwritten fields, e.g. because the user was removed."""
+        self._pending.pop(user_id, None)
+
+    def _merge(self, older, newer):
+        """Combine two pending entries for one user; newer fields win."""
+        return {**older, **newer}
+
+    def defer(self, user_id, fields):
+        older = self._pending.get(user_id)
+        self._pending[user_id] = dict(fields) if older is None else self._merge(older, fields)
+        if self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.delay, self._start_flush)
+
+    def _start_flush(self):
+        self._timer = None
+        self._task = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Write every pending user now."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        async with self._flushing:
+            if not self._pending:
+                return
+            batch = self._inflight = self._pending
+            self._pending = {}
+            self.generation += 1
+            try:
+                await self._write(batch)
+                self.flushes += 1
+            except Exception as e:
+                logging.error(f"❌ Write-behind flush failed: {e}")
+                # Keep newer values that arrived while we were writing
+                for user_id, fields in batch.items():
+                    newer = self._pending.get(user_id)
+                    self._pending[user_id] = fields if newer is None else self._merge(fields, newer)
+                if self._timer is None:
+                    loop = asyncio.get_running_loop()
+                    self._timer = loop.call_later(self.delay, self._start_flush)
+            finally:
+                self._inflight = {}
+                self.generation += 1
+
+
+class ViewBuffer(WriteBehind):
+    """
+    Coalesces view accounting per user: tokens spent, views counted against
+    the daily limit, file_ids for the viewed_videos ring and seen-set bits,
+    merged over `delay` seconds and written by one flush for every user.
+
+    Entries look like {"tokens": 2, "views": 2, "viewed": [file_id, ...],
+    "seen": {category: {idx, ...}}}.
+    """
+
+    def __init__(self, write, delay=1.0, history_size=50):
+        super().__init__(write, delay)
+        self.history_size = history_size
+
+    def _merge(self, older, newer):
+        seen = {category: set(indexes) for category, indexes in older["seen"].items()}
+        for category, indexes in newer["seen"].items():
+            seen.setdefault(category, set()).update(indexes)
+        return {
+            "tokens": older["tokens"] + newer["tokens"],
+            "views": older["views"] + newer["views"],
+            "viewed": (older["viewed"] + newer["viewed"])[-self.history_size:],
+            "seen": seen,
+        }
+
+    def record(self, user_id, category, idx, file_id, tokens=1):
+        self.defer(user_id, {
+            "tokens": tokens,
+            "views": 1,
+            "viewed": [file_id],
+            "seen": {category: {idx}} if idx is not None else {},
+        })
+
+    def forget_tokens(self, user_id):
+        """Drop pending token spend, e.g. because tokens were just reset."""
+        entry = self._pending.get(user_id)
+        if entry is not None:
+            entry["tokens"] = 0
+
+    def overlay(self, user_id, doc):
+        """
+        Apply pending views to a document freshly read from Mongo.
+
+        Views are increments, so the read must not overlap a write of this
+        user's views (see Database.get_user); a batch still being written
+        is then known to be missing from the document and is applied too.
+        """
+        entry = self.pending(user_id)
+        if entry is None:
+            return doc
+        doc["tokens"] = max(0, doc.get("tokens", 0) - entry["tokens"])
+        add_views(doc, entry["views"])
+        doc["viewed_videos"] = (doc.get("viewed_videos", []) + entry["viewed"])[-self.history_size:]
+        return doc
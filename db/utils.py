@@ -1,25 +1,22 @@
 # db/utils.py
 
-from pymongo import MongoClient
-from config import MONGODB_URI
-from datetime import datetime
+from db.connection import MongoConnection
 
 # --- MongoDB Initialization ---
 
-def init_db(uri=MONGODB_URI, db_name="telegram_video_bot"):
+def init_db(uri=None, db_name=None):
     """
-    Initialize and return a MongoDB database instance.
+    Return a MongoDB database instance from the shared connection.
     
     Args:
-        uri (str): MongoDB connection URI.
-        db_name (str): Name of the database to use.
+        uri (str): MongoDB connection URI; defaults to Config.MONGO_URI.
+        db_name (str): Name of the database to use; defaults to the one in
+            the URI, then Config.DB_NAME.
         
     Returns:
         Database: pymongo Database instance.
     """
-    client = MongoClient(uri)
-    db = client[db_name]
-    return db
+    return MongoConnection.connect(uri, db_name)
 
 # --- Utility Functions ---
 
@@ -39,13 +36,10 @@ def get_or_create_user(db, user_id):
         user = {
             "user_id": user_id,
             "is_premium": False,
-            "history": [],
+            "viewed_videos": [],
             "selected_category": None,
             "tokens": 0,
-            "limits": {
-                "daily": 0,
-                "last_reset": None
-            }
+            "token_expiry": 0
         }
         db.users.insert_one(user)
     return user
@@ -75,17 +69,3 @@ def is_user_admin(user_id, admin_ids):
         bool: True if user is admin, False otherwise.
     """
     return user_id in admin_ids
-
-def reset_user_limits(db, user_id):
-    """
-    Reset the daily usage limits for a user.
-    
-    Args:
-        db (Database): MongoDB database instance.
-        user_id (int): Telegram user ID.
-    """
-    db.users.update_one(
-        {"user_id": user_id},
-        {"$set": {"limits.daily": 0, "limits.last_reset": datetime.utcnow()}}
-    )
-    
@@ -4,10 +4,16 @@ from .user import (
     navigation_callback,
     category_callback,
     show_categories_callback,  # Added this import
+    noop_callback,
+    shuffle_command,
 )
 
 from .admin import (
     add_category_command,
     remove_category_command,
+    backfill_command,
+    broadcast_command,
     admin_callback,
 )
+
+from .channel import channel_post_handler
@@ -2,12 +2,15 @@
 
 from telegram import Update
 from telegram.ext import ContextTypes
-from db.models import add_category, remove_category, get_category
-from config import ADMIN_IDS
+from db.database import Database
+from config import Config
+from services.broadcast import broadcasts
+from services.ingest import ingester
+from services.category_registry import category_registry
 
 # --- Helper: Check if user is admin ---
 def is_admin(user_id):
-    return user_id in ADMIN_IDS
+    return user_id in Config.ADMIN_IDS
 
 # --- /addcategory command ---
 async def add_category_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -23,13 +26,19 @@ async def add_category_command(update: Update, context: ContextTypes.DEFAULT_TYP
 
     category_name = args[0]
     channel_id = args[1]
-    db = context.bot_data['db_client']
 
-    if get_category(db, category_name):
+    if category_name in category_registry:
         await update.message.reply_text(f"Category '{category_name}' already exists.")
         return
 
-    add_category(db, category_name, channel_id)
+    try:
+        await Database.add_category(category_name, channel_id)
+    except ValueError:
+        # Added on another replica since our registry last reloaded
+        await category_registry.reload()
+        await update.message.reply_text(f"Category '{category_name}' already exists.")
+        return
+    await category_registry.reload()
     await update.message.reply_text(f"✅ Category '{category_name}' added with channel ID {channel_id}.")
 
 # --- /removecategory command ---
@@ -45,15 +54,64 @@ async def remove_category_command(update: Update, context: ContextTypes.DEFAULT_
         return
 
     category_name = args[0]
-    db = context.bot_data['db_client']
 
-    if not get_category(db, category_name):
+    if category_name not in category_registry:
         await update.message.reply_text(f"Category '{category_name}' does not exist.")
         return
 
-    remove_category(db, category_name)
+    await Database.remove_category(category_name)
+    await category_registry.reload()
     await update.message.reply_text(f"✅ Category '{category_name}' removed.")
 
+# --- /backfill command ---
+async def backfill_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if not is_admin(user_id):
+        await update.message.reply_text("❌ You are not authorized to use this command.")
+        return
+
+    args = context.args
+    if len(args) < 3 or not args[1].isdigit() or not args[2].isdigit():
+        await update.message.reply_text("Usage: /backfill <category_name> <first_message_id> <last_message_id>")
+        return
+
+    category_name = args[0]
+    first, last = int(args[1]), int(args[2])
+    category = category_registry.get(category_name)
+    if not category or not category.get("channel_id"):
+        await update.message.reply_text(f"Category '{category_name}' has no channel.")
+        return
+
+    ingester.start_backfill(
+        context.bot, category_name, category["channel_id"], first, last, update.effective_chat.id
+    )
+    await update.message.reply_text(
+        f"📥 Backfilling '{category_name}' from messages {first}-{last}. "
+        "Forwarded copies will appear and disappear here while it runs."
+    )
+
+# --- /broadcast command ---
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if not is_admin(user_id):
+        await update.message.reply_text("❌ You are not authorized to use this command.")
+        return
+
+    message = update.message
+    if message.reply_to_message:
+        # Copy the replied-to message, so media and formatting go out as-is
+        broadcast = await Database.create_broadcast(
+            user_id, from_chat_id=message.chat_id, message_id=message.reply_to_message.message_id
+        )
+    elif context.args:
+        broadcast = await Database.create_broadcast(user_id, text=message.text.split(None, 1)[1])
+    else:
+        await message.reply_text("Usage: /broadcast <text>, or reply to a message with /broadcast")
+        return
+
+    broadcasts.start(context.bot, broadcast)
+    await message.reply_text(f"📣 Broadcast {broadcast['_id']} started. I'll report back when it's done.")
+
 # --- Admin callback (for future admin inline actions) ---
 async def admin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -0,0 +1,15 @@
+# handlers/channel.py
+
+from telegram import Update
+from telegram.ext import ContextTypes
+from services.ingest import ingester, video_entry
+
+# --- Channel posts: videos posted in a category's channel join that category ---
+async def channel_post_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    message = update.channel_post
+    category = ingester.category_for(message.chat)
+    if category is None:
+        return  # not a registered category channel
+    video = video_entry(message)
+    if video is not None:
+        ingester.add(category, video)
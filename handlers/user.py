@@ -1,47 +1,83 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaVideo
+from telegram import Update, InputMediaVideo
 from telegram.ext import ContextTypes
-from datetime import datetime, timedelta
 from config import Config
-from database import Database
-from keyboards import main_keyboard, expired_keyboard
+from keyboards import main_keyboard, expired_keyboard, category_keyboards
+from services.category_registry import category_registry
+from helper import verify_access_token
 from services.url_shortener import generate_24h_token_url
+from services.playlist import playlists
+from services.video_window import video_windows
+from services.prefetch import next_videos
+from utils.user_context import get_user_context, with_user_context
+from utils import quota
 
+@with_user_context
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    user = Database.get_user(user_id)
+    # Refresh links open the bot with /start token_<signed token>
+    if context.args and context.args[0].startswith("token_"):
+        await redeem_token(update, context, context.args[0][len("token_"):])
+        return
+
+    user = await get_user_context(update, context)
     
-    if not user:
-        new_user = {
-            "user_id": user_id,
+    if not user.exists:
+        user.create({
+            "user_id": user.user_id,
             "tokens": Config.INITIAL_TOKENS,
-            "token_expiry": (datetime.now() + timedelta(hours=Config.TOKEN_EXPIRY_HOURS)).isoformat(),
+            "token_expiry": quota.now() + Config.TOKEN_EXPIRY_HOURS * 3600,
             "subscription": False,
             "cursor": 0,
             "current_category": Config.DEFAULT_CATEGORY,
             "viewed_videos": []
-        }
-        Database.update_user(user_id, new_user)
+        })
         await update.message.reply_text(
             f"🎥 Welcome! You've received {Config.INITIAL_TOKENS} free tokens "
             f"(valid for {Config.TOKEN_EXPIRY_HOURS} hours)"
         )
     else:
-        remaining_time = datetime.fromisoformat(user['token_expiry']) - datetime.now()
-        hours = max(0, int(remaining_time.total_seconds() // 3600))
+        remaining = quota.expiry_timestamp(user.get('token_expiry')) - quota.now()
+        hours = max(0, remaining // 3600)
         await update.message.reply_text(
-            f"👋 Welcome back! Tokens: {user.get('tokens', 0)} "
+            f"👋 Welcome back! Tokens: {quota.tokens_left(user)} "
             f"(expires in {hours} hours)"
         )
     
     await send_current_video(update, context)
 
+async def redeem_token(update: Update, context: ContextTypes.DEFAULT_TYPE, token: str):
+    # Forged or expired tokens are rejected in memory, before any Mongo access
+    claims = verify_access_token(token, Config.TOKEN_KEYS)
+    if not claims or claims[0] != update.effective_user.id:
+        await update.message.reply_text("❌ This access link is invalid or has expired.")
+        return
+
+    user = await get_user_context(update, context)
+    _user_id, expiry = claims
+    if not user.exists:
+        await update.message.reply_text("Send /start first.")
+        return
+    # Links expire in order, so one not newer than the last redeemed is a replay
+    if expiry <= (user.get('redeemed_token_expiry') or 0):
+        await update.message.reply_text("This access link has already been used.")
+        return
+
+    user.set(
+        tokens=Config.INITIAL_TOKENS,
+        token_expiry=expiry,
+        redeemed_token_expiry=expiry,
+    )
+    await update.message.reply_text(
+        f"✅ Access refreshed! You have {Config.INITIAL_TOKENS} tokens."
+    )
+    await send_current_video(update, context)
+
 async def send_current_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    user = Database.get_user(user_id)
+    user = await get_user_context(update, context)
     
     if not check_access(user):
-        short_url, expiry = generate_24h_token_url(context.bot.username, user_id)
-        Database.update_user(user_id, {"token_expiry": expiry.isoformat()})
+        short_url, _expiry = await generate_24h_token_url(
+            context.bot.username, user.user_id, user.get('redeemed_token_expiry') or 0
+        )
         await update.message.reply_text(
             f"🕒 Your access token expired!\n\n"
             f"Click the link below to refresh your access for 24 hours:\n\n"
@@ -50,98 +86,189 @@ async def send_current_video(update: Update, context: ContextTypes.DEFAULT_TYPE)
             reply_markup=expired_keyboard()
         )
         return
+    if over_daily_limit(user):
+        await update.message.reply_text(DAILY_LIMIT_TEXT)
+        return
 
-    videos = Database.get_videos(user['current_category'], user['cursor'])
+    video = await current_video(user, user['current_category'])
     
-    if videos:
+    if video:
         await update.message.reply_video(
-            video=videos[0]['file_id'],
+            video=video['file_id'],
             caption=f"Category: {user['current_category']}",
             reply_markup=main_keyboard(user['current_category'])
         )
-        # Mark video as viewed
-        Database.update_user(user_id, {
-            "$push": {"viewed_videos": videos[0]['file_id']},
-            "$inc": {"tokens": -1}
-        })
+        mark_viewed(user, video)
     else:
         await update.message.reply_text(
             "No videos available in this category.",
             reply_markup=main_keyboard()
         )
 
+@with_user_context
+async def get_video_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = await get_user_context(update, context)
+    if not user.exists:
+        await update.message.reply_text("Send /start first.")
+        return
+    await send_current_video(update, context)
+
+@with_user_context
 async def navigation_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    user_id = query.from_user.id
-    user = Database.get_user(user_id)
+    user = await get_user_context(update, context)
     
+    if not user.exists:
+        await show_text(query, "Send /start first.")
+        return
     if not check_access(user):
-        short_url, expiry = generate_24h_token_url(context.bot.username, user_id)
-        Database.update_user(user_id, {"token_expiry": expiry.isoformat()})
-        await query.edit_message_text(
-            f"🕒 Your access token expired!\n\n"
-            f"Click the link below to refresh your access for 24 hours:\n\n"
-            f"{short_url}\n\n"
-            f"After opening the link, come back and use the bot again.",
-            reply_markup=expired_keyboard()
-        )
+        await show_expired(query, context, user)
+        return
+    if over_daily_limit(user):
+        await show_text(query, DAILY_LIMIT_TEXT, reply_markup=main_keyboard())
         return
 
     action = query.data
-    new_category = None
+    category = user['current_category']
     
-    if action == 'next':
-        user['cursor'] += 1
-    elif action == 'prev':
-        user['cursor'] = max(0, user['cursor'] - 1)
-    elif action.startswith('cat_'):
-        new_category = action.split('_')[1]
-        user['current_category'] = new_category
-        user['cursor'] = 0
-
-    Database.update_user(user_id, user)
-    await update_video_display(query, user_id)
-
-async def update_video_display(query, user_id):
-    user = Database.get_user(user_id)
-    videos = Database.get_videos(user['current_category'], user['cursor'])
-    
-    if videos:
-        await query.edit_message_media(
-            InputMediaVideo(
-                videos[0]['file_id'],
-                caption=f"Category: {user['current_category']}"
-            ),
-            reply_markup=main_keyboard(user['current_category'])
-        )
-        # Mark video as viewed
-        Database.update_user(user_id, {
-            "$push": {"viewed_videos": videos[0]['file_id']},
-            "$inc": {"tokens": -1}
-        })
+    # The keyboard sends "next_"/"prev_"/"cur_", so match on the prefix
+    if action.startswith('next'):
+        video = await step_video(user, category, 1)
+    elif action.startswith('prev'):
+        video = await step_video(user, category, -1)
     else:
-        await query.edit_message_text(
-            "End of list 🏁",
-            reply_markup=main_keyboard()
-        )
+        video = await current_video(user, category)
+
+    await update_video_display(query, user, video)
+
+@with_user_context
+async def category_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    user = await get_user_context(update, context)
+
+    if not user.exists:
+        await show_text(query, "Send /start first.")
+        return
+    if not check_access(user):
+        await show_expired(query, context, user)
+        return
+    if over_daily_limit(user):
+        await show_text(query, DAILY_LIMIT_TEXT, reply_markup=main_keyboard())
+        return
+
+    category = query.data[len("category_"):]
+    if category not in category_registry:
+        # Stale keyboard from before the category was removed
+        await query.edit_message_reply_markup(reply_markup=category_keyboards.page(0))
+        return
+    user.set(current_category=category, cursor=0)
+    video = await current_video(user, category)
+    await update_video_display(query, user, video)
+
+async def show_text(query, text, reply_markup=None):
+    # Video messages have a caption instead of text
+    if query.message and query.message.text is None:
+        await query.edit_message_caption(text, reply_markup=reply_markup)
+    else:
+        await query.edit_message_text(text, reply_markup=reply_markup)
+
+async def show_expired(query, context, user):
+    short_url, _expiry = await generate_24h_token_url(
+        context.bot.username, user.user_id, user.get('redeemed_token_expiry') or 0
+    )
+    await show_text(
+        query,
+        f"🕒 Your access token expired!\n\n"
+        f"Click the link below to refresh your access for 24 hours:\n\n"
+        f"{short_url}\n\n"
+        f"After opening the link, come back and use the bot again.",
+        reply_markup=expired_keyboard()
+    )
+
+async def update_video_display(query, user, video):
+    if video:
+        caption = f"Category: {user['current_category']}"
+        if query.message and query.message.text is not None:
+            # A text message cannot be turned into a video; send a new one
+            await query.message.reply_video(
+                video=video['file_id'], caption=caption,
+                reply_markup=main_keyboard(user['current_category'])
+            )
+        else:
+            await query.edit_message_media(
+                InputMediaVideo(video['file_id'], caption=caption),
+                reply_markup=main_keyboard(user['current_category'])
+            )
+        mark_viewed(user, video)
+    else:
+        await show_text(query, "End of list 🏁", reply_markup=main_keyboard())
 
 async def show_categories_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    categories = Database.get_categories()
-    keyboard = [
-        [InlineKeyboardButton(cat['name'], callback_data=f"cat_{cat['name']}")]
-        for cat in categories
-    ]
-    await query.edit_message_text(
-        "Select a category:",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+    # "show_categories" or "show_categories_<page>"
+    page = query.data[len("show_categories_"):]
+    keyboard = category_keyboards.page(int(page) if page.isdigit() else 0)
+    if query.message and query.message.text is None:
+        # Under a video only the keyboard changes; the video stays on screen
+        await query.edit_message_reply_markup(reply_markup=keyboard)
+    else:
+        await query.edit_message_text("Select a category:", reply_markup=keyboard)
+
+async def noop_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Page counters and placeholders; just stop the button's spinner
+    await update.callback_query.answer()
+
+@with_user_context
+async def shuffle_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = await get_user_context(update, context)
+    if not user.exists:
+        await update.message.reply_text("Send /start first.")
+        return
+    shuffle = not user.get('shuffle', False)
+    user.set(shuffle=shuffle)
+    await update.message.reply_text(
+        "🔀 Shuffle on: videos play in random order without repeats."
+        if shuffle else
+        "➡️ Shuffle off: videos play in order."
     )
 
+async def current_video(user, category):
+    if user.get('shuffle'):
+        return await playlists.current(user, category)
+    return await video_windows.current(user.user_id, category, user['cursor'])
+
+async def step_video(user, category, direction):
+    # A press right after a display usually finds its video already selected
+    video = await next_videos.take(user, category, direction)
+    if video is not None:
+        return video
+    return await select_video(user, category, direction)
+
+async def select_video(user, category, direction):
+    if user.get('shuffle'):
+        return await playlists.step(user, category, direction)
+    return await video_windows.step(user.user_id, category, user['cursor'], direction)
+
+def mark_viewed(user, video):
+    # The cursor is the idx of the video on screen, used as the keyset key;
+    # token spend, history and seen bits are coalesced by the view buffer
+    user.set(cursor=video['idx'])
+    user.record_view(user['current_category'], video)
+    next_videos.schedule(user, user['current_category'], select_video)
+
 def check_access(user):
+    # Tokens of an expired grant read as zero; nothing resets them in Mongo
     if user.get('subscription'):
         return True
-    if user.get('tokens', 0) > 0 and datetime.fromisoformat(user['token_expiry']) > datetime.now():
-        return True
-    return False
\ No newline at end of file
+    return quota.tokens_left(user) > 0
+
+DAILY_LIMIT_TEXT = "📅 You've reached today's video limit. Come back tomorrow!"
+
+def over_daily_limit(user):
+    # Yesterday's counter reads as zero, so the limit lifts at UTC midnight
+    if not Config.DAILY_VIEW_LIMIT or user.get('subscription'):
+        return False
+    return quota.views_today(user) >= Config.DAILY_VIEW_LIMIT
\ No newline at end of file
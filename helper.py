@@ -1,6 +1,10 @@
 import base64
+import binascii
+import hashlib
+import hmac
+import struct
 import time
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 def str_to_b64(s: str) -> str:
     """Encode a string to a URL-safe base64 string."""
@@ -21,3 +25,55 @@ def b64_to_str(b64: str) -> Optional[str]:
 def get_current_time() -> int:
     """Get current UNIX timestamp in seconds."""
     return int(time.time())
+
+# --- Signed access tokens ---
+
+# version/key id (1) | user_id (8, signed) | expiry (4, unix seconds)
+TOKEN_HEADER = struct.Struct(">BqI")
+TOKEN_MAC_SIZE = 10
+TOKEN_SIZE = TOKEN_HEADER.size + TOKEN_MAC_SIZE
+
+def parse_token_keys(spec: str) -> Dict[int, bytes]:
+    """Parse "kid:secret,kid:secret" into {kid: secret}, keeping order."""
+    keys = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        kid, _, secret = item.partition(":")
+        if not 0 <= int(kid) <= 255 or not secret:
+            raise ValueError(f"Invalid token key entry: {item!r}")
+        keys[int(kid)] = secret.encode('utf-8')
+    return keys
+
+def _token_mac(key: bytes, header: bytes) -> bytes:
+    return hmac.new(key, header, hashlib.sha256).digest()[:TOKEN_MAC_SIZE]
+
+def sign_access_token(user_id: int, expiry: int, key_id: int, keys: Dict[int, bytes]) -> str:
+    """
+    Build a compact signed token: a fixed 13-byte header plus a truncated
+    HMAC-SHA256, URL-safe base64 without padding (31 chars).
+    """
+    header = TOKEN_HEADER.pack(key_id, user_id, expiry)
+    raw = header + _token_mac(keys[key_id], header)
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+def verify_access_token(token: str, keys: Dict[int, bytes], now: Optional[int] = None) -> Optional[Tuple[int, int]]:
+    """Verify a signed token with no I/O.
+
+    Returns (user_id, expiry) if the signature matches a known key and the
+    token has not expired, otherwise None.
+    """
+    if len(token) != 31:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=')
+    except (ValueError, binascii.Error):
+        return None
+    if len(raw) != TOKEN_SIZE:
+        return None
+    header, mac = raw[:TOKEN_HEADER.size], raw[TOKEN_HEADER.size:]
+    key_id, user_id, expiry = TOKEN_HEADER.unpack(header)
+    key = keys.get(key_id)
+    if key is None or not hmac.compare_digest(mac, _token_mac(key, header)):
+        return None
+    if expiry <= (get_current_time() if now is None else now):
+        return None
+    return user_id, expiry
@@ -0,0 +1,9 @@
+# keyboards/__init__.py
+
+from .inline import (
+    video_navigation_keyboard,
+    category_keyboard,
+    main_keyboard,
+    expired_keyboard,
+)
+from .cache import category_keyboards
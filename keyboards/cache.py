@@ -0,0 +1,32 @@
+# keyboards/cache.py
+
+from keyboards.inline import CATEGORY_PAGE_SIZE, category_keyboard, main_keyboard
+from services.category_registry import category_registry
+
+
+class CategoryKeyboards:
+    """
+    Every page of the category keyboard, built from the category registry
+    and reused until the registry's version changes.
+
+    Pages are rebuilt lazily on the first tap after a change, whichever
+    replica made it; the memoised per-category keyboards are dropped too.
+    """
+
+    def __init__(self, registry, page_size=CATEGORY_PAGE_SIZE):
+        self.registry = registry
+        self.page_size = page_size
+        self._pages = []
+        self._version = None
+
+    def page(self, number=0):
+        if self._version != self.registry.version:
+            categories = self.registry.all()
+            count = max(1, (len(categories) + self.page_size - 1) // self.page_size)
+            self._pages = [category_keyboard(categories, page, self.page_size) for page in range(count)]
+            self._version = self.registry.version
+            main_keyboard.cache_clear()
+        return self._pages[min(max(number, 0), len(self._pages) - 1)]
+
+
+category_keyboards = CategoryKeyboards(category_registry)
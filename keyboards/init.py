@@ -1,3 +0,0 @@
-# keyboards/__init__.py
-
-from .inline import video_navigation_keyboard, category_keyboard
@@ -1,38 +1,84 @@
+from functools import lru_cache
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton
 
+# Markups are immutable, so one instance can be sent any number of times.
+# Static keyboards are built once here; per-category ones are memoised.
+
+CATEGORY_PAGE_SIZE = 8
+
+_NAVIGATION_ROW = [
+    InlineKeyboardButton("⬅️ Previous", callback_data="prev_"),
+    InlineKeyboardButton("➡️ Next", callback_data="next_"),
+]
+
+NAVIGATION_KEYBOARD = InlineKeyboardMarkup([
+    _NAVIGATION_ROW,
+    [InlineKeyboardButton("📂 Category", callback_data="show_categories")],
+])
+
+EXPIRED_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 I've refreshed my access", callback_data="cur_")],
+])
+
+NO_CATEGORIES_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("No categories found", callback_data="none")],
+])
+
 def video_navigation_keyboard():
     """
     Returns an inline keyboard with Previous, Next, and Category buttons.
     """
-    keyboard = [
-        [
-            InlineKeyboardButton("⬅️ Previous", callback_data="prev_"),
-            InlineKeyboardButton("➡️ Next", callback_data="next_"),
-        ],
-        [
-            InlineKeyboardButton("📂 Category", callback_data="show_categories")
-        ]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    return NAVIGATION_KEYBOARD
 
-def category_keyboard(categories):
+def expired_keyboard():
     """
-    Returns an inline keyboard for category selection.
+    Keyboard shown with the refresh link; re-checks access when tapped.
+    """
+    return EXPIRED_KEYBOARD
+
+@lru_cache(maxsize=256)
+def main_keyboard(category=None):
+    """
+    Keyboard under a video: navigation plus a category button showing the
+    current category. Memoised per category.
+    """
+    if category is None:
+        return NAVIGATION_KEYBOARD
+    return InlineKeyboardMarkup([
+        _NAVIGATION_ROW,
+        [InlineKeyboardButton(f"📂 Category: {category}", callback_data="show_categories")],
+    ])
+
+def category_keyboard(categories, page=0, page_size=CATEGORY_PAGE_SIZE):
+    """
+    Returns one page of the category selection keyboard.
 
     :param categories: List of category dicts, each with a 'name' key.
+    :param page: Zero-based page; out of range pages are clamped.
     """
     if not isinstance(categories, list):
         raise ValueError("categories must be a list of dicts with a 'name' key")
 
-    keyboard = []
-    for cat in categories:
-        name = cat.get('name')
-        if not name:
-            continue  # skip if no name
-        keyboard.append([InlineKeyboardButton(name, callback_data=f"category_{name}")])
+    names = [cat.get('name') for cat in categories if cat.get('name')]
+    if not names:
+        return NO_CATEGORIES_KEYBOARD
+
+    pages = (len(names) + page_size - 1) // page_size
+    page = min(max(page, 0), pages - 1)
+    keyboard = [
+        [InlineKeyboardButton(name, callback_data=f"category_{name}")]
+        for name in names[page * page_size:(page + 1) * page_size]
+    ]
 
-    if not keyboard:
-        # Fallback button if no categories
-        keyboard = [[InlineKeyboardButton("No categories found", callback_data="none")]]
+    controls = []
+    if page > 0:
+        controls.append(InlineKeyboardButton("⬅️", callback_data=f"show_categories_{page - 1}"))
+    if pages > 1:
+        controls.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="none"))
+    if page < pages - 1:
+        controls.append(InlineKeyboardButton("➡️", callback_data=f"show_categories_{page + 1}"))
+    if controls:
+        keyboard.append(controls)
+    keyboard.append([InlineKeyboardButton("↩️ Back to video", callback_data="cur_")])
 
     return InlineKeyboardMarkup(keyboard)
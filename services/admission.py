@@ -0,0 +1,129 @@
+# services/admission.py
+
+import logging
+import time
+
+from telegram import Update
+from telegram.error import TelegramError
+
+from utils.metrics import Counter, Gauge
+from utils.rate_limit import TokenBucket
+
+UPDATES_REJECTED = Counter(
+    "bot_updates_rejected_total", "Updates dropped before reaching a handler, by reason",
+    ("reason",),
+)
+ADMITTED_IN_FLIGHT = Gauge("bot_admitted_updates", "Admitted updates not yet finished")
+ADMISSION_USERS = Gauge("bot_admission_users", "Users with a live admission bucket")
+
+DUPLICATE = "duplicate"
+OVERLOADED = "overloaded"
+RATE_LIMITED = "rate_limited"
+USER_BACKLOG = "user_backlog"
+
+# Shown in the callback's toast; a duplicate tap gets a silent answer
+REJECT_TEXT = {
+    OVERLOADED: "⏳ The bot is busy, please try again in a moment.",
+    RATE_LIMITED: "🐢 Slow down a little.",
+    USER_BACKLOG: "⏳ Still working on your last taps.",
+}
+
+
+class AdmissionControl:
+    """
+    Decides whether an update is worth running before it costs anything.
+
+    In order of checks:
+    - a callback identical (same user, same data) to one still waiting or
+      running is a duplicate tap and is collapsed into that one;
+    - with `max_in_flight` admitted updates unfinished the bot is
+      overloaded and sheds new ones;
+    - each user has a token bucket of `user_rate` updates per second with
+      bursts of `user_burst`.
+
+    A rejected callback query only gets query.answer(), so the button stops
+    spinning without a Mongo read or a media edit; other rejected updates
+    are dropped. Updates without a user (channel posts) and users in
+    `exempt` (admins) are always admitted.
+    """
+
+    def __init__(self, user_rate=3.0, user_burst=6, max_in_flight=128, exempt=(),
+                 clock=time.monotonic):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_in_flight = max_in_flight
+        self.exempt = frozenset(exempt)
+        self._clock = clock
+        self._buckets = {}  # user_id -> TokenBucket
+        self._callbacks = set()  # (user_id, data) admitted and unfinished
+        self._in_flight = 0
+        self._next_sweep = 0.0
+        ADMITTED_IN_FLIGHT.fn = lambda: self._in_flight
+        ADMISSION_USERS.fn = lambda: len(self._buckets)
+
+    @staticmethod
+    def _callback_key(update):
+        query = update.callback_query
+        return (query.from_user.id, query.data) if query else None
+
+    def admit(self, update):
+        """
+        Register the update as in flight if it may run.
+
+        Returns:
+            str: None when admitted (call release() once it is done),
+                otherwise the rejection reason.
+        """
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None or user.id in self.exempt:
+            self._in_flight += 1
+            return None
+
+        key = self._callback_key(update)
+        if key is not None and key in self._callbacks:
+            return self._reject(DUPLICATE)
+        if self._in_flight >= self.max_in_flight:
+            return self._reject(OVERLOADED)
+
+        now = self._clock()
+        if now >= self._next_sweep:
+            self._sweep(now)
+            self._next_sweep = now + 60.0
+        bucket = self._buckets.get(user.id)
+        if bucket is None:
+            bucket = self._buckets[user.id] = TokenBucket(self.user_rate, self.user_burst, now)
+        if bucket.delay(now) > 0:
+            return self._reject(RATE_LIMITED)
+        bucket.take(now)
+
+        if key is not None:
+            self._callbacks.add(key)
+        self._in_flight += 1
+        return None
+
+    def release(self, update):
+        self._in_flight -= 1
+        if isinstance(update, Update):
+            key = self._callback_key(update)
+            if key is not None:
+                self._callbacks.discard(key)
+
+    def _reject(self, reason):
+        UPDATES_REJECTED.labels(reason).inc()
+        return reason
+
+    def _sweep(self, now):
+        """Drop buckets of users who have been quiet long enough to refill."""
+        idle = [user_id for user_id, bucket in self._buckets.items() if bucket.idle(now)]
+        for user_id in idle:
+            del self._buckets[user_id]
+
+    async def answer_rejected(self, update, reason):
+        """The cheapest possible reply to a rejected update."""
+        query = update.callback_query if isinstance(update, Update) else None
+        if query is None:
+            return
+        try:
+            await query.answer(REJECT_TEXT.get(reason))
+        except TelegramError as e:
+            logging.debug(f"Answering a {reason} callback failed: {e}")
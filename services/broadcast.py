@@ -0,0 +1,138 @@
+# services/broadcast.py
+
+import asyncio
+import logging
+
+from telegram.error import BadRequest, Forbidden, TelegramError
+
+from config import Config
+from db.database import Database
+from services.prefetch import next_videos
+from services.send_scheduler import BULK
+from services.video_window import video_windows
+from utils.metrics import Counter
+
+BROADCAST_MESSAGES = Counter(
+    "bot_broadcast_messages_total", "Broadcast deliveries by outcome", ("result",),
+)
+
+
+class Broadcasts:
+    """
+    Sends admin broadcasts to every user with fixed memory.
+
+    User ids are read in keyset batches of `batch_size` (the next batch is
+    fetched while the current one is being sent), and each batch is worked
+    off by `concurrency` sender coroutines. Sends are marked BULK, so the
+    send scheduler keeps them under the flood limits and lets interactive
+    replies go first.
+
+    After each batch the broadcast document records the last user id and
+    the running counts. A restart resumes from that checkpoint, so at most
+    one batch is delivered twice. Users who blocked the bot are removed.
+    """
+
+    def __init__(self, batch_size=500, concurrency=20):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self._tasks = {}  # broadcast _id -> Task
+
+    def running(self):
+        return list(self._tasks)
+
+    def start(self, bot, broadcast):
+        task = asyncio.create_task(self._run(bot, broadcast))
+        self._tasks[broadcast["_id"]] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast["_id"], None))
+        return task
+
+    async def resume(self, bot):
+        """Pick up broadcasts that were running when the bot last stopped."""
+        for broadcast in await Database.get_running_broadcasts():
+            if broadcast["_id"] not in self._tasks:
+                logging.info(f"📣 Resuming broadcast {broadcast['_id']} after user "
+                             f"{broadcast['last_user_id']}")
+                self.start(bot, broadcast)
+
+    async def stop(self):
+        """Cancel running broadcasts; their checkpoints stay for resume()."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _send(self, bot, broadcast, user_id):
+        try:
+            if broadcast.get("text"):
+                await bot.send_message(user_id, broadcast["text"], rate_limit_args=BULK)
+            else:
+                await bot.copy_message(
+                    user_id, broadcast["from_chat_id"], broadcast["message_id"],
+                    rate_limit_args=BULK,
+                )
+            return "sent"
+        except Forbidden:
+            return "blocked"  # blocked the bot or deactivated their account
+        except BadRequest as e:
+            if "chat not found" in str(e).lower():
+                return "blocked"
+            logging.warning(f"⚠️ Broadcast to {user_id} failed: {e}")
+            return "failed"
+        except TelegramError as e:
+            logging.warning(f"⚠️ Broadcast to {user_id} failed: {e}")
+            return "failed"
+
+    async def _send_batch(self, bot, broadcast, user_ids):
+        results = {}
+        pending = iter(user_ids)
+
+        async def sender():
+            for user_id in pending:
+                results[user_id] = await self._send(bot, broadcast, user_id)
+
+        await asyncio.gather(*(sender() for _ in range(min(self.concurrency, len(user_ids)))))
+        return results
+
+    async def _run(self, bot, broadcast):
+        broadcast_id = broadcast["_id"]
+        try:
+            next_batch = asyncio.create_task(
+                Database.get_user_ids_after(broadcast["last_user_id"], self.batch_size)
+            )
+            while True:
+                user_ids = await next_batch
+                if not user_ids:
+                    break
+                next_batch = asyncio.create_task(
+                    Database.get_user_ids_after(user_ids[-1], self.batch_size)
+                )
+                results = await self._send_batch(bot, broadcast, user_ids)
+
+                counts = dict.fromkeys(("sent", "failed", "blocked"), 0)
+                for result in results.values():
+                    counts[result] += 1
+                    BROADCAST_MESSAGES.labels(result).inc()
+                blocked = [user_id for user_id, result in results.items() if result == "blocked"]
+                if blocked:
+                    await Database.remove_users(blocked)
+                    for user_id in blocked:
+                        next_videos.invalidate(user_id)
+                        video_windows.invalidate(user_id)
+                await Database.checkpoint_broadcast(broadcast_id, user_ids[-1], **counts)
+
+            final = await Database.finish_broadcast(broadcast_id)
+            logging.info(f"📣 Broadcast {broadcast_id} done: sent={final['sent']} "
+                         f"failed={final['failed']} blocked={final['blocked']}")
+            await bot.send_message(
+                final["created_by"],
+                f"📣 Broadcast finished.\n✅ Sent: {final['sent']}\n"
+                f"⚠️ Failed: {final['failed']}\n🚫 Blocked (removed): {final['blocked']}",
+            )
+        except Exception as e:
+            # Left "running" in Mongo, so the next start resumes it
+            logging.error(f"❌ Broadcast {broadcast_id} stopped: {e}")
+        finally:
+            next_batch.cancel()
+
+
+broadcasts = Broadcasts(Config.BROADCAST_BATCH_SIZE, Config.BROADCAST_CONCURRENCY)
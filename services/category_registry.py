@@ -0,0 +1,129 @@
+# services/category_registry.py
+
+import asyncio
+import logging
+import threading
+
+from pymongo.errors import OperationFailure
+
+from config import Config
+from db.database import Database
+from services.prefetch import next_videos
+from services.video_window import video_windows
+from utils.metrics import Counter, Gauge
+
+REGISTRY_RELOADS = Counter(
+    "bot_category_registry_reloads_total", "Category registry reloads by trigger", ("trigger",),
+)
+REGISTRY_VERSION = Gauge("bot_category_registry_version", "Category registry version in memory")
+
+
+class CategoryRegistry:
+    """
+    In-memory copy of the categories collection: name -> channel and
+    video count, plus a reverse channel -> name map for ingestion.
+
+    The copy carries the version from the `meta` collection. It is reloaded
+    when a change stream on that document fires (Mongo replica sets) and, as a
+    fallback that also covers standalone servers, when a cheap poll of the
+    version finds it moved. Local admin changes reload immediately, so the
+    replica that made a change never serves the old list.
+    """
+
+    def __init__(self, poll_interval=5.0):
+        self.poll_interval = poll_interval
+        self.version = -1
+        self._by_name = {}
+        self._by_channel = {}
+        self._sorted = []
+        self._changed = None
+        self._task = None
+        self._stop_watch = threading.Event()
+        REGISTRY_VERSION.fn = lambda: self.version
+
+    # --- Lookups (no I/O) ---
+    def get(self, name):
+        return self._by_name.get(name)
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def all(self):
+        """Categories sorted by name."""
+        return self._sorted
+
+    def video_count(self, name):
+        # As of the last reload; ingestion does not bump the version, so
+        # Database.get_category_size is the one to use for a current count
+        return (self._by_name.get(name) or {}).get("video_count", 0)
+
+    def for_chat(self, chat):
+        """Category whose registered channel_id is this chat (id or @username)."""
+        name = self._by_channel.get(str(chat.id))
+        if name is None and chat.username:
+            name = self._by_channel.get(f"@{chat.username}".lower())
+        return name
+
+    # --- Loading ---
+    async def reload(self, trigger="manual"):
+        version, categories = await Database.load_categories()
+        # Counter-only documents left by index reservations that used to upsert
+        categories = [category for category in categories if category.get("channel_id")]
+        removed = self._by_name.keys() - {category["name"] for category in categories}
+        self._by_name = {category["name"]: category for category in categories}
+        # On every replica, not only the one whose admin removed the category
+        for name in removed:
+            next_videos.invalidate_category(name)
+            video_windows.invalidate_category(name)
+        self._by_channel = {
+            str(category["channel_id"]).lower(): category["name"]
+            for category in categories if category.get("channel_id")
+        }
+        self._sorted = sorted(categories, key=lambda category: category["name"])
+        self.version = version
+        REGISTRY_RELOADS.labels(trigger).inc()
+
+    async def start(self, backend):
+        """Load the registry and keep it fresh until stop()."""
+        await self.reload("startup")
+        self._changed = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        threading.Thread(
+            target=self._watch, args=(backend, loop), name="category-watch", daemon=True
+        ).start()
+        self._task = asyncio.create_task(self._refresh())
+        logging.info(f"📂 Category registry v{self.version}: {len(self._by_name)} categories")
+
+    async def stop(self):
+        self._stop_watch.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _watch(self, backend, loop):
+        try:
+            backend.watch_categories_version(
+                lambda: loop.call_soon_threadsafe(self._changed.set), self._stop_watch
+            )
+        except (NotImplementedError, OperationFailure):
+            logging.info("📂 Change streams unavailable; category registry polls its version")
+        except Exception as e:
+            logging.warning(f"⚠️ Category change stream stopped, polling instead: {e}")
+
+    async def _refresh(self):
+        while True:
+            trigger = "change_stream"
+            try:
+                await asyncio.wait_for(self._changed.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                trigger = "poll"
+            self._changed.clear()
+            try:
+                if await Database.get_categories_version() != self.version:
+                    await self.reload(trigger)
+            except Exception as e:
+                logging.error(f"❌ Category registry refresh failed: {e}")
+
+
+category_registry = CategoryRegistry(Config.CATEGORY_POLL_SECONDS)
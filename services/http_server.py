@@ -0,0 +1,150 @@
+# services/http_server.py
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+
+REASONS = {
+    200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+    405: "Method Not Allowed", 408: "Request Timeout", 411: "Length Required",
+    413: "Payload Too Large", 431: "Request Header Fields Too Large",
+    500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    headers: dict
+    body: bytes = b""
+
+
+@dataclass
+class Response:
+    status: int = 200
+    body: bytes = b""
+    content_type: str = "text/plain; charset=utf-8"
+    headers: dict = field(default_factory=dict)
+
+
+class HttpError(Exception):
+    def __init__(self, status, message=""):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class HttpServer:
+    """
+    Minimal HTTP/1.1 server on asyncio streams.
+
+    Enough for Telegram webhooks, health checks and a metrics scrape: exact
+    path routing, Content-Length bodies with a size cap, and keep-alive.
+    No chunked uploads, no TLS (Koyeb terminates it in front of us).
+    """
+
+    def __init__(self, max_body=1 << 20, max_header=16 << 10, read_timeout=30.0):
+        self.max_body = max_body
+        self.max_header = max_header
+        self.read_timeout = read_timeout
+        self._routes = {}  # path -> {method: handler}
+        self._server = None
+
+    def route(self, method, path, handler):
+        """Register `async handler(request) -> Response` for method and path."""
+        self._routes.setdefault(path, {})[method.upper()] = handler
+
+    async def start(self, host="0.0.0.0", port=8000):
+        self._server = await asyncio.start_server(
+            self._serve, host, port, limit=self.max_header
+        )
+        logging.info(f"🌐 HTTP server listening on {host}:{port}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _read_request(self, reader):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.read_timeout)
+        except asyncio.LimitOverrunError:
+            raise HttpError(431)
+        except asyncio.TimeoutError:
+            raise HttpError(408)
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _version = lines[0].split(" ", 2)
+        except ValueError:
+            raise HttpError(400, "Malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+        body = b""
+        if "transfer-encoding" in headers:
+            raise HttpError(411, "Chunked bodies are not supported")
+        length = headers.get("content-length")
+        if length:
+            if not length.isdigit():
+                raise HttpError(400, "Bad Content-Length")
+            if int(length) > self.max_body:
+                raise HttpError(413)
+            try:
+                body = await asyncio.wait_for(reader.readexactly(int(length)), self.read_timeout)
+            except asyncio.TimeoutError:
+                raise HttpError(408)
+        return Request(method.upper(), target.split("?", 1)[0], headers, body)
+
+    async def _dispatch(self, request):
+        methods = self._routes.get(request.path)
+        if methods is None:
+            return Response(404, b"Not Found")
+        handler = methods.get(request.method)
+        if handler is None:
+            return Response(405, b"Method Not Allowed", headers={"Allow": ", ".join(methods)})
+        try:
+            return await handler(request)
+        except HttpError as e:
+            return Response(e.status, (e.message or REASONS.get(e.status, "")).encode())
+        except Exception:
+            logging.exception(f"HTTP handler for {request.path} failed")
+            return Response(500, b"Internal Server Error")
+
+    @staticmethod
+    async def _write(writer, response, keep_alive):
+        headers = {
+            "Content-Type": response.content_type,
+            "Content-Length": str(len(response.body)),
+            "Connection": "keep-alive" if keep_alive else "close",
+            **response.headers,
+        }
+        head = f"HTTP/1.1 {response.status} {REASONS.get(response.status, '')}\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        writer.write(head.encode("latin-1") + b"\r\n" + response.body)
+        await writer.drain()
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except asyncio.IncompleteReadError:
+                    break  # client closed the connection
+                except HttpError as e:
+                    body = (e.message or REASONS.get(e.status, "")).encode()
+                    await self._write(writer, Response(e.status, body), keep_alive=False)
+                    break
+                response = await self._dispatch(request)
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                await self._write(writer, response, keep_alive)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,176 @@
+# services/ingest.py
+
+import asyncio
+import logging
+
+from telegram.error import BadRequest, TelegramError
+
+from config import Config
+from db.database import Database
+from services.category_registry import category_registry
+from services.send_scheduler import BULK
+from utils.metrics import Counter, Gauge
+
+INGEST_VIDEOS = Counter(
+    "bot_ingest_videos_total", "Channel videos ingested, by outcome", ("result",),
+)
+INGEST_BUFFERED = Gauge("bot_ingest_buffered", "Channel videos waiting for the next flush")
+
+
+def video_entry(message):
+    """The fields ingestion needs from a channel message, or None if it has no video."""
+    media = message.video
+    if media is None and message.document and (message.document.mime_type or "").startswith("video/"):
+        media = message.document
+    if media is None:
+        return None
+    return {
+        "file_unique_id": media.file_unique_id,
+        "file_id": media.file_id,
+        "channel_id": message.chat_id,
+        "message_id": message.message_id,
+    }
+
+
+class VideoIngester:
+    """
+    Buffers videos posted in category channels and writes them in batches.
+
+    A flush happens once `batch_size` videos are buffered or `flush_delay`
+    seconds after the first one, whichever comes first; each category's
+    batch is a single Database.ingest_videos call (dedupe, one idx range,
+    one bulk_write). Flushes run one at a time, so idx ranges are never
+    reserved for the same file twice by this process.
+    """
+
+    def __init__(self, batch_size=100, flush_delay=1.0):
+        self.batch_size = batch_size
+        self.flush_delay = flush_delay
+        self._buffers = {}  # category -> {file_unique_id: video}
+        self._buffered = 0
+        self._timer = None
+        self._flushing = asyncio.Lock()
+        self._tasks = set()
+        self._backfills = set()
+        INGEST_BUFFERED.fn = lambda: self._buffered
+
+    def __len__(self):
+        return self._buffered
+
+    # --- Channel lookup ---
+    def category_for(self, chat):
+        """Category whose registered channel_id matches this chat, if any."""
+        return category_registry.for_chat(chat)
+
+    # --- Buffering ---
+    def add(self, category, video):
+        videos = self._buffers.setdefault(category, {})
+        if video["file_unique_id"] not in videos:
+            self._buffered += 1
+        videos[video["file_unique_id"]] = video
+        if self._buffered >= self.batch_size:
+            self._spawn(self.flush())
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.flush_delay, lambda: self._spawn(self.flush())
+            )
+
+    def _spawn(self, coro, tasks=None):
+        tasks = self._tasks if tasks is None else tasks
+        task = asyncio.ensure_future(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return task
+
+    def _requeue(self, category, videos):
+        # Older copies lose to anything buffered meanwhile; retried after flush_delay
+        buffer = self._buffers.setdefault(category, {})
+        for key, video in videos.items():
+            if key not in buffer:
+                buffer[key] = video
+                self._buffered += 1
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.flush_delay, lambda: self._spawn(self.flush())
+            )
+
+    async def flush(self):
+        """Write everything buffered so far."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        async with self._flushing:
+            buffers, self._buffers, self._buffered = self._buffers, {}, 0
+            for category, videos in buffers.items():
+                try:
+                    inserted = await Database.ingest_videos(category, list(videos.values()))
+                except LookupError:
+                    # Removed while the videos were buffered; retrying cannot help
+                    logging.warning(f"⚠️ Dropped {len(videos)} videos for unknown category {category}")
+                    INGEST_VIDEOS.labels("dropped").inc(len(videos))
+                    continue
+                except Exception as e:
+                    logging.error(f"❌ Ingesting {len(videos)} videos into {category} failed: {e}")
+                    self._requeue(category, videos)
+                    continue
+                INGEST_VIDEOS.labels("inserted").inc(inserted)
+                INGEST_VIDEOS.labels("duplicate").inc(len(videos) - inserted)
+                if inserted:
+                    logging.info(f"📥 {inserted} new videos in {category}")
+
+    async def close(self):
+        """Stop backfills and write out whatever is buffered."""
+        for task in list(self._backfills):
+            task.cancel()
+        await asyncio.gather(*self._backfills, *self._tasks, return_exceptions=True)
+        await self.flush()
+
+    # --- Backfill ---
+    def start_backfill(self, bot, category, channel_id, first, last, chat_id):
+        return self._spawn(
+            self.backfill(bot, category, channel_id, first, last, chat_id), self._backfills
+        )
+
+    async def backfill(self, bot, category, channel_id, first, last, chat_id):
+        """
+        Ingest existing channel posts first..last.
+
+        The Bot API cannot read channel history, so each post is forwarded
+        to `chat_id` to see what it contains and the copy is deleted again.
+        Both go through the send scheduler as BULK traffic.
+
+        Returns:
+            tuple: (messages checked, videos found)
+        """
+        checked = found = 0
+        for message_id in range(first, last + 1):
+            try:
+                copy = await bot.forward_message(
+                    chat_id, channel_id, message_id,
+                    disable_notification=True, rate_limit_args=BULK,
+                )
+            except BadRequest:
+                continue  # deleted post or service message
+            except TelegramError as e:
+                logging.warning(f"⚠️ Backfill of {channel_id}/{message_id} failed: {e}")
+                continue
+            checked += 1
+            video = video_entry(copy)
+            if video is not None:
+                video.update(channel_id=copy.forward_from_chat.id if copy.forward_from_chat
+                             else channel_id, message_id=message_id)
+                self.add(category, video)
+                found += 1
+            try:
+                await bot.delete_message(chat_id, copy.message_id, rate_limit_args=BULK)
+            except TelegramError:
+                pass
+        await self.flush()
+        logging.info(f"📥 Backfill of {category}: {found} videos in {checked} messages")
+        await bot.send_message(
+            chat_id, f"📥 Backfill of '{category}' finished: {found} videos in {checked} messages."
+        )
+        return checked, found
+
+
+ingester = VideoIngester(Config.INGEST_BATCH_SIZE, Config.INGEST_FLUSH_DELAY)
@@ -0,0 +1,37 @@
+# services/permutation.py
+
+MASK64 = (1 << 64) - 1
+ROUNDS = 4
+
+
+def _mix(value, seed, round_no):
+    # splitmix64 finaliser: cheap, deterministic and well distributed
+    x = (value + seed * 0x9E3779B97F4A7C15 + round_no * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+
+def permute(index, size, seed):
+    """
+    Map index in [0, size) to its position in a seeded random permutation.
+
+    A balanced Feistel network is a bijection on [0, 2**bits); cycle-walking
+    (re-applying it until the result falls below size) restricts that to
+    [0, size). The domain is at most 4x size, so this is O(1) expected and
+    needs no stored state beyond the seed.
+    """
+    if not 0 <= index < size:
+        raise ValueError(f"index {index} out of range for size {size}")
+    bits = max(2, (size - 1).bit_length())
+    bits += bits % 2
+    half = bits // 2
+    mask = (1 << half) - 1
+    value = index
+    while True:
+        left, right = value >> half, value & mask
+        for round_no in range(ROUNDS):
+            left, right = right, left ^ (_mix(right, seed, round_no) & mask)
+        value = (left << half) | right
+        if value < size:
+            return value
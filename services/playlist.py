@@ -0,0 +1,132 @@
+# services/playlist.py
+
+import random
+from collections import OrderedDict
+
+from config import Config
+from db.database import Database
+from services.permutation import permute
+
+# Consecutive idx slots with no video (deleted or never filled) we step over
+MAX_HOLE_SKIPS = 8
+
+
+def new_state(video_count):
+    return {"seed": random.getrandbits(32), "pos": 0, "segs": [[0, video_count]]}
+
+
+def extend_state(state, video_count):
+    """
+    Append a segment for videos added since the playlist was shuffled.
+
+    Existing positions keep their videos; the new idx range is shuffled on
+    its own and played after them.
+    """
+    total = playlist_length(state)
+    if video_count > total:
+        state["segs"].append([total, video_count - total])
+    return state
+
+
+def playlist_length(state):
+    return sum(size for _start, size in state["segs"])
+
+
+def position_to_idx(state, pos):
+    # Segments cover consecutive idx ranges in the same order as positions
+    for seg_no, (start, size) in enumerate(state["segs"]):
+        if pos < start + size:
+            return start + permute(pos - start, size, state["seed"] + seg_no)
+    raise IndexError(pos)
+
+
+class Playlists:
+    """
+    Shuffled, repeat-free playback per user and category.
+
+    A user's playlist for a category is just {seed, pos, segs} in the user
+    document; the video at a position comes from a stateless permutation of
+    the category's dense idx range. Resolved videos for the next few
+    positions are cached per user so Prev/Next rarely touch Mongo.
+    """
+
+    def __init__(self, window=10, max_users=10000):
+        self.window = window
+        self.max_users = max_users
+        self._cache = OrderedDict()  # user_id -> (category, seed, {pos: video})
+
+    def _slot(self, user_id, category, state):
+        entry = self._cache.get(user_id)
+        if entry is None or entry[0] != category or entry[1] != state["seed"]:
+            entry = (category, state["seed"], {})
+            self._cache[user_id] = entry
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_users:
+            self._cache.popitem(last=False)
+        return entry[2]
+
+    async def _video_at(self, user_id, category, state, pos, direction):
+        videos = self._slot(user_id, category, state)
+        if pos not in videos:
+            total = playlist_length(state)
+            positions = [
+                p for p in range(pos, pos + direction * self.window, direction)
+                if 0 <= p < total
+            ]
+            by_pos = {p: position_to_idx(state, p) for p in positions}
+            found = {
+                video["idx"]: video
+                for video in await Database.get_videos_by_idx(category, by_pos.values())
+            }
+            for p, idx in by_pos.items():
+                videos[p] = found.get(idx)
+        return videos[pos]
+
+    async def _resolve(self, user_id, category, state, pos, direction):
+        total = playlist_length(state)
+        for _ in range(MAX_HOLE_SKIPS):
+            if not 0 <= pos < total:
+                return pos, None
+            video = await self._video_at(user_id, category, state, pos, direction or 1)
+            if video:
+                return pos, video
+            pos += direction or 1
+        return pos, None
+
+    def _state(self, user, category, video_count):
+        playlists = dict(user.get("playlists") or {})
+        state = playlists.get(category)
+        if state is None:
+            state = new_state(video_count)
+        else:
+            state = extend_state(dict(state, segs=[list(s) for s in state["segs"]]), video_count)
+        return playlists, state
+
+    async def current(self, user, category):
+        """The video at the user's playlist position for category."""
+        return await self.step(user, category, 0)
+
+    async def step(self, user, category, direction):
+        """
+        Move the playlist by direction (-1, 0 or +1) and return the video.
+
+        Running off the end starts a new cycle with a fresh seed; staging
+        the new state on the user context persists it.
+        """
+        video_count = await Database.get_category_size(category)
+        playlists, state = self._state(user, category, video_count)
+        pos, video = await self._resolve(
+            user.user_id, category, state, max(0, state["pos"] + direction), direction
+        )
+        if video is None and direction >= 0 and video_count:
+            state = new_state(video_count)
+            pos, video = await self._resolve(user.user_id, category, state, 0, 1)
+        if video is None:
+            return None
+        state["pos"] = pos
+        playlists[category] = state
+        user.set(playlists=playlists)
+        return video
+
+
+playlists = Playlists(Config.PREFETCH_WINDOW, Config.USER_CACHE_SIZE)
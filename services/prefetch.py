@@ -0,0 +1,164 @@
+# services/prefetch.py
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from config import Config
+from utils.metrics import Counter, Gauge
+
+PREFETCH_RESULTS = Counter(
+    "bot_prefetch_total", "Next/Prev presses served from a prefetched slot (hit) or not (miss), "
+    "and prefetched videos thrown away unused (wasted)", ("result",),
+)
+PREFETCH_HIT_RATIO = Gauge("bot_prefetch_hit_ratio", "Share of Next/Prev presses that were prefetch hits")
+PREFETCH_SLOTS = Gauge("bot_prefetch_slots", "Users holding a prefetched video")
+
+
+class _Speculation:
+    """
+    Stand-in for a UserContext while selecting ahead of time: reads come
+    from a snapshot of the document and set() is recorded, to be replayed
+    on the real context only if the prediction is used.
+    """
+
+    def __init__(self, user):
+        self.user_id = user.user_id
+        self.doc = dict(user.doc)
+        self.staged = {}
+
+    def get(self, key, default=None):
+        return self.staged.get(key, self.doc.get(key, default))
+
+    def __getitem__(self, key):
+        return self.staged[key] if key in self.staged else self.doc[key]
+
+    def set(self, **fields):
+        self.staged.update(fields)
+
+
+def _basis(user, category):
+    # Everything selection depends on; the prediction is only valid while
+    # the user's document still matches it
+    playlist = (user.get("playlists") or {}).get(category) if user.get("shuffle") else None
+    return (
+        category, user.get("cursor"), bool(user.get("shuffle")),
+        (playlist["seed"], playlist["pos"]) if playlist else None,
+    )
+
+
+class NextVideoPrefetcher:
+    """
+    Speculatively selects the video a user will most likely ask for next.
+
+    Right after a video is displayed, schedule() starts selecting the next
+    video (and with `previous` also the previous one) in the background and
+    parks the task in a per-user slot that lives for `ttl` seconds. take()
+    on the following press returns the parked result, awaiting the task if
+    it is still running, so the selection step is skipped; any state the
+    selection staged (a shuffled playlist position) is replayed on the real
+    user context. A slot whose basis (category, cursor, playlist position)
+    no longer matches the user is discarded and counted as wasted.
+    """
+
+    def __init__(self, ttl=30.0, previous=False, max_users=10000, clock=time.monotonic):
+        self.ttl = ttl
+        self.directions = (1, -1) if previous else (1,)
+        self.max_users = max_users
+        self._clock = clock
+        self._slots = OrderedDict()  # user_id -> (basis, expires_at, {direction: Task})
+        self.hits = 0
+        self.misses = 0
+        PREFETCH_HIT_RATIO.fn = lambda: self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0
+        PREFETCH_SLOTS.fn = lambda: len(self._slots)
+
+    def _discard(self, slot, keep=None):
+        for direction, task in slot[2].items():
+            if direction == keep:
+                continue
+            if not task.done():
+                task.cancel()
+            PREFETCH_RESULTS.labels("wasted").inc()
+
+    def schedule(self, user, category, select):
+        """
+        Start selecting ahead for the video just shown.
+
+        Args:
+            select: async callable(user, category, direction) -> video or None.
+        """
+        if self.ttl <= 0:
+            return
+        old = self._slots.pop(user.user_id, None)
+        if old is not None:
+            self._discard(old)
+        tasks = {}
+        for direction in self.directions:
+            speculation = _Speculation(user)
+            task = asyncio.ensure_future(self._select(select, speculation, category, direction))
+            tasks[direction] = task
+        self._slots[user.user_id] = (_basis(user, category), self._clock() + self.ttl, tasks)
+        while len(self._slots) > self.max_users:
+            self._discard(self._slots.popitem(last=False)[1])
+
+    @staticmethod
+    async def _select(select, speculation, category, direction):
+        try:
+            return await select(speculation, category, direction), speculation.staged
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.debug(f"Prefetch for {speculation.user_id} failed: {e}")
+            return None, {}
+
+    async def take(self, user, category, direction):
+        """
+        The prefetched video for this press, or None on a miss. Staged
+        selection state is applied to `user` on a hit.
+        """
+        slot = self._slots.pop(user.user_id, None)
+        task = None
+        if slot is not None:
+            basis, expires_at, tasks = slot
+            if basis == _basis(user, category) and expires_at > self._clock():
+                task = tasks.get(direction)
+            self._discard(slot, keep=direction if task is not None else None)
+        video = None
+        if task is not None:
+            video, staged = await task
+            if video is not None and staged:
+                user.set(**staged)
+        if video is None:
+            self.misses += 1
+            PREFETCH_RESULTS.labels("miss").inc()
+            return None
+        self.hits += 1
+        PREFETCH_RESULTS.labels("hit").inc()
+        return video
+
+    def invalidate(self, user_id):
+        slot = self._slots.pop(user_id, None)
+        if slot is not None:
+            self._discard(slot)
+
+    def invalidate_category(self, category):
+        """Drop every slot predicted within `category`, e.g. once it is removed."""
+        for user_id in [user_id for user_id, slot in self._slots.items() if slot[0][0] == category]:
+            self._discard(self._slots.pop(user_id))
+
+    async def close(self):
+        """Cancel every outstanding selection, before the database closes."""
+        slots, self._slots = self._slots, OrderedDict()
+        tasks = [task for slot in slots.values() for task in slot[2].values()]
+        for slot in slots.values():
+            self._discard(slot)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self):
+        return {"users": len(self._slots), "hits": self.hits, "misses": self.misses}
+
+
+next_videos = NextVideoPrefetcher(
+    Config.NEXT_PREFETCH_TTL, Config.NEXT_PREFETCH_PREVIOUS, Config.USER_CACHE_SIZE,
+)
@@ -0,0 +1,64 @@
+# services/quota_compactor.py
+
+import asyncio
+import logging
+
+from config import Config
+from db.database import Database
+from utils.metrics import Counter
+
+QUOTA_COMPACTED = Counter(
+    "bot_quota_compacted_users_total", "Users whose stale quota fields were rewritten",
+)
+
+
+class QuotaCompactor:
+    """
+    Optional background job that tidies quota fields of dormant users.
+
+    Nothing depends on it: expired tokens and old daily counters already
+    read as zero. Every `interval` seconds it walks the users collection in
+    keyset batches of `batch_size`, one bulk write per batch and a pause
+    between batches, so it never competes with live traffic for long.
+    """
+
+    def __init__(self, interval=0, batch_size=500, pause=1.0):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self._task = None
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logging.error(f"❌ Quota compaction failed: {e}")
+
+    async def run_once(self):
+        """One pass over every user; returns the number rewritten."""
+        after, total = None, 0
+        while True:
+            after, compacted = await Database.compact_users(after, self.batch_size)
+            total += compacted
+            QUOTA_COMPACTED.inc(compacted)
+            if after is None:
+                break
+            await asyncio.sleep(self.pause)
+        if total:
+            logging.info(f"🧹 Compacted quota fields of {total} users")
+        return total
+
+
+quota_compactor = QuotaCompactor(Config.QUOTA_COMPACT_INTERVAL, Config.QUOTA_COMPACT_BATCH)
@@ -0,0 +1,227 @@
+# services/send_scheduler.py
+
+import asyncio
+import heapq
+import itertools
+import logging
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from utils.metrics import Counter, Gauge, Histogram
+from utils.rate_limit import TokenBucket
+
+# Passed as rate_limit_args= to ExtBot methods; no argument means INTERACTIVE
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+SEND_QUEUE_DEPTH = Gauge(
+    "telegram_send_queue_depth", "Outgoing requests waiting for a send slot", ("priority",),
+)
+SEND_WAIT = Histogram(
+    "telegram_send_wait_seconds", "Time outgoing requests spent waiting for a send slot",
+    ("priority",),
+)
+SEND_RETRY_AFTER = Counter(
+    "telegram_send_retry_after_total", "Flood-wait (429) responses that were rescheduled",
+)
+SEND_CHATS = Gauge("telegram_send_chats", "Chats with a live rate-limit bucket")
+
+
+class _ChatQueue:
+    __slots__ = ("chat_id", "bucket", "jobs", "state", "ready_key")
+
+    def __init__(self, chat_id, bucket):
+        self.chat_id = chat_id
+        self.bucket = bucket
+        self.jobs = []  # heap of (priority, seq, future)
+        self.state = None  # None, "ready" or "delayed"
+        self.ready_key = None
+
+
+class SendScheduler(BaseRateLimiter):
+    """
+    Rate limiter for every Bot API call that targets a chat.
+
+    Each chat has a token bucket (private chats and groups get Telegram's
+    respective limits) and all chats share a global bucket. A single
+    dispatcher task hands out send slots: among chats whose own bucket has
+    a token, the one whose oldest waiting request has the best priority
+    goes first, so interactive replies overtake broadcasts and requests to
+    the same chat keep their order.
+
+    A RetryAfter blocks the offending chat for the time Telegram asked for,
+    drains the global bucket, and puts the request back at the head of its
+    chat's queue instead of failing it.
+    """
+
+    def __init__(self, global_rate=30, global_burst=10, chat_rate=1.0, chat_burst=3,
+                 group_rate=20 / 60, group_burst=3, max_retries=3, clock=None):
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.chat_limits = (chat_rate, chat_burst)
+        self.group_limits = (group_rate, group_burst)
+        self.max_retries = max_retries
+        self._clock = clock
+        self._seq = itertools.count()
+        self._chats = {}
+        self._ready = []  # heap of (priority, seq, chat_id)
+        self._delayed = []  # heap of (ready_at, chat_id)
+        self._depth = dict.fromkeys(PRIORITY_NAMES, 0)
+        self._global = None
+        self._wakeup = None
+        self._task = None
+        self._next_sweep = 0.0
+        SEND_QUEUE_DEPTH.fn = lambda: {PRIORITY_NAMES[p]: n for p, n in self._depth.items()}
+        SEND_CHATS.fn = lambda: len(self._chats)
+
+    # --- Lifecycle ---
+    async def initialize(self):
+        loop = asyncio.get_running_loop()
+        if self._clock is None:
+            self._clock = loop.time
+        self._global = TokenBucket(self.global_rate, self.global_burst, self._clock())
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for queue in self._chats.values():
+            for _, _, future in queue.jobs:
+                future.cancel()
+        self._chats.clear()
+
+    # --- Requests ---
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            # answerCallbackQuery, getMe, setWebhook, ...: not covered by the send limits
+            return await callback(*args, **kwargs)
+        priority = BULK if rate_limit_args == BULK else INTERACTIVE
+        seq = next(self._seq)  # kept across retries, so a retry stays first in its chat
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id, priority, seq)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                SEND_RETRY_AFTER.inc()
+                logging.info(f"⏳ Flood wait {e.retry_after}s for chat {chat_id}, rescheduling")
+                self._block(chat_id, e.retry_after)
+
+    async def _acquire(self, chat_id, priority, seq):
+        now = self._clock()
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queue(chat_id, now)
+        heapq.heappush(queue.jobs, (priority, seq, future))
+        self._schedule(queue, now)
+        self._wakeup.set()
+        self._depth[priority] += 1
+        try:
+            await future
+        finally:
+            self._depth[priority] -= 1
+            future.cancel()  # no-op once released; skipped by the dispatcher otherwise
+        SEND_WAIT.labels(PRIORITY_NAMES[priority]).observe(self._clock() - now)
+
+    def _block(self, chat_id, seconds):
+        now = self._clock()
+        self._queue(chat_id, now).bucket.block(now, seconds)
+        # Telegram does not say whether the flood limit was the chat's or the
+        # bot's; stopping the current burst costs at most one global token
+        self._global.block(now, 0)
+
+    # --- Scheduling ---
+    def _queue(self, chat_id, now):
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate, burst = self.group_limits if is_group else self.chat_limits
+            queue = self._chats[chat_id] = _ChatQueue(chat_id, TokenBucket(rate, burst, now))
+        return queue
+
+    def _schedule(self, queue, now):
+        """Put a chat with waiting requests on the ready or the delayed heap."""
+        while queue.jobs and queue.jobs[0][2].done():
+            heapq.heappop(queue.jobs)  # caller gave up waiting
+        if not queue.jobs:
+            queue.state = None
+            return
+        if queue.state == "delayed":
+            return
+        delay = queue.bucket.delay(now)
+        if delay > 0:
+            queue.state = "delayed"
+            heapq.heappush(self._delayed, (now + delay, queue.chat_id))
+            return
+        priority, seq, _ = queue.jobs[0]
+        if queue.state == "ready" and queue.ready_key <= (priority, seq):
+            return
+        queue.state, queue.ready_key = "ready", (priority, seq)
+        heapq.heappush(self._ready, (priority, seq, queue.chat_id))
+
+    def _next_ready(self, now):
+        """Chat queue that should send next, or None. Discards stale heap entries."""
+        while self._delayed and self._delayed[0][0] <= now:
+            _, chat_id = heapq.heappop(self._delayed)
+            queue = self._chats.get(chat_id)
+            if queue is not None and queue.state == "delayed":
+                queue.state = None
+                self._schedule(queue, now)
+        while self._ready:
+            priority, seq, chat_id = self._ready[0]
+            queue = self._chats.get(chat_id)
+            if queue is None or queue.state != "ready" or queue.ready_key != (priority, seq):
+                heapq.heappop(self._ready)
+                continue
+            if not queue.jobs or queue.jobs[0][2].done() or queue.bucket.delay(now) > 0:
+                # Head was cancelled or the chat got blocked since it was queued
+                heapq.heappop(self._ready)
+                queue.state = None
+                self._schedule(queue, now)
+                continue
+            return queue
+        return None
+
+    def _sweep(self, now):
+        """Drop buckets of chats with nothing queued that have fully refilled."""
+        idle = [chat_id for chat_id, queue in self._chats.items()
+                if queue.state is None and not queue.jobs and queue.bucket.idle(now)]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    async def _dispatch(self):
+        while True:
+            now = self._clock()
+            if now >= self._next_sweep:
+                self._sweep(now)
+                self._next_sweep = now + 1.0
+            queue = self._next_ready(now)
+            if queue is None:
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            delay = self._global.delay(now)
+            if delay > 0:
+                # Re-pick afterwards: something more urgent may have arrived
+                await asyncio.sleep(delay)
+                continue
+            heapq.heappop(self._ready)
+            _, _, future = heapq.heappop(queue.jobs)
+            self._global.take(now)
+            queue.bucket.take(now)
+            queue.state = None
+            future.set_result(None)
+            self._schedule(queue, now)
@@ -0,0 +1,41 @@
+# services/telegram_api.py
+
+import time
+
+from telegram.error import TelegramError
+from telegram.ext import ExtBot
+
+from utils.metrics import Counter, Histogram
+
+TELEGRAM_REQUESTS = Counter(
+    "telegram_api_requests_total", "Bot API calls by method", ("method",),
+)
+TELEGRAM_ERRORS = Counter(
+    "telegram_api_errors_total", "Bot API calls that failed, by method and error type",
+    ("method", "error"),
+)
+TELEGRAM_LATENCY = Histogram(
+    "telegram_api_latency_seconds", "Bot API call latency by method", ("method",),
+)
+
+
+class InstrumentedBot(ExtBot):
+    """
+    ExtBot that counts and times every Bot API request.
+
+    _do_post is the single choke point for all API methods, so errors per
+    method (RetryAfter, Forbidden, BadRequest, ...) can be turned into error
+    rates against the request counter. Latency includes time spent queued in
+    the send scheduler; telegram_send_wait_seconds isolates that part.
+    """
+
+    async def _do_post(self, endpoint, data, **kwargs):
+        started = time.perf_counter()
+        TELEGRAM_REQUESTS.labels(endpoint).inc()
+        try:
+            return await super()._do_post(endpoint, data, **kwargs)
+        except TelegramError as e:
+            TELEGRAM_ERRORS.labels(endpoint, type(e).__name__).inc()
+            raise
+        finally:
+            TELEGRAM_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
@@ -0,0 +1,157 @@
+# services/update_processor.py
+
+import asyncio
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from services.admission import UPDATES_REJECTED, USER_BACKLOG
+from utils.keyed_lock import KeyedLock
+from utils.metrics import Gauge
+
+UPDATES_IN_FLIGHT = Gauge("bot_updates_in_flight", "Updates currently running a handler")
+UPDATES_WAITING = Gauge(
+    "bot_updates_waiting_for_user", "Updates queued behind an earlier update from the same user",
+)
+
+
+def update_key(update):
+    """Serialization key of an update: its user, else its chat, else None."""
+    if isinstance(update, Update):
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+    return None
+
+
+class UpdateQueue(asyncio.Queue):
+    """
+    The application's update queue, with intake bounded where it is consumed.
+
+    With concurrent updates PTB's fetcher turns every update it takes into
+    a task at once, so a plain bounded queue never fills: the backlog just
+    moves into tasks. Here get() waits while `max_taken` updates have been
+    taken and not yet marked task_done(), which keeps the backlog in the
+    queue, where a full queue makes the webhook answer 503 and polling wait
+    before fetching more.
+    """
+
+    def __init__(self, maxsize=0, max_taken=128):
+        super().__init__(maxsize)
+        self.max_taken = max_taken
+        self._taken = 0
+        self._room = asyncio.Event()
+
+    @property
+    def taken(self):
+        return self._taken
+
+    async def get(self):
+        while self._taken >= self.max_taken:
+            self._room.clear()
+            await self._room.wait()
+        return await super().get()
+
+    def get_nowait(self):
+        item = super().get_nowait()
+        self._taken += 1
+        return item
+
+    def task_done(self):
+        super().task_done()
+        # On stop PTB marks the updates it drops done without taking them
+        if self._taken:
+            self._taken -= 1
+        self._room.set()
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Runs updates from different users concurrently and updates from the
+    same user one at a time, in arrival order.
+
+    Handlers do a read-modify-write of the user's document (cursor, tokens,
+    history), so two updates for one user must never interleave.
+
+    PTB holds its own semaphore around do_process_update. If that were the
+    concurrency limit, a user hammering "next" would park all its slots on
+    their own user lock and starve everyone else, so the real limit is taken
+    after the user lock. The base semaphore is sized `max_pending`, the
+    intake bound of the UpdateQueue feeding this processor, so it never
+    waits; and a user with `max_per_user` updates already waiting or running
+    has further ones dropped, so one user cannot fill that intake alone.
+
+    With an AdmissionControl, updates it rejects are answered cheaply and
+    never reach the user lock or a handler.
+    """
+
+    __slots__ = ("_locks", "_slots", "_limit", "_max_per_user", "_admission")
+
+    def __init__(self, max_concurrent_updates, max_pending=None, max_per_user=4,
+                 lock_shards=64, admission=None):
+        super().__init__(max_pending or max_concurrent_updates * 4)
+        self._limit = max_concurrent_updates
+        self._max_per_user = max_per_user
+        self._locks = KeyedLock(lock_shards)
+        self._slots = None
+        self._admission = admission
+
+    @property
+    def concurrency_limit(self):
+        return self._limit
+
+    def active_keys(self):
+        return len(self._locks)
+
+    async def initialize(self):
+        # Created here so the semaphore binds to the running loop
+        self._slots = asyncio.Semaphore(self._limit)
+
+    async def shutdown(self):
+        pass
+
+    async def _run(self, coroutine):
+        async with self._slots:
+            UPDATES_IN_FLIGHT.inc()
+            try:
+                await coroutine
+            finally:
+                UPDATES_IN_FLIGHT.dec()
+
+    async def do_process_update(self, update, coroutine):
+        key = update_key(update)
+        if key is not None and self._locks.users(key) >= self._max_per_user:
+            coroutine.close()
+            UPDATES_REJECTED.labels(USER_BACKLOG).inc()
+            if self._admission is not None:
+                await self._admission.answer_rejected(update, USER_BACKLOG)
+            return
+        if self._admission is None:
+            await self._process(update, coroutine)
+            return
+        reason = self._admission.admit(update)
+        if reason is not None:
+            coroutine.close()
+            await self._admission.answer_rejected(update, reason)
+            return
+        try:
+            await self._process(update, coroutine)
+        finally:
+            self._admission.release(update)
+
+    async def _process(self, update, coroutine):
+        key = update_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+        UPDATES_WAITING.inc()
+        waiting = True
+        try:
+            async with self._locks.hold(key):
+                UPDATES_WAITING.dec()
+                waiting = False
+                await self._run(coroutine)
+        finally:
+            if waiting:
+                UPDATES_WAITING.dec()
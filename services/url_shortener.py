@@ -1,66 +1,254 @@
-import requests
+import asyncio
+import logging
+import time
+from collections import OrderedDict
 from urllib.parse import quote
-from helper import str_to_b64, get_current_time
 
-def shorten_url(long_url: str) -> str:
+import httpx
+
+from config import Config
+from helper import sign_access_token, get_current_time
+from utils.metrics import Counter, Histogram
+
+SHORTENER_REQUESTS = Counter(
+    "shortener_requests_total",
+    "Shorten calls by outcome: cached, ok, coalesced, fallback, circuit_open, disabled",
+    ("result",),
+)
+SHORTENER_LATENCY = Histogram("shortener_upstream_latency_seconds", "Upstream shortener call latency")
+
+# A user's last refresh link is handed out again for this many seconds, so
+# repeated prompts cost no shortener call; never once it has been redeemed
+TOKEN_LINK_REUSE = 600
+
+
+def telegram_fallback(long_url: str) -> str:
+    return long_url.replace("telegram.dog", "t.me")
+
+
+class CircuitBreaker:
     """
-    Shortens URLs using custom shortener service with HTML response prevention
-    Returns original URL (converted to t.me) if shortening fails
+    Opens after `threshold` consecutive failures and stays open for
+    `reset_after` seconds; then lets a single trial call through
+    (half-open) and closes again if it succeeds.
     """
-    try:
-        # Encode URL and prepare API request
-        encoded_url = quote(long_url, safe='')
-        api_url = f"YOUR_CUSTOM_API_ENDPOINT?url={encoded_url}"  # Replace with your actual API URL
-        
-        # Force text/plain response if possible
-        headers = {'Accept': 'text/plain'}
-        
-        response = requests.get(
-            api_url,
-            timeout=10,
-            headers=headers
-        )
+
+    def __init__(self, threshold=5, reset_after=30.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self._clock() - self.opened_at >= self.reset_after:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial = False
+        if self.failures >= self.threshold:
+            self.opened_at = self._clock()
+
+    def release(self):
+        """End a call that recorded neither outcome (cancelled), freeing the trial slot."""
+        self._trial = False
+
+
+class ShortenerClient:
+    """
+    Async client for the URL shortener API.
+
+    Uses one pooled httpx.AsyncClient with a short deadline, caches
+    long -> short URLs, coalesces concurrent requests for the same URL into
+    one upstream call, and falls back to the t.me URL straight away while
+    the circuit breaker is open.
+    """
+
+    def __init__(self, api_template, timeout=2.0, cache_size=10000, cache_ttl=3600,
+                 breaker=None, max_connections=20):
+        self.api_template = api_template
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.breaker = breaker or CircuitBreaker()
+        self.max_connections = max_connections
+        self._client = None
+        self._cache = OrderedDict()  # long_url -> (expires_at, short_url)
+        self._inflight = {}  # long_url -> Future
+        self.calls = 0
+        self.fallbacks = 0
+
+    def _http(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                headers={"Accept": "text/plain"},
+            )
+        return self._client
+
+    def _cached(self, long_url):
+        entry = self._cache.get(long_url)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._cache[long_url]
+            return None
+        self._cache.move_to_end(long_url)
+        return entry[1]
+
+    def _remember(self, long_url, short_url):
+        self._cache[long_url] = (time.monotonic() + self.cache_ttl, short_url)
+        self._cache.move_to_end(long_url)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def shorten(self, long_url: str) -> str:
+        """Short URL for long_url, or the t.me fallback on any failure."""
+        cached = self._cached(long_url)
+        if cached:
+            SHORTENER_REQUESTS.labels("cached").inc()
+            return cached
+        # Before the breaker, so a coalesced call never claims the half-open trial
+        pending = self._inflight.get(long_url)
+        if pending is not None:
+            SHORTENER_REQUESTS.labels("coalesced").inc()
+            return await asyncio.shield(pending)
+
+        if not self.api_template or not self.breaker.allow():
+            self.fallbacks += 1
+            SHORTENER_REQUESTS.labels("disabled" if not self.api_template else "circuit_open").inc()
+            return telegram_fallback(long_url)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[long_url] = future
+        short_url = telegram_fallback(long_url)
+        started = time.perf_counter()
+        try:
+            self.calls += 1
+            short_url = await self._request(long_url)
+            self.breaker.record_success()
+            self._remember(long_url, short_url)
+            SHORTENER_REQUESTS.labels("ok").inc()
+        except Exception as e:
+            logging.warning(f"Shortening error: {e}")
+            self.breaker.record_failure()
+            self.fallbacks += 1
+            SHORTENER_REQUESTS.labels("fallback").inc()
+        finally:
+            # Resolve waiters and free the trial even if this call was cancelled
+            self.breaker.release()
+            SHORTENER_LATENCY.observe(time.perf_counter() - started)
+            del self._inflight[long_url]
+            future.set_result(short_url)
+        return short_url
+
+    async def _request(self, long_url: str) -> str:
+        api_url = self.api_template.format(quote(long_url, safe=''))
+        response = await self._http().get(api_url)
 
         # Reject HTML responses immediately
         if 'text/html' in response.headers.get('Content-Type', ''):
             raise ValueError("Received HTML response from shortener")
+        response.raise_for_status()
+
+        # Try JSON first
+        try:
+            data = response.json()
+            short_url = data.get('short_url') or data.get('shortenedUrl')
+        except ValueError:
+            # Fallback to text response
+            short_url = response.text.strip()
+        # Validate URL format
+        if not short_url or not short_url.startswith(('http://', 'https://')):
+            raise ValueError(f"Unexpected shortener response: {response.text[:100]!r}")
+        return short_url
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+shortener = ShortenerClient(
+    Config.URL_SHORTENER,
+    timeout=Config.SHORTENER_TIMEOUT,
+    cache_size=Config.SHORTENER_CACHE_SIZE,
+    cache_ttl=Config.SHORTENER_CACHE_TTL,
+    breaker=CircuitBreaker(Config.SHORTENER_FAILURE_THRESHOLD, Config.SHORTENER_RESET_SECONDS),
+)
+
+
+async def shorten_url(long_url: str) -> str:
+    """
+    Shortens URLs using custom shortener service with HTML response prevention
+    Returns original URL (converted to t.me) if shortening fails
+    """
+    return await shortener.shorten(long_url)
+
+
+_issued_links = OrderedDict()  # user_id -> (expiry, url)
+
+
+def _remember_link(user_id, expiry_time, url):
+    _issued_links[user_id] = (expiry_time, url)
+    _issued_links.move_to_end(user_id)
+    while len(_issued_links) > Config.SHORTENER_CACHE_SIZE:
+        _issued_links.popitem(last=False)
+    return url, expiry_time
+
 
-        # Handle successful responses
-        if response.status_code == 200:
-            # Try JSON first
-            try:
-                return response.json()['short_url']  # Replace 'short_url' with your API's key
-            except ValueError:
-                # Fallback to text response
-                short_url = response.text.strip()
-                # Validate URL format
-                if short_url.startswith(('http://', 'https://')):
-                    return short_url
-
-        return long_url.replace("telegram.dog", "t.me")
-    
-    except Exception as e:
-        print(f"Shortening error: {str(e)}")
-        return long_url.replace("telegram.dog", "t.me")
-
-def generate_24h_token_url(bot_username: str, user_id: int) -> tuple:
+async def generate_24h_token_url(bot_username: str, user_id: int, redeemed_expiry: int = 0) -> tuple:
     """
     Generates refresh URLs with enhanced HTML protection
     Returns tuple: (url, expiry_timestamp)
+
+    redeemed_expiry is the expiry of the last link the user redeemed; the
+    link returned always expires later, or redeem_token would reject it
+    as a replay.
     """
-    expiry_time = get_current_time() + 86400
-    token = str_to_b64(f"{user_id}:{expiry_time}")
-    
+    now = get_current_time()
+    issued = _issued_links.get(user_id)
+    if issued is not None and issued[0] > redeemed_expiry and issued[0] - 86400 + TOKEN_LINK_REUSE > now:
+        _issued_links.move_to_end(user_id)
+        return issued[1], issued[0]
+
+    expiry_time = max(now + 86400, redeemed_expiry + 1)
+    token = sign_access_token(user_id, expiry_time, Config.TOKEN_KEY_ID, Config.TOKEN_KEYS)
+
     # Force t.me domain for base URL
     base_url = f"https://t.me/{bot_username}?start=token_{token}"
-    
+
     # Shortening logic with HTML prevention
     if len(base_url) > 60:  # Only shorten if necessary
-        shortened = shorten_url(base_url)
-        
+        shortened = await shorten_url(base_url)
+
         # Final HTML check before returning
         if '<!DOCTYPE html>' in shortened.lower():
-            return base_url, expiry_time
-        return shortened, expiry_time
-    
-    return base_url, expiry_time
+            return _remember_link(user_id, expiry_time, base_url)
+        return _remember_link(user_id, expiry_time, shortened)
+
+    return _remember_link(user_id, expiry_time, base_url)
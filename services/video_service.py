@@ -1,55 +1,39 @@
-
-import random
 from bson.objectid import ObjectId
 
+from db.models import VIDEO_FIELDS, add_video_to_history, get_seen_set, sample_unseen_video
+
 def fetch_random_video(db, user_id, category):
     """
     Fetch a random, unseen video for the user from the specified category.
     Returns None if no unseen videos are available.
     """
-    user = db.users.find_one({"user_id": user_id})
-    if not user:
-        return None
-
-    seen_video_ids = user.get("history", [])
-    # Convert only valid ObjectId strings
-    seen_object_ids = []
-    for vid in seen_video_ids:
-        try:
-            seen_object_ids.append(ObjectId(vid))
-        except Exception:
-            continue
-
-    unseen_videos = list(db.videos.find({
-        "category": category,
-        "_id": {"$nin": seen_object_ids}
-    }))
-
-    if not unseen_videos:
-        return None
-
-    return random.choice(unseen_videos)
+    return sample_unseen_video(db, category, get_seen_set(db, user_id, category))
 
-def mark_video_as_seen(db, user_id, video_id):
+def mark_video_as_seen(db, user_id, video):
     """
-    Add the video_id to the user's history.
+    Set the video's bit in the user's seen-set and add it to recent history.
     """
-    # Accept both ObjectId and str for video_id
-    video_id_str = str(video_id)
-    db.users.update_one(
-        {"user_id": user_id},
-        {"$addToSet": {"history": video_id_str}}
-    )
+    # Accept a video document, or an ObjectId/str to look one up; a hex
+    # string may name an ObjectId _id or a string _id from add_video
+    if not isinstance(video, dict):
+        ids = [video]
+        if isinstance(video, str) and ObjectId.is_valid(video):
+            ids.append(ObjectId(video))
+        video = db.videos.find_one({"_id": {"$in": ids}}, VIDEO_FIELDS)
+        if not video:
+            return
+    add_video_to_history(db, user_id, video)
 
 def get_video_history(db, user_id, limit=20):
     """
-    Retrieve the most recent video IDs watched by the user.
+    Retrieve the most recent file_ids watched by the user, newest last.
+    Backed by the capped `viewed_videos` ring, not the full seen-set.
     """
-    user = db.users.find_one({"user_id": user_id})
+    user = db.users.find_one({"user_id": user_id}, {"viewed_videos": 1})
     if not user:
         return []
     # Ensure history is a list
-    history = user.get("history", [])
+    history = user.get("viewed_videos", [])
     if not isinstance(history, list):
         history = []
     return history[-limit:]
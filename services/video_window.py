@@ -0,0 +1,99 @@
+# services/video_window.py
+
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from config import Config
+from db.database import Database
+
+
+class VideoWindows:
+    """
+    Per-user prefetched slice of a category around the user's cursor.
+
+    Each user keeps up to 2 * size videos (idx and file_id only) in idx
+    order. Next/Prev presses that land inside the slice are answered from
+    memory; a miss fetches the next `size` videos in that direction with a
+    keyset query and merges them in.
+    """
+
+    def __init__(self, size=10, max_users=10000):
+        self.size = size
+        self.max_users = max_users
+        self._windows = OrderedDict()  # user_id -> (category, [videos])
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, user_id, category):
+        entry = self._windows.get(user_id)
+        if entry is None or entry[0] != category:
+            return []
+        self._windows.move_to_end(user_id)
+        return entry[1]
+
+    def _store(self, user_id, category, videos, cursor):
+        # Trim to `size` videos either side of the cursor
+        keys = [video["idx"] for video in videos]
+        pos = bisect_left(keys, cursor)
+        videos = videos[max(0, pos - self.size):pos + self.size]
+        self._windows[user_id] = (category, videos)
+        self._windows.move_to_end(user_id)
+        while len(self._windows) > self.max_users:
+            self._windows.popitem(last=False)
+
+    def _merge(self, user_id, category, fetched, cursor, extend):
+        # Only extend when the fetch continues from inside the window;
+        # merging disjoint slices would hide the gap between them
+        by_idx = {}
+        if extend:
+            by_idx = {video["idx"]: video for video in self._get(user_id, category)}
+        by_idx.update((video["idx"], video) for video in fetched)
+        self._store(user_id, category, [by_idx[k] for k in sorted(by_idx)], cursor)
+
+    def invalidate(self, user_id):
+        self._windows.pop(user_id, None)
+
+    def invalidate_category(self, category):
+        for user_id in [user_id for user_id, entry in self._windows.items() if entry[0] == category]:
+            del self._windows[user_id]
+
+    async def current(self, user_id, category, cursor):
+        """The first video with idx >= cursor."""
+        videos = self._get(user_id, category)
+        keys = [video["idx"] for video in videos]
+        pos = bisect_left(keys, cursor)
+        if pos < len(videos) and videos[pos]["idx"] == cursor:
+            self.hits += 1
+            return videos[pos]
+        self.misses += 1
+        fetched = await Database.get_videos(category, cursor, self.size, 1)
+        if not fetched:
+            return None
+        self._merge(user_id, category, fetched, fetched[0]["idx"], extend=False)
+        return fetched[0]
+
+    async def step(self, user_id, category, cursor, direction):
+        """The neighbour of cursor in the given direction (+1 or -1)."""
+        videos = self._get(user_id, category)
+        keys = [video["idx"] for video in videos]
+        # Only trust the window when it also contains the cursor itself,
+        # otherwise a gap before its first or after its last entry may hide videos
+        inside = cursor in keys
+        if inside:
+            pos = bisect_right(keys, cursor) if direction > 0 else bisect_left(keys, cursor) - 1
+            if 0 <= pos < len(videos):
+                self.hits += 1
+                return videos[pos]
+        self.misses += 1
+        fetched = await Database.get_videos(category, cursor + direction, self.size, direction)
+        if not fetched:
+            return None
+        video = fetched[0] if direction > 0 else fetched[-1]
+        self._merge(user_id, category, fetched, video["idx"], extend=inside)
+        return video
+
+    def stats(self):
+        return {"users": len(self._windows), "hits": self.hits, "misses": self.misses}
+
+
+video_windows = VideoWindows(Config.PREFETCH_WINDOW, Config.USER_CACHE_SIZE)
@@ -0,0 +1,92 @@
+# services/webhook.py
+
+import asyncio
+import hmac
+import json
+import logging
+
+from telegram import Update
+
+from config import Config
+from db.connection import MongoConnection
+from db.database import Database
+from services.http_server import HttpError, HttpServer, Response
+from utils.metrics import REGISTRY, Counter, Gauge
+
+UPDATE_QUEUE_DEPTH = Gauge("bot_update_queue_depth", "Updates waiting to be processed")
+WEBHOOK_REJECTED = Counter(
+    "bot_webhook_rejected_total", "Webhook deliveries refused because the update queue was full",
+)
+USER_CACHE = Gauge(
+    "bot_user_cache", "User cache counters and size", ("stat",), fn=lambda: Database.cache_stats(),
+)
+MONGO_POOL = Gauge(
+    "mongo_pool", "Mongo connection pool statistics", ("stat",),
+    fn=lambda: MongoConnection.pool_stats(),
+)
+
+
+class BotEndpoints:
+    """
+    The routes served on the bot's port: Telegram webhook, liveness,
+    readiness and metrics.
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.ready = False
+        UPDATE_QUEUE_DEPTH.fn = lambda: application.update_queue.qsize()
+
+    async def webhook(self, request):
+        token = request.headers.get("x-telegram-bot-api-secret-token", "")
+        if not hmac.compare_digest(token, Config.WEBHOOK_SECRET):
+            raise HttpError(403)
+        try:
+            payload = json.loads(request.body)
+            # de_json fails oddly on malformed objects and returns None for {}
+            update = Update.de_json(payload, self.application.bot) if isinstance(payload, dict) else None
+        except (ValueError, TypeError, KeyError, AttributeError):
+            update = None
+        if update is None:
+            raise HttpError(400, "Invalid update payload")
+        try:
+            self.application.update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Non-2xx makes Telegram redeliver later instead of dropping the update
+            WEBHOOK_REJECTED.inc()
+            return Response(503, b"Busy", headers={"Retry-After": "1"})
+        return Response(200, b"OK")
+
+    async def liveness(self, request):
+        # Answering at all proves the event loop is not stuck
+        return Response(200, b"OK")
+
+    async def readiness(self, request):
+        if not self.ready or not self.application.running:
+            return Response(503, b"Not ready")
+        return Response(200, b"OK")
+
+    async def metrics(self, request):
+        return Response(
+            200, REGISTRY.render().encode(),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
+
+
+def build_http_server(application):
+    """
+    HTTP server with the bot's routes registered; the webhook route is only
+    added when WEBHOOK_URL is configured.
+
+    Returns:
+        tuple: (HttpServer, BotEndpoints)
+    """
+    endpoints = BotEndpoints(application)
+    server = HttpServer(max_body=Config.WEBHOOK_MAX_BODY)
+    server.route("GET", "/healthz", endpoints.liveness)
+    server.route("GET", "/readyz", endpoints.readiness)
+    server.route("GET", "/metrics", endpoints.metrics)
+    if Config.WEBHOOK_URL:
+        server.route("POST", Config.WEBHOOK_PATH, endpoints.webhook)
+        logging.info(f"🔗 Webhook route {Config.WEBHOOK_PATH} enabled")
+    return server, endpoints
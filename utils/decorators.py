@@ -1,5 +1,6 @@
 from functools import wraps
-from config import ADMIN_IDS
+from config import Config
+from utils.user_context import get_user_context
 
 def admin_only(handler_func):
     """
@@ -7,9 +8,8 @@ def admin_only(handler_func):
     """
     @wraps(handler_func)
     async def wrapper(update, context, *args, **kwargs):
-        user = getattr(update, "effective_user", None)
-        user_id = getattr(user, "id", None)
-        if user_id not in ADMIN_IDS:
+        user_ctx = await get_user_context(update, context, load=False)
+        if user_ctx.user_id not in Config.ADMIN_IDS:
             # Handle both message and callback_query cases
             if hasattr(update, "message") and update.message:
                 await update.message.reply_text("❌ You are not authorized to use this command.")
@@ -22,17 +22,13 @@ def admin_only(handler_func):
 def premium_required(handler_func):
     """
     Decorator to restrict a command to premium users only.
-    Assumes 'is_premium' is stored in the user's DB document.
+    Assumes 'is_premium' is stored in the user's DB document, which is read
+    from the per-update user context rather than fetched again.
     """
     @wraps(handler_func)
     async def wrapper(update, context, *args, **kwargs):
-        user = getattr(update, "effective_user", None)
-        user_id = getattr(user, "id", None)
-        db = context.bot_data.get('db_client')
-        user_doc = None
-        if db:
-            user_doc = db.users.find_one({"user_id": user_id})
-        if not user_doc or not user_doc.get("is_premium", False):
+        user_ctx = await get_user_context(update, context)
+        if not user_ctx.get("is_premium", False):
             if hasattr(update, "message") and update.message:
                 await update.message.reply_text("🔒 This feature is for premium users only.")
             elif hasattr(update, "callback_query") and update.callback_query:
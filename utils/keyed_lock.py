@@ -0,0 +1,58 @@
+# utils/keyed_lock.py
+
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class _Entry:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0  # holders plus waiters
+
+
+class KeyedLock:
+    """
+    One asyncio.Lock per key, created on demand and dropped once idle.
+
+    Keys are spread over a fixed number of shards so the table never holds
+    one huge dict that has to grow (and rehash) with the number of users;
+    an entry lives only while a task holds or waits for it, so memory tracks
+    in-flight work rather than everyone who ever sent an update.
+    asyncio.Lock wakes waiters FIFO, so tasks for the same key run in the
+    order they asked for the lock.
+    """
+
+    def __init__(self, shards=64):
+        self._shards = [{} for _ in range(shards)]
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    def users(self, key):
+        """Tasks holding or waiting for the key's lock."""
+        entry = self._shard(key).get(key)
+        return entry.users if entry is not None else 0
+
+    def locked(self, key):
+        entry = self._shard(key).get(key)
+        return entry is not None and entry.lock.locked()
+
+    @asynccontextmanager
+    async def hold(self, key):
+        shard = self._shard(key)
+        entry = shard.get(key)
+        if entry is None:
+            entry = shard[key] = _Entry()
+        entry.users += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.users -= 1
+            if not entry.users:
+                del shard[key]
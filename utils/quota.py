@@ -0,0 +1,53 @@
+# utils/quota.py
+
+import time
+from datetime import datetime
+
+# Quotas are never reset by a write. Tokens belong to the grant that set
+# token_expiry (an integer Unix timestamp) and the daily view counter is
+# stored as {"day": <UTC day number>, "views": n}; once its expiry or day
+# has passed, a counter simply reads as zero. The next write for the user
+# starts a fresh one, and the compactor tidies up users who never return.
+
+DAY_SECONDS = 86400
+
+
+def now():
+    return int(time.time())
+
+
+def today(ts=None):
+    """UTC day number (days since the Unix epoch)."""
+    return (now() if ts is None else int(ts)) // DAY_SECONDS
+
+
+def expiry_timestamp(value):
+    """
+    token_expiry as an integer timestamp. Documents written before the
+    switch hold a local-time ISO string; those are parsed here until the
+    compactor has rewritten them.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return int(datetime.fromisoformat(value).timestamp())
+    return int(value)
+
+
+def tokens_left(user, ts=None):
+    """Token balance, or 0 once the grant has expired."""
+    if expiry_timestamp(user.get("token_expiry")) <= (now() if ts is None else ts):
+        return 0
+    return max(0, user.get("tokens", 0))
+
+
+def views_today(user, day=None):
+    limits = user.get("limits") or {}
+    return limits.get("views", 0) if limits.get("day") == (today() if day is None else day) else 0
+
+
+def add_views(doc, count=1, day=None):
+    """Count views against today's limit in a local document."""
+    day = today() if day is None else day
+    doc["limits"] = {"day": day, "views": views_today(doc, day) + count}
+    return doc["limits"]
@@ -0,0 +1,50 @@
+# utils/rate_limit.py
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, holding at most
+    `capacity`. Time is passed in rather than read, so one clock reading
+    can drive many buckets and the scheduler stays deterministic.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = now
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now):
+        """Seconds until a token is available (0 if one is available now)."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        """Consume one token; the caller checked delay() first."""
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, now, seconds):
+        """Hand out nothing for `seconds` and restart empty afterwards."""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0.0
+        self.updated = self.blocked_until
+
+    def idle(self, now):
+        """True once the bucket has refilled completely, i.e. it can be dropped."""
+        if now < self.blocked_until:
+            return False
+        self._refill(now)
+        return self.tokens >= self.capacity
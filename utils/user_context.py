@@ -0,0 +1,160 @@
+# utils/user_context.py
+
+from functools import wraps
+from config import Config
+from db.database import Database
+from utils.quota import add_views
+
+
+class UserContext:
+    """
+    The user document for a single Telegram update.
+
+    Loaded once and cached on the CallbackContext so decorators and handlers
+    share it. Changes are staged with set/inc/push and written back in one
+    update_one by commit() when the update is done, together with any
+    seen-set bits staged with mark_seen. Views staged with record_view are
+    handed to the database's coalescing view buffer instead.
+    """
+
+    def __init__(self, user_id, doc=None):
+        self.user_id = user_id
+        self.doc = doc
+        self.loaded = doc is not None
+        self._set = {}
+        self._inc = {}
+        self._push = {}
+        self._caps = {}
+        self._seen = {}
+        self._views = []
+
+    async def load(self):
+        """Fetch the user document once; later calls are no-ops."""
+        if not self.loaded:
+            if self.user_id is not None:
+                self.doc = await Database.get_user(self.user_id)
+            self.loaded = True
+        return self
+
+    @property
+    def exists(self):
+        return self.doc is not None
+
+    @property
+    def dirty(self):
+        return bool(self._set or self._inc or self._push or self._seen or self._views)
+
+    def get(self, key, default=None):
+        if self.doc is None:
+            return default
+        return self.doc.get(key, default)
+
+    def __getitem__(self, key):
+        return self.doc[key]
+
+    def create(self, doc):
+        """Start a new user document; it is inserted on commit."""
+        self.doc = dict(doc)
+        self._set.update(doc)
+
+    def set(self, **fields):
+        for field, value in fields.items():
+            self.doc[field] = value
+            self._inc.pop(field, None)
+            self._set[field] = value
+
+    def inc(self, field, amount=1):
+        self.doc[field] = self.doc.get(field, 0) + amount
+        if field in self._set:
+            self._set[field] = self.doc[field]
+        else:
+            self._inc[field] = self._inc.get(field, 0) + amount
+
+    def push(self, field, value, cap=None):
+        """Append to a list field, keeping only the last `cap` items if given."""
+        items = self.doc.setdefault(field, [])
+        items.append(value)
+        if cap:
+            self.doc[field] = items = items[-cap:]
+        if field in self._set:
+            self._set[field] = items
+        else:
+            self._push.setdefault(field, []).append(value)
+            if cap:
+                self._caps[field] = cap
+
+    def mark_seen(self, category, idx):
+        if idx is not None:
+            self._seen.setdefault(category, set()).add(idx)
+
+    def record_view(self, category, video):
+        """Spend a token (never below zero), count the view and log it as viewed."""
+        self.doc["tokens"] = max(0, self.doc.get("tokens", 0) - 1)
+        add_views(self.doc)
+        self.doc["viewed_videos"] = (self.doc.get("viewed_videos", []) + [video["file_id"]])[-Config.HISTORY_SIZE:]
+        self._views.append((category, video))
+
+    def build_update(self):
+        update = {}
+        if self._set:
+            update["$set"] = dict(self._set)
+        if self._inc:
+            update["$inc"] = dict(self._inc)
+        if self._push:
+            update["$push"] = {}
+            for field, values in self._push.items():
+                update["$push"][field] = {"$each": values}
+                if field in self._caps:
+                    update["$push"][field]["$slice"] = -self._caps[field]
+        return update
+
+    async def commit(self):
+        """Write all staged changes back in a single update."""
+        if not self.dirty:
+            return
+        update = self.build_update()
+        seen, views = self._seen, self._views
+        self._set, self._inc, self._push, self._caps, self._seen = {}, {}, {}, {}, {}
+        self._views = []
+        if update:
+            await Database.update_user(self.user_id, update)
+        for category, indexes in seen.items():
+            await Database.mark_seen(self.user_id, category, indexes)
+        for category, video in views:
+            Database.record_view(self.user_id, category, video, self.doc.get("limits"))
+
+
+async def get_user_context(update, context, load=True):
+    """
+    Return the UserContext for this update, creating it on first use.
+
+    With load=False only the user id is resolved, for callers such as
+    admin_only that never look at the document.
+    """
+    user_ctx = getattr(context, "user_ctx", None)
+    if user_ctx is None:
+        user = getattr(update, "effective_user", None)
+        user_ctx = UserContext(getattr(user, "id", None))
+        context.user_ctx = user_ctx
+    if load:
+        await user_ctx.load()
+    return user_ctx
+
+
+def with_user_context(handler_func):
+    """
+    Decorator that sets up the user context for the handler and commits
+    its staged changes once the handler returns. The document itself is
+    loaded on the first get_user_context call, so a handler can reject an
+    update before touching Mongo.
+    """
+    @wraps(handler_func)
+    async def wrapper(update, context, *args, **kwargs):
+        owner = getattr(context, "user_ctx", None) is None
+        user_ctx = await get_user_context(update, context, load=False)
+        try:
+            return await handler_func(update, context, *args, **kwargs)
+        finally:
+            if owner:
+                await user_ctx.commit()
+    return wrapper